@@ -0,0 +1,220 @@
+from __future__ import annotations
+import glob
+import io
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext, redirect_stdout
+from cache import CompileCache
+from main import OUTPUT_NAMES, compile_program
+from parser import SLRParserTable
+
+# A batch given with one of these is a glob pattern, not a path
+GLOB_CHARACTERS = "*?["
+
+# Field of each of OUTPUT_NAMES in a JSONL record
+JSONL_FIELDS = ("lexer", "parser", "typing", "evaluation")
+
+# Programs submitted to the workers ahead of the one being written, per worker
+WINDOW_PER_WORKER = 4
+
+
+def iter_programs(spec: str) -> Iterator[tuple[str, bytes]]:
+    """
+    The programs of a batch in a stable order, as (name, source bytes):
+    - a directory: every file under it, sorted, named by its path inside it;
+    - a glob pattern ('**' included): every file it matches, sorted, named
+      by its path under the deepest directory they all are in;
+    - a file: one program per record, NUL-separated if the file has a NUL
+      byte, one per line otherwise; named '<file name>.<record number>',
+      blank records skipped.
+    """
+    if os.path.isdir(spec):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(spec) for name in names)
+        base = spec
+    elif any(character in spec for character in GLOB_CHARACTERS):
+        paths = sorted(path for path in glob.glob(spec, recursive=True) if os.path.isfile(path))
+        base = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths]) if paths else ""
+    else:
+        with open(spec, "rb") as f:
+            data = f.read()
+        separator = b"\0" if b"\0" in data else b"\n"
+        stem = os.path.basename(spec)
+        for number, source in enumerate(data.split(separator), 1):
+            if source.strip():
+                yield f"{stem}.{number}", source
+        return
+    for path in paths:
+        with open(path, "rb") as f:
+            source = f.read()
+        yield os.path.relpath(os.path.abspath(path), os.path.abspath(base)), source
+
+
+def compile_source(source: bytes, table, jobs: int = 1, universe: str = None, first: int = 10,
+                   names: tuple = OUTPUT_NAMES, cache: CompileCache = None, lazy: bool = False) -> dict[str, str]:
+    """
+    compile_program() of main.py on a source in memory. An exception it
+    raises (a RecursionError, say) is kept as the program's result, so one
+    program cannot stop a batch.
+    :param names: the outputs to produce, of OUTPUT_NAMES.
+    :param cache: where to look the result up first; a hit does not run the
+                  lexer or the parser at all, a miss compiles every output
+                  and stores them.
+    :return: the text of each output by name, what the phases printed as
+             "stdout", and as "status" the phase the program failed in (see
+             main.PHASES), "ok", or "crash: <exception>". With a cache,
+             "cache" tells where the result came from: "memory", "disk" or
+             "miss".
+    """
+    if cache is not None:
+        key = cache.key(source, universe, first, lazy)
+        result = cache.get(key)
+        if result is None:
+            result = compile_source(source, table, jobs, universe, first, lazy=lazy)
+            cache.put(key, result)
+            result["cache"] = "miss"
+        return {field: result[field] for field in (*names, "stdout", "status", "cache")}
+    outputs = {name: io.StringIO() for name in names}
+    printed = io.StringIO()
+    with redirect_stdout(printed):
+        try:
+            status = compile_program(io.BytesIO(source), table, lambda name: nullcontext(outputs[name]),
+                                     jobs, universe, first, names, lazy)
+        except Exception as e:
+            status = f"crash: {type(e).__name__}: {e}"
+    result = {name: buffer.getvalue() for name, buffer in outputs.items()}
+    result["stdout"] = printed.getvalue()
+    result["status"] = status
+    return result
+
+
+# Table and cache of a worker process, set up once by _start_worker()
+_table = None
+_cache = None
+
+
+def _start_worker(table_path: str, grammar_path: str, cached: bool = False, cache_directory: str = None):
+    global _table, _cache
+    _table = SLRParserTable.load(table_path, grammar_path)
+    _cache = CompileCache(cache_directory, (table_path, grammar_path)) if cached else None
+
+
+def _compile_in_worker(source: bytes, universe: str, first: int, lazy: bool) -> dict[str, str]:
+    return compile_source(source, _table, 1, universe, first, cache=_cache, lazy=lazy)
+
+
+def cache_summary(outcomes: Counter) -> str:
+    """
+    The hits and misses of the results compile_source() returned with a
+    cache, counted by their "cache".
+    """
+    return f"{outcomes['memory']} memory hits, {outcomes['disk']} disk hits, {outcomes['miss']} misses"
+
+
+def json_record(head: dict, result: dict[str, str], raw: bool = False) -> str:
+    """
+    A result as one line of JSON: the items of head, "status", "stdout" and
+    each output it has under its JSONL_FIELDS name, as a JSON value, or with
+    raw as the text of the file, a string.
+    """
+    items = [(key, json.dumps(value, ensure_ascii=False)) for key, value in head.items()]
+    items += [(key, json.dumps(result[key], ensure_ascii=False)) for key in ("status", "stdout")]
+    for field, name in zip(JSONL_FIELDS, OUTPUT_NAMES):
+        if name in result:
+            # the outputs only have line breaks between tokens, a string escapes its own
+            items.append((field, json.dumps(result[name], ensure_ascii=False) if raw else result[name].replace("\n", "")))
+    return "{" + ", ".join(f'"{key}": {value}' for key, value in items) + "}"
+
+
+class DirectoryOutput:
+    """
+    Batch results as files: <directory>/<program name>/ holds the four
+    output files, as main.py writes them, stdout.txt and status.txt.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def write(self, name: str, result: dict[str, str]):
+        folder = os.path.join(self.directory, name)
+        os.makedirs(folder, exist_ok=True)
+        files = [(file_name, file_name) for file_name in OUTPUT_NAMES] + [("stdout.txt", "stdout"), ("status.txt", "status")]
+        for file_name, key in files:
+            with open(os.path.join(folder, file_name), "w", encoding="utf-8") as f:
+                f.write(result[key])
+
+    def close(self):
+        pass
+
+
+class JsonlOutput:
+    """
+    Batch results as one JSON object per line: {"name", "status", "stdout",
+    "lexer", "parser", "typing", "evaluation"}, the outputs as JSON values.
+    """
+
+    def __init__(self, path: str):
+        self.file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+    def write(self, name: str, result: dict[str, str]):
+        self.file.write(json_record({"name": name}, result) + "\n")
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def run_batch(spec: str, table, output, jobs: int = 1, universe: str = None, first: int = 10,
+              workers: int = 1, table_paths: tuple[str, str] = None, cache: CompileCache = None,
+              lazy: bool = False) -> Counter:
+    """
+    Compile every program of a batch and hand each result to output (a
+    DirectoryOutput or JsonlOutput) in input order, as soon as it and the
+    programs before it are done.
+    :param table: the loaded table, for workers <= 1.
+    :param workers: above 1, the programs are compiled on that many
+                    processes, each loading the table from table_paths once;
+                    at most WINDOW_PER_WORKER programs per worker are read
+                    and in flight at a time, so memory stays bounded however
+                    long the batch. Evaluation then runs with jobs = 1.
+    :param cache: the cache to compile through; each worker opens its own on
+                  the same directory, with its own in-process layer.
+    :return: the number of programs by status.
+    """
+    start = time.perf_counter()
+    statuses, outcomes = Counter(), Counter()
+
+    def emit(name: str, result: dict[str, str]):
+        output.write(name, result)
+        statuses[result["status"].split(":", 1)[0]] += 1
+        outcomes[result.get("cache")] += 1
+
+    try:
+        if workers <= 1:
+            for name, source in iter_programs(spec):
+                emit(name, compile_source(source, table, jobs, universe, first, cache=cache, lazy=lazy))
+        else:
+            cache_options = (cache is not None, cache.directory if cache is not None else None)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                                     initargs=(*table_paths, *cache_options)) as pool:
+                window = deque()
+                for name, source in iter_programs(spec):
+                    window.append((name, pool.submit(_compile_in_worker, source, universe, first, lazy)))
+                    if len(window) >= workers * WINDOW_PER_WORKER:
+                        name, future = window.popleft()
+                        emit(name, future.result())
+                while window:
+                    name, future = window.popleft()
+                    emit(name, future.result())
+    finally:
+        output.close()
+    counts = ", ".join(f"{status} {count}" for status, count in sorted(statuses.items()))
+    print(f"Batch: {sum(statuses.values())} programs in {time.perf_counter() - start:.2f} s ({counts})",
+          file=sys.stderr)
+    if cache is not None:
+        print(f"Cache: {cache_summary(outcomes)}", file=sys.stderr)
+    return statuses
@@ -0,0 +1,1002 @@
+from __future__ import annotations
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from lexer import FileLexer, Lexer, Token, paused_gc
+from parser import Parser, SLRParserTable, SHIFT, REDUCE, ACCEPT
+# 'D' -> D D'' is right recursive, so tree depth grows with the declaration count
+sys.setrecursionlimit(100000)
+
+# Usage: python benchmark.py [name ...]
+# Runs every benchmark when no name is given.
+
+TABLE_PATH = 'SLR Parsing Table.csv'
+GRAMMAR_PATH = 'SLR Grammar.txt'
+
+
+def identifier(i: int) -> str:
+    """
+    Map an index to a lowercase-only identifier (a, b, ..., z, ba, bb, ...).
+    Keywords are prefixed with 'v' so every index stays a valid 'id'.
+    """
+    name = ""
+    while True:
+        name = chr(ord('a') + i % 26) + name
+        i //= 26
+        if i == 0:
+            return "v" + name if name in Lexer.KEYWORDS else name
+
+
+def generate_program(n_declarations: int) -> str:
+    """
+    Generate a well-typed program with a long chain of 'let' declarations,
+    alternating integer arithmetic and set-builder literals.
+    """
+    lines = []
+    for i in range(n_declarations):
+        if i % 2 == 0:
+            lines.append(f"let int {identifier(i)} be ( {i} + {i % 7} ) * 3 - 1 .")
+        else:
+            lines.append(f"let set {identifier(i)} be {{ a : a > {i} & a < {i + 10} | ( a = 3 ) }} .")
+    lines.append(f"show {identifier(0)} @ {identifier(1)} .")
+    return "\n".join(lines)
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    """
+    Run fn repeat times with stdout silenced and return the fastest wall time.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def load_tokens(source_code: str) -> list[Token]:
+    with redirect_stdout(io.StringIO()):
+        tokens, _ = Lexer(source_code).tokenize()
+    tokens.append(Token(token_type="$", lexeme="$", value="$"))
+    return tokens
+
+
+def replay(tokens: list[Token], parser: Parser, attribute: str = None):
+    """
+    One LR pass of the three-pass driver fused analysis replaced: a replay
+    of the whole token list building a tree of dictionaries, the parse tree
+    or, for attribute "type" / "value", with the parser's typing or
+    evaluation rule applied at each reduction. Kept here, frozen, as the
+    reference of bench_fused() and bench_arena().
+    """
+    actions, goto, width, reductions, names = (parser.actions, parser.goto, parser.width, parser.reductions,
+                                               parser.symbol_names)
+    stack, index = [(0, None)], 0
+    while True:
+        token = tokens[index]
+        code = actions[stack[-1][0] * width + token.symbol]
+        kind, value = code & 3, code >> 2
+        if kind == SHIFT:
+            node = {"token": token.token_type, "lexeme": token.lexeme}
+            if attribute == "type":
+                node["type"] = "integer" if token.token_type == "num" else "void"
+            elif attribute == "value":
+                node["value"], node["bool"] = int(token.lexeme) if token.token_type == "num" else "void", None
+            stack.append((value, node))
+            index += 1
+        elif kind == REDUCE:
+            lhs, length, typing_rule, evaluation_rule, _ = reductions[value]
+            children = [child for _, child in stack[len(stack) - length:]]
+            del stack[len(stack) - length:]
+            node = {"name": names[lhs]}
+            if attribute == "type":
+                node["type"] = typing_rule(*children)
+            elif attribute == "value":
+                result, bool_value = evaluation_rule(*children), None
+                if isinstance(result, tuple):
+                    result, bool_value = result
+                node["value"], node["bool"] = result, bool_value if isinstance(bool_value, bool) else "undefined"
+            node["children"] = children
+            stack.append((goto[stack[-1][0] * width + lhs], node))
+        elif kind == ACCEPT:
+            return stack[-1][1]
+        else:
+            raise ValueError("Syntax Error!")
+
+
+def three_pass(tokens: list[Token], table: SLRParserTable) -> tuple:
+    """
+    The parse, typing and evaluation trees of a well-formed program by three
+    replay() passes, sharing one symbol table as the three-pass driver did.
+    """
+    parser = Parser(tokens, table)
+    return replay(tokens, parser), replay(tokens, parser, "type"), replay(tokens, parser, "value")
+
+
+def bench_fused(n_declarations: int = 1000, json_declarations: int = 200):
+    """
+    Three LR replays of three_pass() against the one fused build_tree() that
+    main.py runs, then both with their JSON outputs as main.py writes them:
+    a json.dump() of each dictionary tree, which nests one generator per tree
+    level so it is quadratic in the depth (hence the smaller program and a
+    single run), against write_json() of the arena's three views.
+    """
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    tokens = load_tokens(generate_program(n_declarations))
+    slow = best_of(lambda: three_pass(tokens, table))
+    fast = best_of(lambda: Parser(tokens, table).build_tree())
+    print(f"[fused] {len(tokens)} tokens: three-pass {slow * 1000:.1f} ms, "
+          f"build_tree {fast * 1000:.1f} ms, speedup {slow / fast:.2f}x")
+    tokens = load_tokens(generate_program(json_declarations))
+
+    def three_pass_and_json():
+        for tree in three_pass(tokens, table):
+            json.dump(tree, io.StringIO(), ensure_ascii=False, indent=0, default=str)
+
+    def fused_and_json():
+        tree = Parser(tokens, table).build_tree()
+        for view in ("parse", "typing", "evaluation"):
+            tree.write_json(io.StringIO(), view)
+
+    slow, fast = best_of(three_pass_and_json, 1), best_of(fused_and_json)
+    print(f"[fused] {len(tokens)} tokens with the JSON outputs: three-pass {slow * 1000:.0f} ms, "
+          f"build_tree {fast * 1000:.1f} ms, speedup {slow / fast:.0f}x")
+
+
+def bench_cold_start(repeat: int = 20):
+    """
+    Table construction from the CSV and grammar files against the compiled
+    artifact, both in-process and with a fresh interpreter per run.
+    """
+    SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)  # make sure the artifact exists
+    csv = best_of(lambda: SLRParserTable(TABLE_PATH, GRAMMAR_PATH), repeat)
+    compiled = best_of(lambda: SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH), repeat)
+    print(f"[cold-start] in-process: csv {csv * 1000:.2f} ms, compiled {compiled * 1000:.2f} ms, "
+          f"speedup {csv / compiled:.2f}x")
+    for label, call in (("csv", f"SLRParserTable({TABLE_PATH!r}, {GRAMMAR_PATH!r})"),
+                        ("compiled", f"SLRParserTable.load({TABLE_PATH!r}, {GRAMMAR_PATH!r})")):
+        command = [sys.executable, "-c", f"from parser import SLRParserTable; {call}"]
+        elapsed = best_of(lambda: subprocess.run(command, check=True), repeat)
+        print(f"[cold-start] fresh interpreter + {label} table: {elapsed * 1000:.1f} ms")
+
+
+def recognize_keyed(tokens: list[Token], action: dict, goto: dict, rules: dict) -> int:
+    """
+    Bare LR loop over the old (state, token_type)-keyed dictionaries.
+    """
+    stack, index = [0], 0
+    while True:
+        act, value = action.get((stack[-1], tokens[index].token_type), (None, None))
+        if act == "s":
+            stack.append(value)
+            index += 1
+        elif act == "r":
+            lhs, length = rules[value]
+            del stack[len(stack) - length:]
+            stack.append(goto[(stack[-1], lhs)])
+        elif act == "acc":
+            return index
+        else:
+            raise ValueError("Syntax Error!")
+
+
+def recognize_dense(tokens: list[Token], table: SLRParserTable) -> int:
+    """
+    Bare LR loop over the dense integer-coded arrays.
+    """
+    action, goto, width = table.ACTION, table.GOTO, table.n_symbols
+    rules = {number: (rule['symbol'], rule['length']) for number, rule in table.grammar.items()}
+    stack, index = [0], 0
+    while True:
+        code = action[stack[-1] * width + tokens[index].symbol]
+        kind = code & 3
+        if kind == SHIFT:
+            stack.append(code >> 2)
+            index += 1
+        elif kind == REDUCE:
+            lhs, length = rules[code >> 2]
+            del stack[len(stack) - length:]
+            stack.append(goto[stack[-1] * width + lhs])
+        elif kind == ACCEPT:
+            return index
+        else:
+            raise ValueError("Syntax Error!")
+
+
+def bench_lr_loop(n_declarations: int = 5000):
+    """
+    Tokens/sec through the bare shift/reduce loop: tuple-keyed dictionaries
+    against the dense ACTION/GOTO arrays.
+    """
+    tokens = load_tokens(generate_program(n_declarations))
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    terminals = {symbol: name for name, symbol in table.symbol_ids.items()}
+    keyed_action, keyed_goto = {}, {}
+    for index, code in enumerate(table.ACTION):
+        state, symbol = divmod(index, table.n_symbols)
+        if code:
+            kind = code & 3
+            keyed_action[(state, terminals[symbol])] = (
+                ("acc", None) if kind == ACCEPT else ("s" if kind == SHIFT else "r", code >> 2))
+    for index, next_state in enumerate(table.GOTO):
+        if next_state >= 0:
+            state, symbol = divmod(index, table.n_symbols)
+            keyed_goto[(state, terminals[symbol])] = next_state
+    keyed_rules = {number: (rule['non-terminal'], rule['length']) for number, rule in table.grammar.items()}
+
+    keyed = best_of(lambda: recognize_keyed(tokens, keyed_action, keyed_goto, keyed_rules))
+    dense = best_of(lambda: recognize_dense(tokens, table))
+    print(f"[lr-loop] {len(tokens)} tokens: keyed {len(tokens) / keyed / 1e6:.2f} M tokens/s, "
+          f"dense {len(tokens) / dense / 1e6:.2f} M tokens/s, speedup {keyed / dense:.2f}x")
+
+
+def bench_table_builder(levels: tuple = (10, 40, 160)):
+    """
+    SLR table generation time for 'SLR Grammar.txt' and for synthetic
+    precedence-climbing grammars with a growing number of operator levels.
+    """
+    from slr_builder import SLRTableBuilder, read_productions
+    productions = read_productions(GRAMMAR_PATH)
+    elapsed = best_of(lambda: SLRTableBuilder(productions), 3)
+    print(f"[table-builder] {GRAMMAR_PATH}: {len(productions)} productions in {elapsed * 1000:.1f} ms")
+    for n in levels:
+        productions = [("S'", ("S",)), ("S", ("e0",))]
+        for level in range(n):
+            here, below = f"e{level}", f"e{level + 1}"
+            productions += [(here, (here, f"op{level}", below)), (here, (below,))]
+        productions += [(f"e{n}", ("num",)), (f"e{n}", ("(", "e0", ")"))]
+        builder = SLRTableBuilder(productions)
+        elapsed = best_of(lambda: SLRTableBuilder(productions), 3)
+        print(f"[table-builder] {n} precedence levels: {len(productions)} productions, "
+              f"{len(builder.states)} states in {elapsed * 1000:.1f} ms")
+
+
+def bench_lexer(n_declarations: int = 50000):
+    """
+    Character-by-character scanning against the master-regex scanner on a
+    multi-megabyte program.
+    """
+    source_code = generate_program(n_declarations)
+    with paused_gc():  # as in Lexer.tokenize()
+        by_char = best_of(lambda: Lexer(source_code)._scan_by_char(), 3)
+        regex = best_of(lambda: Lexer(source_code)._scan(), 3)
+        match_only = best_of(lambda: Lexer.TOKEN_PATTERN.findall(source_code), 3)
+    size = len(source_code) / 1e6
+    print(f"[lexer] {size:.1f} MB: per-character {size / by_char:.2f} MB/s, "
+          f"regex {size / regex:.2f} MB/s, speedup {by_char / regex:.2f}x")
+    print(f"[lexer] regex matching alone (no Token objects): {size / match_only:.2f} MB/s")
+
+
+class DictToken:
+    """
+    The token layout before __slots__: a plain class with a per-instance __dict__.
+    """
+    def __init__(self, token_type: str, lexeme: str, value=None, symbol=None):
+        self.token_type = token_type
+        self.lexeme = lexeme
+        self.value = value
+        self.symbol = symbol
+
+
+def traced_memory(build) -> tuple[float, float, object]:
+    """
+    :return: (MB still allocated after build() returns, peak MB while it ran, its result)
+    """
+    import tracemalloc
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / 1e6, peak / 1e6, result
+
+
+def bench_token_memory(n_declarations: int = 50000):
+    """
+    Memory held by the token list with __dict__ tokens, with __slots__ tokens
+    and as a columnar TokenStream.
+    """
+    source_code = generate_program(n_declarations)
+
+    def dict_tokens():
+        with redirect_stdout(io.StringIO()):
+            tokens, _ = Lexer(source_code).tokenize()
+        return [DictToken(t.token_type, t.lexeme, t.value, t.symbol) for t in tokens]
+
+    def slot_tokens():
+        with redirect_stdout(io.StringIO()):
+            return Lexer(source_code).tokenize()[0]
+
+    def columns():
+        with redirect_stdout(io.StringIO()):
+            return Lexer(source_code).tokenize_columns()[0]
+
+    for label, build in (("__dict__ tokens", dict_tokens), ("__slots__ tokens", slot_tokens),
+                         ("columnar stream", columns)):
+        current, peak, tokens = traced_memory(build)
+        # the __dict__ list is converted from a slotted one, so only its retained size is meaningful
+        peak_text = "" if build is dict_tokens else f", peak {peak:.1f} MB"
+        print(f"[token-memory] {len(tokens)} tokens as {label}: retained {current:.1f} MB "
+              f"({current * 1e6 / len(tokens):.0f} B/token){peak_text}")
+        del tokens
+
+
+def bench_file_input(repeats: tuple = (5, 20, 80), block_declarations: int = 2000):
+    """
+    Peak memory and time to stream every token of a growing program file:
+    reading it into one str first against FileLexer's chunked byte reads.
+    The file repeats one block of declarations, so the symbol table stays the
+    same size and only the input grows.
+    """
+    import tempfile
+
+    def count(tokens) -> int:
+        with redirect_stdout(io.StringIO()):
+            return sum(1 for _ in tokens)
+
+    def whole_string():
+        with open(path, 'r') as file:
+            return count(Lexer(file.read()).iter_tokens())
+
+    def chunked():
+        with open(path, 'rb') as file:
+            return count(FileLexer(file).iter_tokens())
+
+    block = generate_program(block_declarations) + "\n"
+    for repeat in repeats:
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as file:
+            for _ in range(repeat):
+                file.write(block)
+            path = file.name
+        try:
+            size = os.path.getsize(path) / 1e6
+            for label, scan in (("whole str", whole_string), ("chunked", chunked)):
+                _, peak, n_tokens = traced_memory(scan)
+                elapsed = best_of(scan, 1)
+                print(f"[file-input] {size:.1f} MB, {n_tokens} tokens, {label}: "
+                      f"peak {peak:.1f} MB, {size / elapsed:.2f} MB/s")
+        finally:
+            os.remove(path)
+
+
+def bench_arena(sizes: tuple = (1000, 4000)):
+    """
+    Peak memory and wall time on deep programs (the declaration list nests
+    one level per declaration): the dictionary trees of three_pass() against
+    one SyntaxTree arena from build_tree(), also counting the JSON writing of
+    its three views.
+    """
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+
+    def dict_trees():
+        return three_pass(tokens, table)
+
+    def arena():
+        with redirect_stdout(io.StringIO()):
+            return Parser(tokens, table).build_tree()
+
+    def arena_and_json():
+        tree = arena()
+        for view in ("parse", "typing", "evaluation"):
+            tree.write_json(io.StringIO(), view)
+        return tree
+
+    for n_declarations in sizes:
+        tokens = load_tokens(generate_program(n_declarations))
+        for label, build in (("dict trees", dict_trees), ("arena", arena), ("arena + json", arena_and_json)):
+            current, peak, result = traced_memory(build)
+            del result
+            elapsed = best_of(build, 3)
+            print(f"[arena] {n_declarations} declarations, {label}: retained {current:.1f} MB, "
+                  f"peak {peak:.1f} MB, {elapsed * 1000:.0f} ms")
+
+
+def grammar_heavy_programs(depth: int = 2000, terms: int = 2000) -> dict[str, str]:
+    """
+    Programs that are mostly reductions: deeply nested ( E ), a long P | P'
+    chain and nested ( P ) predicates.
+    """
+    return {
+        "nested ( E )": "show " + "( " * depth + "1" + " )" * depth + " .",
+        "P | P' chain": "show " + " | ".join(f"{i} < {i + 1}" for i in range(terms)) + " .",
+        "nested ( P )": "show " + "( " * depth + "1 < 2" + " )" * depth + " .",
+    }
+
+
+def reduce_keyed(tokens: list[Token], parser: Parser) -> int:
+    """
+    Typing + evaluation LR loop the old way: children popped one at a time with
+    insert(0, ...), and an "lhs:rhs" key built and looked up per reduction.
+    :return: number of reductions.
+    """
+    table = parser.rules
+    actions, goto, width = parser.actions, parser.goto, parser.width
+    stack, index, reductions = [(0, None)], 0, 0
+    while True:
+        code = actions[stack[-1][0] * width + tokens[index].symbol]
+        kind, value = code & 3, code >> 2
+        if kind == SHIFT:
+            token = tokens[index]
+            stack.append((value, {"lexeme": token.lexeme, "type": "void", "value": token.lexeme, "bool": None}))
+            index += 1
+        elif kind == REDUCE:
+            rule = table[value]
+            key = f"{rule['non-terminal']}:{rule['productions']}"
+            children = []
+            for _ in range(rule["length"]):
+                _, child = stack.pop()
+                children.insert(0, child)
+            node = {"type": parser.typing_rules[key](*children), "bool": None}
+            result = parser.new_evaluation_rules[key](*children)
+            node["value"], node["bool"] = result if isinstance(result, tuple) else (result, None)
+            stack.append((goto[stack[-1][0] * width + rule["symbol"]], node))
+            reductions += 1
+        else:
+            return reductions
+
+
+def reduce_records(tokens: list[Token], parser: Parser) -> int:
+    """
+    The same loop over Parser.reductions records: children from one slice of
+    the node stack, rules called directly.
+    :return: number of reductions.
+    """
+    records = parser.reductions
+    actions, goto, width = parser.actions, parser.goto, parser.width
+    states, nodes, index, reductions = [0], [None], 0, 0
+    while True:
+        code = actions[states[-1] * width + tokens[index].symbol]
+        kind, value = code & 3, code >> 2
+        if kind == SHIFT:
+            token = tokens[index]
+            states.append(value)
+            nodes.append({"lexeme": token.lexeme, "type": "void", "value": token.lexeme, "bool": None})
+            index += 1
+        elif kind == REDUCE:
+            lhs, length, typing_rule, evaluation_rule, _ = records[value]
+            base = len(nodes) - length
+            children = nodes[base:]
+            del nodes[base:], states[base:]
+            node = {"type": typing_rule(*children), "bool": None}
+            result = evaluation_rule(*children)
+            node["value"], node["bool"] = result if isinstance(result, tuple) else (result, None)
+            states.append(goto[states[-1] * width + lhs])
+            nodes.append(node)
+            reductions += 1
+        else:
+            return reductions
+
+
+def bench_reductions():
+    """
+    Reductions/sec on grammar-heavy programs: rule keys built per reduction
+    against the precompiled per-production records, then the full build_tree().
+    """
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    for label, source_code in grammar_heavy_programs().items():
+        tokens = load_tokens(source_code)
+        parser = Parser(tokens, table)
+        with redirect_stdout(io.StringIO()):
+            reductions = reduce_records(tokens, parser)
+        keyed = best_of(lambda: reduce_keyed(tokens, parser))
+        records = best_of(lambda: reduce_records(tokens, parser))
+        fused = best_of(lambda: Parser(tokens, table).build_tree())
+        print(f"[reductions] {label}: {reductions} reductions, keyed {reductions / keyed / 1e3:.0f} k/s, "
+              f"records {reductions / records / 1e3:.0f} k/s ({keyed / records:.2f}x), "
+              f"build_tree {reductions / fused / 1e3:.0f} k/s")
+
+
+def bench_membership(n_terms: tuple = (1, 8, 64), elements: int = 2000, depth: int = 3000):
+    """
+    Cost of one 'x @ { a : P }' test: evaluate_predicate() rewriting and
+    eval()-ing the set text against the closure compiled from the P subtree.
+    A last literal chains depth relations, so compiling its P subtree must
+    not recurse once per level.
+    """
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    for n in n_terms:
+        terms = " | ".join(f"( a > {10 * i} & ! a = {10 * i + 5} )" for i in range(n))
+        tokens = load_tokens(f"let set s be {{ a : {terms} }} . show 1 @ s .")
+        parser = Parser(tokens, table)
+        with redirect_stdout(io.StringIO()):
+            parser.build_tree()
+        set_value = parser.symbol_table["s"]["value"]
+        texts = [str(i) for i in range(elements)]
+
+        def text_path():
+            for element in texts:
+                parser.evaluate_predicate(element, str(set_value))
+
+        def compiled():
+            for element in range(elements):
+                parser.is_member(element, set_value)
+
+        slow, fast = best_of(text_path, 3), best_of(compiled, 3)
+        print(f"[membership] {n} terms: text {slow / elements * 1e6:.1f} us/test, "
+              f"compiled {fast / elements * 1e6:.2f} us/test, speedup {slow / fast:.0f}x")
+    terms = " | ".join(f"a = {i}" for i in range(depth))
+    tokens = load_tokens(f"show {depth - 1} @ {{ a : {terms} }} .")
+    evaluate = best_of(lambda: Parser(tokens, table).build_tree(), 1)
+    print(f"[membership] {depth}-relation literal: evaluated in {evaluate * 1000:.1f} ms")
+
+
+def bench_interval_sets(sizes: tuple = (10, 30, 100)):
+    """
+    Set algebra on interval sets: a union of k set literals with k disjoint
+    ranges each, then an intersection, a complement and membership tests.
+    """
+    from interval import IntervalSet
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    for k in sizes:
+        literals = []
+        for i in range(k):
+            ranges = " | ".join(f"a > {1000 * j + 10 * i} & a < {1000 * j + 10 * i + 5}" for j in range(k))
+            literals.append(f"{{ a : {ranges} }}")
+        tokens = load_tokens(f"show 7 @ ( {' U '.join(literals)} ) .")
+        evaluate = best_of(lambda: Parser(tokens, table).build_tree(), 1)
+        parser = Parser(tokens, table)
+        with redirect_stdout(io.StringIO()):
+            tree = parser.build_tree()
+        # the union of the whole show expression, E inside the membership relation
+        union = next(value for value in tree.values if getattr(value, "intervals", None) is not None
+                     and len(value.intervals.bounds) == 2 * k * k)
+        intervals = union.intervals
+        shifted = IntervalSet(tuple(bound + 3 for bound in intervals.bounds))
+        merge = best_of(lambda: intervals & shifted, 3)
+        complement = best_of(lambda: ~intervals, 3)
+        probes = range(0, 1000 * k, 7)
+        member = best_of(lambda: [n in intervals for n in probes], 3)
+        print(f"[interval-sets] {k} literals x {k} ranges: evaluate {evaluate * 1000:.1f} ms, "
+              f"intersection {merge * 1000:.2f} ms, complement {complement * 1e6:.0f} us, "
+              f"membership {member / len(probes) * 1e6:.2f} us/test")
+
+
+def bench_simplify(sizes: tuple = (250, 1000, 4000)):
+    """
+    Normalization for simplify over predicates of n relations: overlapping
+    ranges in nested parentheses, negations, and a set referring to the bound
+    variable, so the whole predicate goes through the rewriting (a set of known
+    intervals only prints them). Time per relation stays flat as n grows.
+    """
+    from simplify import Simplifier
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    for n in sizes:
+        relations = ["a @ { b : b > a }"]
+        for i in range(1, n):
+            low = 7 * i % (2 * n)
+            relation = f"( a > {low} & a < {low + 9} & ! a = {low + 4} )" if i % 3 else f"a > {low} & a < {low + 5}"
+            relations.append(relation)
+        tokens = load_tokens(f"show {{ a : {' | '.join(relations)} }} .")
+        with redirect_stdout(io.StringIO()):
+            tree = Parser(tokens, table).build_tree()
+        value = tree.values[tree.root]
+        elapsed = best_of(lambda: Simplifier().simplify(value), 3)
+        print(f"[simplify] {n} relations: {elapsed * 1000:.1f} ms, {elapsed / n * 1e6:.1f} us/relation "
+              f"-> {len(Simplifier().simplify(value))} characters")
+
+
+def bench_doubling_chain(depths: tuple = (10, 20, 40)):
+    """
+    'let set b be a U a . let set c be b U b . ...': each declaration doubles
+    the text of the last set, which used to be copied into every value.
+    Evaluation keeps shared Expr nodes, so it is linear in the depth; the text
+    is only built for output (expanded here up to 2**20 copies).
+    """
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    for depth in depths:
+        names = [identifier(i) for i in range(depth + 1)]
+        lines = [f"let set {names[0]} be {{ x : x > 1 & x < 5 }} ."]
+        lines += [f"let set {names[i]} be {names[i - 1]} U {names[i - 1]} ." for i in range(1, depth + 1)]
+        lines.append(f"show 3 @ {names[depth]} .")
+        tokens = load_tokens("\n".join(lines))
+
+        def evaluate():
+            with redirect_stdout(io.StringIO()):
+                parser = Parser(tokens, table)
+                parser.build_tree()
+                return parser
+
+        _, peak, parser = traced_memory(evaluate)
+        elapsed = best_of(evaluate, 3)
+        length = len("{ x: (x > 1 & x < 5) }")
+        for _ in range(depth):
+            length = 2 * length + len(" U ")
+        report = (f"[doubling-chain] depth {depth}: evaluate {elapsed * 1000:.1f} ms, peak {peak:.2f} MB, "
+                  f"value text {length:,} characters")
+        if depth <= 20:
+            value = parser.symbol_table[names[depth]]["value"]
+            report += f", expanded in {best_of(lambda: str(value), 1) * 1000:.1f} ms"
+        print(report)
+
+
+def bench_repeated_literals(counts: tuple = (100, 400, 1600), relations: int = 40):
+    """
+    One set literal of many relations repeated in every declaration, next to
+    integer arithmetic: the literal's predicate compiled once per program
+    against once per occurrence (SetValue.interned() disabled, so every
+    literal is compiled before it is looked up, as it used to be).
+    """
+    from predicate import SetValue
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    predicate = " | ".join(f"a > {10 * i} & a < {10 * i + 5}" for i in range(relations))
+    for n in counts:
+        names = [f"v{identifier(i)}" for i in range(n)]
+        lines = [f"let int {names[0]} be 1 ."]
+        for i in range(1, n):
+            if i % 2:
+                lines.append(f"let set {names[i]} be {{ a : {predicate} }} .")
+            else:
+                lines.append(f"let int {names[i]} be {names[i - 2]} * 3 + {i} - 2 .")
+        lines.append(f"show 12 @ {names[n - 1]} .")
+        tokens = load_tokens("\n".join(lines))
+
+        def evaluate():
+            with redirect_stdout(io.StringIO()):
+                return Parser(tokens, table).build_tree()
+
+        hoisted = best_of(evaluate, 3)
+        interned = SetValue.interned
+        SetValue.interned = classmethod(lambda cls, pieces: None)
+        try:
+            per_literal = best_of(evaluate, 3)
+        finally:
+            SetValue.interned = interned
+        print(f"[repeated-literals] {n} declarations: compiled per literal {per_literal * 1000:.1f} ms, "
+              f"once {hoisted * 1000:.1f} ms ({per_literal / hoisted:.1f}x)")
+
+
+def bench_vm(n_declarations: int = 1000, terms: int = 2000):
+    """
+    Re-running a program: evaluating its tree with build_tree() against
+    running the bytecode compiled from it once, on the mixed declaration
+    chain of generate_program() and on a long arithmetic predicate. Every
+    declaration is run, see bench_dead_declarations() for pruning.
+    """
+    from bytecode import compile_tree
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    relations = " | ".join(f"( {i} + 3 ) * 2 - {i % 5} {'<>='[i % 3]} {2 * i}" for i in range(terms))
+    programs = {
+        f"{n_declarations} declarations": generate_program(n_declarations),
+        f"{terms} relations": f"show {relations} .",
+    }
+    for label, source_code in programs.items():
+        tokens = load_tokens(source_code)
+        parser = Parser(tokens, table)
+        with redirect_stdout(io.StringIO()):
+            tree = parser.build_tree()
+        program = compile_tree(tree, parser, prune=False)
+        evaluate = best_of(lambda: Parser(tokens, table).build_tree())
+        compile_time = best_of(lambda: compile_tree(tree, parser, prune=False))
+        run = best_of(program.run)
+        print(f"[vm] {label}: tree {evaluate * 1000:.1f} ms, compile {compile_time * 1000:.1f} ms, "
+              f"vm {run * 1000:.2f} ms ({len(program.code) // 2} instructions), speedup {evaluate / run:.1f}x")
+
+
+def bench_dead_declarations(counts: tuple = (100, 1000, 4000), used: int = 10):
+    """
+    Programs that declare many sets and show a union of a few of them:
+    every declaration evaluated (the tree, and the bytecode with prune=False)
+    against evaluating from the 'show' only what it depends on.
+    """
+    from bytecode import compile_tree
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    for n in counts:
+        names = [f"v{identifier(i)}" for i in range(n)]
+        lines = [f"let set {names[i]} be {{ a : a > {i} & a < {i + 20} | a = {3 * i} }} ." for i in range(n)]
+        lines.append(f"show 7 @ {' U '.join(names[::n // used])} .")
+        tokens = load_tokens("\n".join(lines))
+        parser = Parser(tokens, table)
+        with redirect_stdout(io.StringIO()):
+            tree = parser.build_tree()
+        eager, lazy = compile_tree(tree, parser, prune=False), compile_tree(tree, parser)
+        evaluate = best_of(lambda: Parser(tokens, table).build_tree(), 3)
+        every, reachable = best_of(eager.run), best_of(lazy.run)
+        print(f"[dead-declarations] {n} declarations: tree {evaluate * 1000:.1f} ms, vm {every * 1000:.2f} ms, "
+              f"pruned vm {reachable * 1000:.3f} ms ({every / reachable:.0f}x); "
+              f"evaluated {lazy.stats['evaluated']}, pruned {len(lazy.stats['pruned'])}")
+
+
+def bench_parallel(jobs: tuple = None, n_declarations: int = 400, terms: int = 60):
+    """
+    A program of independent set declarations with long predicates, built
+    with build_tree(jobs) for 1, 2, 4, ... processes up to the core count;
+    the parse is the same sequential pass every time, only the declarations'
+    evaluation is spread.
+    """
+    cores = os.cpu_count() or 1
+    jobs = jobs or tuple(sorted({1, 2, cores} | {1 << k for k in range(cores.bit_length())}))
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    predicate = " | ".join(f"a > {i} & a < {i + 7}" for i in range(terms))
+    lines = [f"let set {'v' + identifier(i)} be {{ a : {predicate} | a = {i} }} ." for i in range(n_declarations)]
+    lines.append("show 3 @ va .")
+    tokens = load_tokens("\n".join(lines))
+    base = None
+    for count in jobs:
+        elapsed = best_of(lambda: Parser(tokens, table).build_tree(count), 3)
+        base = base or elapsed
+        print(f"[parallel] {n_declarations} declarations, jobs {count}: {elapsed * 1000:.0f} ms "
+              f"({base / elapsed:.2f}x, {cores} cores)")
+
+
+def bench_materialize(terms: tuple = (10, 100, 1000), universe: int = 1 << 20, sample: int = 2000):
+    """
+    Enumerating the members of 'S I T U { ... }' in [0, universe): the
+    predicate text evaluated element by element (timed on a sample and
+    scaled), against the bitmaps of materialize() with cardinality, min, max
+    and the first 10 members. The variable 'for' keeps the literals from
+    compiling to intervals, so their predicates are evaluated over bitmaps.
+    """
+    from bitmap import materialize
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    for n in terms:
+        step = universe // n
+        for variable in ("x", "for"):
+            s = " | ".join(f"{variable} > {i * step} & {variable} < {i * step + step // 3}" for i in range(n))
+            t = " | ".join(f"{variable} > {i * step + step // 5} & {variable} < {(i + 1) * step}" for i in range(n))
+            tokens = load_tokens(f"let set s be {{ {variable} : {s} }} .\nlet set t be {{ {variable} : {t} }} .\n"
+                                 f"show s I t U {{ {variable} : {variable} = 7 }} .")
+            parser = Parser(tokens, table)
+            with redirect_stdout(io.StringIO()):
+                tree = parser.build_tree()
+            value = tree.values[tree.root]
+            members = materialize(value, 0, universe)
+            text = str(value.parts[1])
+            bulk = best_of(lambda: (lambda m: (len(m), m.min(), m.max(), m.first(10)))(materialize(value, 0, universe)), 3)
+            if variable == "for":  # the text cannot be evaluated, Python reads 'for' as a keyword
+                print(f"[materialize] {n} terms, '{variable}', {len(members)} of {universe} members: "
+                      f"bitmaps over the predicate {bulk * 1000:.1f} ms")
+                continue
+            elements = best_of(lambda: [parser.evaluate_predicate(x, text) for x in range(sample)], 1)
+            one_by_one = elements / sample * universe
+            print(f"[materialize] {n} terms, '{variable}', {len(members)} of {universe} members: "
+                  f"element by element ~{one_by_one:.0f} s, bitmaps {bulk * 1000:.1f} ms "
+                  f"({one_by_one / bulk:.0f}x)")
+
+
+def bench_batch(n_programs: int = 400, processes: int = 20):
+    """
+    Compiling many small programs: one 'python main.py <file>' per program
+    (timed on a few and scaled) against one 'python main.py --batch <dir>',
+    then the batch on 2, 4, ... worker processes up to the core count.
+    """
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(n_programs):
+            with open(f"{directory}/p{i:05d}.sa", "w") as f:
+                f.write(generate_program(i % 20 + 1))
+        one = best_of(lambda: [subprocess.run([sys.executable, "main.py", f"{directory}/p{i:05d}.sa"], check=True,
+                                              capture_output=True) for i in range(processes)], 1)
+        per_process = one / processes * n_programs
+        batch = best_of(lambda: subprocess.run([sys.executable, "main.py", "--batch", directory, "--jsonl", os.devnull],
+                                               check=True, capture_output=True), 3)
+        print(f"[batch] {n_programs} programs: a process each ~{per_process:.2f} s, one batch {batch:.2f} s "
+              f"({per_process / batch:.1f}x)")
+        cores = os.cpu_count() or 1
+        for workers in sorted({2, max(cores, 2)} | {1 << k for k in range(1, cores.bit_length())}):
+            command = [sys.executable, "main.py", "--batch", directory, "--jsonl", os.devnull, "--workers", str(workers)]
+            elapsed = best_of(lambda: subprocess.run(command, check=True, capture_output=True), 3)
+            print(f"[batch] {n_programs} programs, {workers} workers: {elapsed:.2f} s "
+                  f"({batch / elapsed:.2f}x, {cores} cores)")
+
+
+def percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p50, p99 = samples[len(samples) // 2], samples[min(len(samples) - 1, len(samples) * 99 // 100)]
+    return f"p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms"
+
+
+def bench_server(requests: int = 500, processes: int = 30, n_declarations: int = 20):
+    """
+    Latency of compiling one small program: 'python main.py <file>',
+    'python client.py <file>' against a running server.py, and a request on
+    an open connection; then the throughput of pipelined requests. Every
+    request differs in trailing blanks, so none is answered from the
+    server's cache.
+    """
+    import tempfile
+    from client import CompileClient
+    with tempfile.TemporaryDirectory() as directory:
+        path, socket_path = f"{directory}/program.sa", f"{directory}/server.sock"
+        with open(path, "w") as f:
+            f.write(generate_program(n_declarations))
+        with open(path, "rb") as f:
+            source = f.read()
+        server = subprocess.Popen([sys.executable, "server.py", "--socket", socket_path], stderr=subprocess.DEVNULL)
+        try:
+            while not os.path.exists(socket_path):
+                time.sleep(0.01)
+            for label, command in (("main.py", [sys.executable, "main.py", path]),
+                                   ("client.py", [sys.executable, "client.py", "--socket", socket_path, path])):
+                samples = []
+                for i in range(processes):
+                    with open(path, "wb") as f:
+                        f.write(source + b" " * i)
+                    start = time.perf_counter()
+                    subprocess.run(command, check=True, capture_output=True)
+                    samples.append(time.perf_counter() - start)
+                print(f"[server] {label} process: {percentiles(samples)}")
+            client = CompileClient(socket_path)
+            samples = []
+            for i in range(requests):
+                start = time.perf_counter()
+                client.compile(source + b"\n" * i)
+                samples.append(time.perf_counter() - start)
+            print(f"[server] request on a connection: {percentiles(samples)}")
+            start = time.perf_counter()
+            for i in range(requests):
+                client.send(source + b"\t" * i)
+            for _ in range(requests):
+                client.receive()
+            elapsed = time.perf_counter() - start
+            print(f"[server] {requests} pipelined requests: {requests / elapsed:.0f} requests/s")
+            client.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def bench_cache(sizes: tuple = (20, 200, 2000), n_programs: int = 400):
+    """
+    A compile against a hit of the cache, in this process and from its
+    directory (a fresh CompileCache, so its LRU is empty); then a batch with
+    an empty cache directory against the same batch once it is filled.
+    """
+    import shutil
+    import tempfile
+    from batch import compile_source
+    from cache import CompileCache
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    with tempfile.TemporaryDirectory() as directory:
+        for n_declarations in sizes:
+            source = generate_program(n_declarations).encode()
+            cache = CompileCache(f"{directory}/cache", (TABLE_PATH, GRAMMAR_PATH))
+            miss = best_of(lambda: compile_source(source, table), 3)
+            compile_source(source, table, cache=cache)
+            memory = best_of(lambda: compile_source(source, table, cache=cache))
+            disk = best_of(lambda: compile_source(source, table,
+                                                  cache=CompileCache(f"{directory}/cache", (TABLE_PATH, GRAMMAR_PATH))))
+            print(f"[cache] {n_declarations} declarations: compile {miss * 1000:.1f} ms, "
+                  f"disk hit {disk * 1000:.2f} ms ({miss / disk:.0f}x), memory hit {memory * 1000:.3f} ms "
+                  f"({miss / memory:.0f}x)")
+        shutil.rmtree(f"{directory}/cache")
+        os.mkdir(f"{directory}/programs")
+        for i in range(n_programs):
+            with open(f"{directory}/programs/p{i:05d}.sa", "w") as f:
+                f.write(generate_program(i % 20 + 1) + " " * (i // 20))
+        command = [sys.executable, "main.py", "--batch", f"{directory}/programs", "--jsonl", os.devnull,
+                   "--cache", f"{directory}/cache"]
+        cold = best_of(lambda: subprocess.run(command, check=True, capture_output=True), 1)
+        warm = best_of(lambda: subprocess.run(command, check=True, capture_output=True), 3)
+        print(f"[cache] {n_programs} programs batch: empty cache {cold:.2f} s, filled {warm:.2f} s "
+              f"({cold / warm:.1f}x)")
+
+
+class CountingSink:
+    """
+    File stand-in that only counts what is written to it.
+    """
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text: str):
+        self.size += len(text)
+
+
+def bench_ropes(depths: tuple = (500, 1000, 2000)):
+    """
+    Nested predicates '( ( a > 0 | a < 1 ) & a > 2 | ... )', whose value
+    text at depth d is O(d) long, so the evaluation tree holds O(d**2)
+    characters: one string per node (ROPE_MIN_LENGTH disabled) against Ropes,
+    for evaluation and for streaming the evaluation view to JSON.
+    """
+    import expression
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    rope_min_length = expression.ROPE_MIN_LENGTH
+    for depth in depths:
+        predicate = "a > 0"
+        for i in range(1, depth):
+            predicate = f"( {predicate} {'|&'[i % 2]} a {'<>'[i % 2]} {i} )"
+        tokens = load_tokens(f"show {{ a : {predicate} }} .")
+
+        def evaluate():
+            with redirect_stdout(io.StringIO()):
+                return Parser(tokens, table).build_tree()
+
+        def write(tree):
+            sink = CountingSink()
+            tree.write_json(sink, "evaluation")
+            return sink
+
+        for label, length in (("strings", float("inf")), ("ropes", rope_min_length)):
+            expression.ROPE_MIN_LENGTH = length
+            try:
+                retained, peak, tree = traced_memory(evaluate)
+                elapsed = best_of(evaluate, 3)
+                _, write_peak, sink = traced_memory(lambda: write(tree))
+                write_time = best_of(lambda: write(tree), 1)
+            finally:
+                expression.ROPE_MIN_LENGTH = rope_min_length
+            del tree
+            print(f"[ropes] depth {depth}, {label}: evaluate {elapsed * 1000:.1f} ms, retained {retained:.1f} MB, "
+                  f"peak {peak:.1f} MB; json {sink.size / 1e6:.1f} MB in {write_time * 1000:.0f} ms, "
+                  f"peak {write_peak:.1f} MB")
+
+
+def bench_incremental(n_declarations: int = 100000, edits: int = 50):
+    """
+    Single-character edits of a long program: a full compile of the edited
+    text against IncrementalProgram.edit() and its messages (result()
+    without outputs), for a digit of a declaration changed, and for the '.'
+    of a declaration deleted and typed again (a syntax error and back).
+    """
+    import random
+    from batch import compile_source
+    from incremental import IncrementalProgram
+    table = SLRParserTable.load(TABLE_PATH, GRAMMAR_PATH)
+    source = generate_program(n_declarations)
+    full = best_of(lambda: compile_source(source.encode(), table, names=()), 1)
+    start = time.perf_counter()
+    program = IncrementalProgram(source, table)
+    build = time.perf_counter() - start
+    print(f"[incremental] {n_declarations} declarations: full compile {full:.2f} s, incremental build {build:.2f} s")
+    lines = source.split("\n")
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line) + 1)
+    rng = random.Random(0)
+    samples = {"digit": [], "'.' deleted": [], "'.' typed": []}
+    analyzed = 0
+    for _ in range(edits):
+        i = rng.randrange(n_declarations)
+        digit = offsets[i] + lines[i].index(str(i), lines[i].index(" be ")) + len(str(i)) - 1
+        dot = offsets[i] + len(lines[i]) - 1
+        for label, edit in (("digit", (digit, 1, str((int(source[digit]) + 1) % 10))),
+                            ("'.' deleted", (dot, 1, "")), ("'.' typed", (dot, 0, "."))):
+            start = time.perf_counter()
+            counts = program.edit(*edit)
+            program.result(())
+            samples[label].append(time.perf_counter() - start)
+            analyzed += counts["analyzed"]
+    for label, times in samples.items():
+        print(f"[incremental] {label}: {percentiles(times)} ({full / sorted(times)[len(times) // 2]:.0f}x)")
+    print(f"[incremental] {analyzed / (3 * edits):.1f} declarations analyzed per edit")
+
+
+BENCHMARKS = {
+    "fused": bench_fused,
+    "cold-start": bench_cold_start,
+    "lr-loop": bench_lr_loop,
+    "table-builder": bench_table_builder,
+    "lexer": bench_lexer,
+    "token-memory": bench_token_memory,
+    "file-input": bench_file_input,
+    "arena": bench_arena,
+    "reductions": bench_reductions,
+    "membership": bench_membership,
+    "interval-sets": bench_interval_sets,
+    "simplify": bench_simplify,
+    "doubling-chain": bench_doubling_chain,
+    "ropes": bench_ropes,
+    "repeated-literals": bench_repeated_literals,
+    "vm": bench_vm,
+    "dead-declarations": bench_dead_declarations,
+    "parallel": bench_parallel,
+    "materialize": bench_materialize,
+    "batch": bench_batch,
+    "server": bench_server,
+    "cache": bench_cache,
+    "incremental": bench_incremental,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark '{name}', choose from: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        BENCHMARKS[name]()
@@ -0,0 +1,258 @@
+from __future__ import annotations
+import re
+from collections.abc import Iterator
+from predicate import SetValue, INTEGER
+
+# The members of a set are enumerated within [0, DEFAULT_UNIVERSE) unless told otherwise
+DEFAULT_UNIVERSE = 1 << 20
+
+# A byte of a bitmap with at least one member in it
+NONZERO = re.compile(rb"[^\x00]")
+
+
+class Bitmap:
+    """
+    A set of integers of the universe [low, low + size) as a bytearray, bit i
+    (bit i % 8 of byte i // 8) standing for the element low + i, so 2^20
+    elements take 128 KiB. & and | combine whole bitmaps as integers, a
+    machine word at a time; the queries scan bytes with C loops (find,
+    rstrip, re), none of them builds a Python set.
+    """
+    __slots__ = ("low", "size", "bits")
+
+    def __init__(self, low: int, size: int, bits: bytearray = None):
+        self.low = low
+        self.size = size
+        self.bits = bytearray((size + 7) >> 3) if bits is None else bits
+
+    @classmethod
+    def from_intervals(cls, intervals, low: int, size: int) -> Bitmap:
+        """
+        The members of an IntervalSet inside the universe.
+        """
+        bitmap = cls(low, size)
+        bounds = intervals.bounds
+        for k in range(0, len(bounds), 2):
+            bitmap.fill(bounds[k], bounds[k + 1])
+        return bitmap
+
+    def fill(self, start, stop):
+        """
+        Add the elements start <= x < stop, clipped to the universe; start
+        and stop may be -inf / inf.
+        """
+        start, stop = max(start, self.low) - self.low, min(stop, self.low + self.size) - self.low
+        if start >= stop:
+            return
+        bits = self.bits
+        first, last = start >> 3, (stop - 1) >> 3
+        head, tail = (0xFF << (start & 7)) & 0xFF, 0xFF >> (7 - ((stop - 1) & 7))
+        if first == last:
+            bits[first] |= head & tail
+            return
+        bits[first] |= head
+        bits[first + 1:last] = b"\xff" * (last - first - 1)
+        bits[last] |= tail
+
+    def _combine(self, other: Bitmap, operator: str) -> Bitmap:
+        if (self.low, self.size) != (other.low, other.size):
+            raise ValueError("Bitmaps of different universes")
+        left, right = int.from_bytes(self.bits, "little"), int.from_bytes(other.bits, "little")
+        words = left & right if operator == "I" else left | right
+        return Bitmap(self.low, self.size, bytearray(words.to_bytes(len(self.bits), "little")))
+
+    def __and__(self, other: Bitmap) -> Bitmap:
+        return self._combine(other, "I")
+
+    def __or__(self, other: Bitmap) -> Bitmap:
+        return self._combine(other, "U")
+
+    def __invert__(self) -> Bitmap:
+        """
+        Complement within the universe.
+        """
+        words = int.from_bytes(self.bits, "little") ^ ((1 << self.size) - 1)
+        return Bitmap(self.low, self.size, bytearray(words.to_bytes(len(self.bits), "little")))
+
+    def __contains__(self, n: int) -> bool:
+        i = n - self.low
+        return 0 <= i < self.size and self.bits[i >> 3] >> (i & 7) & 1 == 1
+
+    def __len__(self) -> int:
+        """
+        Cardinality, a popcount of the whole bitmap.
+        """
+        return int.from_bytes(self.bits, "little").bit_count()
+
+    def min(self) -> int | None:
+        found = NONZERO.search(self.bits)
+        if found is None:
+            return None
+        byte = self.bits[found.start()]
+        return self.low + (found.start() << 3) + (byte & -byte).bit_length() - 1
+
+    def max(self) -> int | None:
+        last = len(self.bits.rstrip(b"\x00")) - 1
+        if last < 0:
+            return None
+        return self.low + (last << 3) + self.bits[last].bit_length() - 1
+
+    def __iter__(self) -> Iterator[int]:
+        """
+        The members in increasing order, skipping empty bytes in C.
+        """
+        bits, low = self.bits, self.low
+        for found in NONZERO.finditer(bits):
+            index = found.start()
+            byte, base = bits[index], low + (index << 3)
+            while byte:
+                lowest = byte & -byte
+                yield base + lowest.bit_length() - 1
+                byte ^= lowest
+
+    def first(self, k: int) -> list[int]:
+        """
+        The k smallest members, fewer if the set has fewer.
+        """
+        members = []
+        if k > 0:
+            for member in self:
+                members.append(member)
+                if len(members) == k:
+                    break
+        return members
+
+    def __repr__(self) -> str:
+        return f"Bitmap([{self.low}, {self.low + self.size}), {len(self)} members)"
+
+
+def materialize(value, low: int = 0, high: int = DEFAULT_UNIVERSE) -> Bitmap:
+    """
+    The members of a set value in the universe low <= x < high, in bulk: a
+    set whose interval set is known is filled range by range, 'S U T' and
+    'S I T' are | and & of the operands' bitmaps, and a literal whose
+    predicate did not compile is evaluated node by node over whole bitmaps
+    (see _predicate()). Each distinct value of the DAG is materialized once.
+    :raise ValueError: for a value that is not a set, or a predicate with a
+                       part that does not define a set of integers (another
+                       identifier, a relation between sets).
+    """
+    if high <= low:
+        raise ValueError(f"Empty universe [{low}, {high})")
+    bitmaps = {}
+    pending = [value]
+    while pending:  # iterative, a chain of operators is as deep as the program is long
+        current = pending[-1]
+        if id(current) in bitmaps:
+            pending.pop()
+            continue
+        if current.__class__ is not SetValue:
+            raise ValueError(f"Not a set: {current}")
+        if current.intervals is not None:
+            bitmaps[id(current)] = Bitmap.from_intervals(current.intervals, low, high - low)
+        elif current.parts[:1] == ("{",):
+            bitmaps[id(current)] = _predicate(current.variable, current.parts[1], low, high, bitmaps)
+        else:
+            operator, left, right = current.parts
+            missing = [operand for operand in (left, right) if id(operand) not in bitmaps]
+            if missing:
+                pending.extend(missing)
+                continue
+            left, right = bitmaps[id(left)], bitmaps[id(right)]
+            bitmaps[id(current)] = left | right if operator == "U" else left & right
+        pending.pop()
+    return bitmaps[id(value)]
+
+
+def _predicate(variable: str, node, low: int, high: int, bitmaps: dict) -> Bitmap:
+    """
+    Bitmap of the elements of the universe that satisfy a P subtree of
+    '{ variable : P }', following the structure of predicate._compile().
+    """
+    size = high - low
+    words = _words(variable, node, low, high, bitmaps)
+    return Bitmap(low, size, bytearray(words.to_bytes((size + 7) >> 3, "little")))
+
+
+def _words(variable: str, predicate, low: int, high: int, bitmaps: dict) -> int:
+    """
+    _predicate() with the bitmaps of the subtrees kept as ints, bit i for
+    the element low + i, so | & ! are single integer operations. Iterative
+    like materialize(): an operator's frame goes back on the stack below
+    its operands and combines their ints once they are done.
+    """
+    everything = (1 << (high - low)) - 1
+    frames, values = [(predicate, False)], []
+    while frames:
+        node, done = frames.pop()
+        name, children = node.get("name"), node["children"]
+        if done:
+            if len(children) == 2:  # P'' -> ! R
+                values.append(everything ^ values.pop())
+            else:
+                right, left = values.pop(), values.pop()
+                values.append(left | right if children[1]["lexeme"] == "|" else left & right)
+        elif name in ("P", "P'"):
+            if len(children) == 1:
+                frames.append((children[0], False))
+            else:
+                frames += [(node, True), (children[2], False), (children[0], False)]
+        elif name == "P''":
+            first = children[0].get("lexeme")
+            if first == "(":
+                frames.append((children[1], False))
+            elif first == "!":
+                frames += [(node, True), (children[1], False)]
+            else:
+                frames.append((children[0], False))
+        else:
+            values.append(_relation(variable, children, low, high, bitmaps))
+    return values[0]
+
+
+def _relation(variable: str, children, low: int, high: int, bitmaps: dict) -> int:
+    """
+    The int bitmap of a relation 'E1 op E2' of the predicate.
+    """
+    everything = (1 << (high - low)) - 1
+    operator = children[1]["lexeme"]
+    left = _operand(variable, children[0])
+    if operator == "@":
+        members = children[2]["value"]
+        if left is not None and getattr(members, "intervals", None) is not None:
+            return everything if left in members.intervals else 0
+        if id(members) not in bitmaps:
+            bitmaps[id(members)] = materialize(members, low, high)
+        members = bitmaps[id(members)]
+        if left is None:
+            return int.from_bytes(members.bits, "little")
+        if not low <= left < high:
+            raise ValueError(f"{left} is outside the universe [{low}, {high})")
+        return everything if left in members else 0
+    right = _operand(variable, children[2])
+    if left is None and right is None:
+        return everything if operator == "=" else 0
+    if left is None or right is None:
+        # 'n < x' is 'x > n'
+        n = right if left is None else left
+        if left is not None and operator != "=":
+            operator = "<" if operator == ">" else ">"
+        start, stop = (low, n) if operator == "<" else (n + 1, high) if operator == ">" else (n, n + 1)
+        start, stop = max(start, low) - low, min(stop, high) - low
+        return ((1 << (stop - start)) - 1) << start if start < stop else 0
+    holds = left < right if operator == "<" else left > right if operator == ">" else left == right
+    return everything if holds else 0
+
+
+def _operand(variable: str, node):
+    """
+    :return: None for the bound variable, the int for an integer.
+    """
+    text = node["value"]
+    if text.__class__ is int:
+        return text
+    if text == variable:
+        return None
+    if isinstance(text, str) and INTEGER.fullmatch(text):
+        return int(text)
+    raise ValueError(f"Cannot enumerate the members of a predicate on {text}")
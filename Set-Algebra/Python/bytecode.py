@@ -0,0 +1,329 @@
+from __future__ import annotations
+from array import array
+from expression import Rope, join
+from lexer import TERMINAL_IDS
+from predicate import SetValue
+from syntax_tree import SyntaxTree
+
+# Opcodes. An instruction is two entries of Program.code, the opcode and its
+# argument (0 when it takes none).
+# Values: ints, sets, and what an identifier without a value reads as, its name.
+# LOAD_VAR pushes the value of a declaration, running its code the first time;
+# RETURN ends that code, leaving the value on the stack.
+PUSH_INT, PUSH_NAME, LOAD_VAR, RETURN, POP, ADD, SUB, MUL, UNION, INTERSECT = range(10)
+# Truth values of a 'show P' predicate: True, False or "undefined", as the 'bool' attribute
+LESS, GREATER, EQUAL, MEMBER, AND, OR, NOT, GROUP = range(10, 18)
+# The predicate of a set literal, built as nodes for compile_predicate() and simplify
+SET_RELATION, SET_AND, SET_OR, SET_NOT, SET_GROUP, MAKE_SET = range(18, 24)
+# The value 'show' / 'simplify' prints
+SHOW_VALUE, SHOW_BOOL, SIMPLIFY = range(24, 27)
+
+OPCODE_NAMES = ("PUSH_INT", "PUSH_NAME", "LOAD_VAR", "RETURN", "POP", "ADD", "SUB", "MUL", "UNION", "INTERSECT",
+                "LESS", "GREATER", "EQUAL", "MEMBER", "AND", "OR", "NOT", "GROUP",
+                "SET_RELATION", "SET_AND", "SET_OR", "SET_NOT", "SET_GROUP", "MAKE_SET",
+                "SHOW_VALUE", "SHOW_BOOL", "SIMPLIFY")
+
+NUM = TERMINAL_IDS["num"]
+
+# SET_RELATION argument -> operator
+RELATIONS = ("<", ">", "=", "@")
+RELATION_OPCODES = {"<": LESS, ">": GREATER, "=": EQUAL, "@": MEMBER}
+
+# Leaves of the predicate nodes SET_* build, only their lexemes are read
+BAR, AMPERSAND, BANG, OPEN, CLOSE = ({"lexeme": lexeme} for lexeme in ("|", "&", "!", "(", ")"))
+
+
+class Program:
+    """
+    A Set-Algebra program compiled to bytecode by compile_tree(): the
+    instructions in an array, one segment per declaration and the 'show'
+    code last, and a table of names. run() executes it on a stack machine
+    with the semantics of the evaluation rules, without lexing, parsing or
+    building a tree. Declarations are evaluated lazily: the first LOAD_VAR of
+    one runs its segment and keeps the value, and a declaration the 'show'
+    does not depend on is not compiled at all (see stats).
+    """
+    __slots__ = ("code", "names", "entries", "start", "evaluator", "stats")
+
+    def __init__(self, code: array, names: list[str], entries: array, start: int, evaluator, stats: dict):
+        """
+        :param names: PUSH_NAME / MAKE_SET arguments index it.
+        :param entries: by declaration, the offset of its segment, -1 when pruned.
+        :param start: offset of the 'show' code.
+        :param evaluator: the Parser whose rules were compiled; run() uses its
+                          compare(), is_member() and simplify().
+        """
+        self.code = code
+        self.names = names
+        self.entries = entries
+        self.start = start
+        self.evaluator = evaluator
+        self.stats = stats
+
+    def run(self):
+        """
+        Execute the program; stats["evaluated"] counts the declarations it ran.
+        :return: the value 'show' prints, what Parser.build_tree() leaves at the root.
+        :raise ValueError, TypeError: where evaluating the tree reports an
+                                      "Evaluation Error!" (with pruning, only
+                                      for what the 'show' depends on).
+        """
+        code, names, entries = self.code, self.names, self.entries
+        compare, is_member, simplify = self.evaluator.compare, self.evaluator.is_member, self.evaluator.simplify
+        values = [None] * len(entries)  # by declaration, None until it has run
+        stack, returns = [], []
+        push, pop = stack.append, stack.pop
+        pc, end = self.start, len(code)
+        evaluated = 0
+        while pc < end:
+            op, arg = code[pc], code[pc + 1]
+            pc += 2
+            if op == LOAD_VAR:
+                value = values[arg]
+                if value is None:
+                    returns.append(pc)
+                    pc = entries[arg]
+                    evaluated += 1
+                else:
+                    push(value)
+            elif op == PUSH_INT:
+                push(arg)
+            elif op == PUSH_NAME:
+                push(names[arg])
+            elif op == RETURN:
+                values[arg] = stack[-1]
+                pc = returns.pop()
+            elif op == POP:
+                pop()
+            elif op == SET_RELATION:
+                right, left = pop(), pop()
+                operator = RELATIONS[arg]
+                if operator == "@" and not _starts_with_literal(right):
+                    is_member(left, right)  # the text test rejects it as evaluation does
+                push({"name": "R", "children": [{"value": left}, {"lexeme": operator}, {"value": right}],
+                      "value": join(left, f" {operator} ", right)})
+            elif op == SET_AND:
+                right, left = pop(), pop()
+                if left["name"] != "P'":
+                    left = {"name": "P'", "children": [left], "value": left["value"]}
+                push({"name": "P'", "children": [left, AMPERSAND, right],
+                      "value": join("(", left["value"], " & ", right["value"], ")")})
+            elif op == SET_OR:
+                right, left = pop(), pop()
+                if left["name"] != "P":
+                    left = {"name": "P", "children": [left], "value": left["value"]}
+                push({"name": "P", "children": [left, BAR, right],
+                      "value": join("(", left["value"], " | ", right["value"], ")")})
+            elif op == MAKE_SET:
+                push(SetValue.literal(names[arg], pop()))
+            elif op == ADD:
+                right = pop()
+                push(int(pop()) + int(right))
+            elif op == SUB:
+                right = pop()
+                push(int(pop()) - int(right))
+            elif op == MUL:
+                right = pop()
+                push(int(pop()) * int(right))
+            elif op == UNION:
+                right = pop()
+                push(SetValue.combine(pop(), right, "U"))
+            elif op == INTERSECT:
+                right = pop()
+                push(SetValue.combine(pop(), right, "I"))
+            elif op == SET_NOT:
+                relation = pop()
+                push({"name": "P''", "children": [BANG, relation], "value": join("! ", relation["value"])})
+            elif op == SET_GROUP:
+                predicate = pop()
+                push({"name": "P''", "children": [OPEN, predicate, CLOSE], "value": predicate["value"]})
+            elif op == LESS or op == GREATER or op == EQUAL:
+                right = pop()
+                push(compare(pop(), RELATIONS[op - LESS], right))
+            elif op == MEMBER:
+                right = pop()
+                holds = is_member(pop(), right)
+                push(holds if holds.__class__ is bool else "undefined")
+            elif op == AND or op == OR:
+                right, left = pop(), pop()
+                holds = left and right if op == AND else left or right
+                push(holds if holds.__class__ is bool else "undefined")
+            elif op == NOT or op == GROUP:
+                # '! R' and '( P )' pass their text up without a truth value
+                pop()
+                push("undefined")
+            elif op == SHOW_VALUE:
+                value = pop()
+                push(value if isinstance(value, (str, Rope)) else str(value))
+            elif op == SHOW_BOOL:
+                push("true" if pop() else "false")
+            elif op == SIMPLIFY:
+                push(simplify(pop()))
+            else:
+                raise ValueError(f"Unknown opcode {op} at {pc - 2}")
+        self.stats["evaluated"] = evaluated
+        return pop()
+
+    def disassemble(self) -> str:
+        """
+        :return: one line per instruction, 'offset OPCODE argument', with a
+                 label before the code of each declaration (#number) and of 'show'.
+        """
+        labels = {entry: f"#{number}:" for number, entry in enumerate(self.entries) if entry >= 0}
+        labels[self.start] = "show:"
+        lines = []
+        for pc in range(0, len(self.code), 2):
+            if pc in labels:
+                lines.append(labels[pc])
+            op, arg = self.code[pc], self.code[pc + 1]
+            if op in (PUSH_NAME, MAKE_SET):
+                argument = self.names[arg]
+            elif op in (LOAD_VAR, RETURN):
+                argument = f"#{arg}"
+            elif op == SET_RELATION:
+                argument = RELATIONS[arg]
+            elif op == PUSH_INT:
+                argument = str(arg)
+            else:
+                argument = ""
+            lines.append(f"{pc:6} {OPCODE_NAMES[op]:<13}{argument}".rstrip())
+        return "\n".join(lines)
+
+
+def _starts_with_literal(value) -> bool:
+    # whether the text of value starts with a set literal's, which is all
+    # Parser.evaluate_predicate() needs to read it instead of raising
+    while isinstance(value, SetValue) and value.parts[:1] != ("{",):
+        value = value.pieces[0]
+    return isinstance(value, SetValue)
+
+
+def compile_tree(tree: SyntaxTree, evaluator, prune: bool = True) -> Program:
+    """
+    Compile the tree of a parsed program into a Program, in postfix order.
+    Each identifier is resolved to the declaration whose value it reads, the
+    last one of that name before it, which gives the dependency graph between
+    declarations. Iterative, so deep trees don't hit the recursion limit.
+    :param tree: built by evaluator.build_tree(); it must have been typed.
+    :param evaluator: the Parser that built it, see Program.
+    :param prune: leave out the declarations 'show' does not reach in the
+                  graph; otherwise every declaration runs, in program order,
+                  so an evaluation error in an unused one is still raised.
+    """
+    if not tree.typed:
+        raise ValueError("Only a program that parsed and typed can be compiled")
+    symbol_names, first_child, next_sibling, tokens = tree.symbol_names, tree.first_child, tree.next_sibling, tree.tokens
+    names, slots = [], {}
+    declared = []  # by declaration, its identifier
+    latest = {}  # identifier -> number of its last declaration so far
+    segments, dependencies = [], []  # by declaration, then 'show' last
+    code, uses = [], set()  # of the segment being compiled
+
+    def emit(op: int, arg: int = 0):
+        code.append(op)
+        code.append(arg)
+
+    def slot(name: str) -> int:
+        if name not in slots:
+            slots[name] = len(names)
+            names.append(name)
+        return slots[name]
+
+    def children(node: int) -> list[int]:
+        result, child = [], first_child[node]
+        while child != -1:
+            result.append(child)
+            child = next_sibling[child]
+        return result
+
+    def lexeme(node: int) -> str | None:
+        return tree.lexemes[tokens[node]] if tokens[node] >= 0 else None
+
+    # (node, whether its predicates belong to a set literal, children done)
+    pending = [(tree.root, False, False)]
+    while pending:
+        node, in_set, done = pending.pop()
+        if tokens[node] >= 0:
+            continue  # a leaf is compiled by its parent
+        kids = children(node)
+        name = symbol_names[tree.symbols[node]]
+        if not done:
+            pending.append((node, in_set, True))
+            if name == "E''" and lexeme(kids[0]) == "{":
+                in_set = True
+            elif name == "A":
+                in_set = False
+            for child in reversed(kids):
+                pending.append((child, in_set, False))
+            continue
+        if name == "E''":
+            if len(kids) == 1:  # a num or id leaf
+                if tree.symbols[kids[0]] == NUM:
+                    emit(PUSH_INT, int(lexeme(kids[0])))
+                elif lexeme(kids[0]) in latest:
+                    number = latest[lexeme(kids[0])]
+                    uses.add(number)
+                    emit(LOAD_VAR, number)
+                else:
+                    emit(PUSH_NAME, slot(lexeme(kids[0])))
+            elif lexeme(kids[0]) == "{":
+                emit(MAKE_SET, slot(lexeme(children(kids[1])[0])))
+            # '( E )' is the value of E
+        elif name in ("E", "E'") and len(kids) == 3:
+            emit({"U": UNION, "+": ADD, "-": SUB, "I": INTERSECT, "*": MUL}[lexeme(kids[1])])
+        elif name == "D":
+            number = len(declared)
+            emit(RETURN, number)
+            declared.append(lexeme(kids[2]))
+            latest[declared[number]] = number
+            segments.append(code)
+            dependencies.append(uses)
+            code, uses = [], set()
+        elif name == "R":
+            operator = lexeme(kids[1])
+            if in_set:
+                emit(SET_RELATION, RELATIONS.index(operator))
+            else:
+                emit(RELATION_OPCODES[operator])
+        elif name in ("P", "P'") and len(kids) == 3:
+            if in_set:
+                emit(SET_OR if name == "P" else SET_AND)
+            else:
+                emit(OR if name == "P" else AND)
+        elif name == "P''" and len(kids) > 1:
+            grouped = lexeme(kids[0]) == "("
+            if in_set:
+                emit(SET_GROUP if grouped else SET_NOT)
+            else:
+                emit(GROUP if grouped else NOT)
+        elif name == "A":
+            emit(SHOW_BOOL if symbol_names[tree.symbols[kids[0]]] == "P" else SHOW_VALUE)
+        elif name == "C" and lexeme(kids[0]) == "simplify":
+            emit(SIMPLIFY)
+
+    # declarations reachable from 'show', following the dependencies
+    if prune:
+        reachable = [False] * len(declared)
+        pending = list(uses)
+        while pending:
+            number = pending.pop()
+            if not reachable[number]:
+                reachable[number] = True
+                pending.extend(dependencies[number])
+    else:
+        reachable = [True] * len(declared)
+        forced = []
+        for number in range(len(declared)):
+            forced += [LOAD_VAR, number, POP, 0]
+        code[:0] = forced
+    program, entries = array('q'), array('q')
+    for number, segment in enumerate(segments):
+        entries.append(len(program) if reachable[number] else -1)
+        if reachable[number]:
+            program.extend(segment)
+    start = len(program)
+    program.extend(code)
+    stats = {"declarations": len(declared),
+             "pruned": [declared[number] for number in range(len(declared)) if not reachable[number]],
+             "evaluated": 0}
+    return Program(program, names, entries, start, evaluator, stats)
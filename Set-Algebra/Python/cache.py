@@ -0,0 +1,203 @@
+from __future__ import annotations
+import hashlib
+import marshal
+import os
+import zlib
+from collections import Counter, OrderedDict
+from main import OUTPUT_NAMES
+
+# Bump whenever the layout of a cache entry changes
+CACHE_VERSION = 1
+
+# Modules whose source makes up the compiler: an entry is only valid for the exact code that produced it
+COMPILER_MODULES = ("main", "lexer", "parser", "syntax_tree", "predicate", "expression", "interval",
+                    "simplify", "bytecode", "bitmap", "parallel", "batch")
+
+# What a cache entry holds: the four outputs, what the phases printed and the status
+ENTRY_FIELDS = OUTPUT_NAMES + ("stdout", "status")
+
+# Bytes of results the in-process layer keeps, and the cache directory, unless told otherwise
+MEMORY_LIMIT = 64 << 20
+DISK_LIMIT = 512 << 20
+
+# zlib level of the files: the outputs are repetitive JSON, level 1 already shrinks them ~20x
+COMPRESSION = 1
+
+# A directory over its limit is trimmed down to this fraction of it, oldest entries first
+EVICT_TO = 0.8
+
+
+def compiler_version() -> str:
+    """
+    sha256 of the source of COMPILER_MODULES, as the version of the compiler.
+    """
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in COMPILER_MODULES:
+        with open(os.path.join(directory, f"{name}.py"), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class CompileCache:
+    """
+    Content-addressed cache of compile results (see batch.compile_source()).
+    The key of a program is the sha256 of its source bytes, the table and
+    grammar files, the compiler version and the options that change what it
+    prints; the value is the four outputs, its stdout and its status.
+
+    Two layers: an LRU of results in this process, bounded by memory_limit
+    bytes of text, over an optional directory of one compressed marshal file
+    per key, bounded by disk_limit bytes. Files are written to a temporary
+    name and renamed, so processes sharing the directory never read half an
+    entry, and a hit refreshes the file's mtime, which eviction goes by.
+    """
+
+    def __init__(self, directory: str = None, table_paths: tuple[str, str] = (), memory_limit: int = MEMORY_LIMIT,
+                 disk_limit: int = DISK_LIMIT):
+        """
+        :param directory: where the entries are kept, created if missing;
+                          None for the in-process layer only.
+        :param table_paths: the CSV table and grammar files the results depend on.
+        """
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.memory = OrderedDict()  # key -> entry, least recently used first
+        self.memory_bytes = 0
+        self.disk_bytes = None  # counted on the first write
+        self.counts = Counter()
+        self.environment = hashlib.sha256(f"{CACHE_VERSION}:{compiler_version()}".encode())
+        for path in table_paths:
+            with open(path, 'rb') as file:
+                self.environment.update(hashlib.sha256(file.read()).digest())
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, source: bytes, universe: str = None, first: int = 10, lazy: bool = False) -> str:
+        digest = self.environment.copy()
+        # the members of a shown set are printed only with a universe
+        digest.update(b"\0" if universe is None else f"{universe}:{first}\0".encode())
+        if lazy:  # prints the pruned declarations and leaves most values out
+            digest.update(b"lazy\0")
+        digest.update(source)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> dict[str, str] | None:
+        """
+        :return: a copy of the entry of key, with "cache" telling the layer
+                 it came from ("memory" or "disk"), or None on a miss.
+        """
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory.move_to_end(key)
+            self.counts["memory hits"] += 1
+            return dict(entry, cache="memory")
+        entry = self._read(key)
+        if entry is not None:
+            self._remember(key, entry)
+            self.counts["disk hits"] += 1
+            return dict(entry, cache="disk")
+        self.counts["misses"] += 1
+        return None
+
+    def put(self, key: str, result: dict[str, str]):
+        """
+        Store a result that has all the fields of an entry; a crash is not
+        stored, it may not happen again (a RecursionError on a deeper stack).
+        """
+        if result["status"].startswith("crash"):
+            return
+        entry = {field: result[field] for field in ENTRY_FIELDS}
+        self._remember(key, entry)
+        if self.directory is not None:
+            self._write(key, entry)
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {self.counts[name]}" for name in ("memory hits", "disk hits", "misses", "evictions"))
+
+    # * In-process layer
+    def _remember(self, key: str, entry: dict[str, str]):
+        size = sum(map(len, entry.values()))
+        if size > self.memory_limit:
+            return
+        self.memory[key] = entry
+        self.memory_bytes += size
+        while self.memory_bytes > self.memory_limit:
+            _, oldest = self.memory.popitem(last=False)
+            self.memory_bytes -= sum(map(len, oldest.values()))
+
+    # * Directory layer
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _read(self, key: str) -> dict[str, str] | None:
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                version, entry = marshal.loads(zlib.decompress(file.read()))
+            if version != CACHE_VERSION or not all(isinstance(entry.get(field), str) for field in ENTRY_FIELDS):
+                return None
+            os.utime(path)
+        except (OSError, EOFError, ValueError, TypeError, AttributeError, zlib.error):
+            return None  # evicted by another process, or not an entry: a miss
+        return entry
+
+    def _write(self, key: str, entry: dict[str, str]):
+        """
+        Write an entry atomically, then evict if the directory went over its
+        limit; failures are ignored, the cache is only an optimization.
+        """
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        data = zlib.compress(marshal.dumps((CACHE_VERSION, entry)), COMPRESSION)
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        if self.disk_bytes is None:
+            self.disk_bytes = sum(size for _, size, _ in self._entries())
+        else:
+            self.disk_bytes += len(data)
+        if self.disk_bytes > self.disk_limit:
+            self._evict()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        """
+        :return: (mtime, size, path) of each entry of the directory.
+        """
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if item.name.endswith(".bin"):
+                    try:
+                        stat = item.stat()
+                    except OSError:
+                        continue  # removed meanwhile
+                    entries.append((stat.st_mtime, stat.st_size, item.path))
+        return entries
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until the directory is down to
+        EVICT_TO of its limit. The directory is counted again first: other
+        processes write to it too.
+        """
+        entries = sorted(self._entries())
+        self.disk_bytes = sum(size for _, size, _ in entries)
+        target = self.disk_limit * EVICT_TO
+        for _, size, path in entries:
+            if self.disk_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # evicted by another process
+            self.disk_bytes -= size
+            self.counts["evictions"] += 1
@@ -0,0 +1,105 @@
+from __future__ import annotations
+import json
+import os
+import socket
+import sys
+
+# Usage: python client.py [--socket PATH] <test_file>
+# Drop-in replacement for 'python main.py <test_file>': the same messages on
+# stdout and the same four output files in the current directory, compiled by
+# a running server.py, or in this process when there is none.
+
+# As server.DEFAULT_SOCKET, without importing the compiler
+DEFAULT_SOCKET = os.path.join(os.environ.get("TMPDIR", "/tmp"), f"set-algebra-{os.getuid()}.sock")
+
+# Output file of each phase, as server.PHASE_OUTPUTS
+PHASE_OUTPUTS = {"lexer": "lexer_out.json", "parser": "parser_out.json",
+                 "typing": "typing_out.json", "evaluation": "evaluation_out.json"}
+
+
+class CompileClient:
+    """
+    A connection to server.py. Requests can be pipelined: send() any number
+    of them, then receive() the responses, which come in the same order.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET):
+        self.socket = socket.socket(socket.AF_UNIX)
+        try:
+            self.socket.connect(path)
+        except OSError:
+            self.socket.close()
+            raise
+        self.reader = self.socket.makefile("rb")
+        self.sent = 0
+
+    def send(self, source: bytes, phases: tuple = tuple(PHASE_OUTPUTS), raw: bool = True) -> int:
+        """
+        Send one request without waiting for its response.
+        :return: its id.
+        """
+        self.sent += 1
+        request = {"id": self.sent, "source": source.decode("utf-8", "surrogateescape"),
+                   "phases": list(phases), "raw": raw}
+        self.socket.sendall(json.dumps(request).encode() + b"\n")
+        return self.sent
+
+    def receive(self) -> dict:
+        """
+        The response to the oldest request not received yet.
+        """
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("The server closed the connection")
+        return json.loads(line.decode("utf-8", "surrogateescape"))
+
+    def compile(self, source: bytes, phases: tuple = tuple(PHASE_OUTPUTS), raw: bool = True) -> dict:
+        self.send(source, phases, raw)
+        return self.receive()
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+
+def compile_locally(source: bytes) -> dict:
+    """
+    What the server would answer, without one: main.py's pipeline here.
+    """
+    from batch import compile_source
+    from main import OUTPUT_NAMES
+    from parser import SLRParserTable
+    table = SLRParserTable.load('SLR Parsing Table.csv', 'SLR Grammar.txt')
+    result = compile_source(source, table)
+    response = {"status": result["status"], "stdout": result["stdout"]}
+    for phase, name in zip(PHASE_OUTPUTS, OUTPUT_NAMES):
+        response[phase] = result[name]
+    return response
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    path = DEFAULT_SOCKET
+    if len(arguments) == 3 and arguments[0] == "--socket":
+        path, arguments = arguments[1], arguments[2:]
+    if len(arguments) != 1:
+        print("Usage: python client.py [--socket PATH] <test_file>")
+        sys.exit(1)
+    with open(arguments[0], "rb") as f:
+        source = f.read()
+    try:
+        client = CompileClient(path)
+    except OSError:
+        response = compile_locally(source)
+    else:
+        response = client.compile(source)
+        client.close()
+    sys.stdout.write(response["stdout"])
+    for phase, name in PHASE_OUTPUTS.items():
+        if phase in response:
+            with open(name, "w", encoding="utf-8") as f:
+                f.write(response[phase])
+    if response["status"].startswith(("crash", "error")):
+        # where main.py would have stopped with a traceback
+        print(response["status"], file=sys.stderr)
+        sys.exit(1)
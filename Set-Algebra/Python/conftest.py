@@ -0,0 +1,25 @@
+from __future__ import annotations
+import os
+import pytest
+from parser import SLRParserTable
+
+# Usage: python -m pytest tests
+# The tests run in this directory, where main.py finds its table files.
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+TABLE_PATH = 'SLR Parsing Table.csv'
+GRAMMAR_PATH = 'SLR Grammar.txt'
+
+# test_ans.py compares two output files given on its command line, it holds no tests
+collect_ignore = ["test_ans.py"]
+
+
+@pytest.fixture(autouse=True)
+def in_project_directory(monkeypatch):
+    monkeypatch.chdir(DIRECTORY)
+
+
+@pytest.fixture(scope="session")
+def table() -> SLRParserTable:
+    return SLRParserTable.load(os.path.join(DIRECTORY, TABLE_PATH), os.path.join(DIRECTORY, GRAMMAR_PATH))
@@ -0,0 +1,134 @@
+from __future__ import annotations
+from collections.abc import Iterator
+from weakref import WeakValueDictionary
+
+# join() keeps a value as one string up to this many characters, above it builds a Rope
+ROPE_MIN_LENGTH = 64
+
+# Every live Expr by class and pieces (strings as they are, Exprs by identity)
+_INTERNED = WeakValueDictionary()
+
+def _key(cls, pieces: tuple) -> tuple:
+    return (cls,) + tuple(piece if piece.__class__ is str else id(piece) for piece in pieces)
+
+class Rope:
+    """
+    A value text kept as a tuple of pieces, strings and other Ropes, instead
+    of one concatenated string: a node of the evaluation tree refers to its
+    children's texts rather than copying them, so the values of nested
+    predicates take memory linear in the program, not quadratic. The text is
+    produced on demand, by chunks() for streaming writers or str().
+    """
+    __slots__ = ("pieces",)
+    _text = None  # see Expr
+
+    def __init__(self, pieces: tuple):
+        self.pieces = pieces
+
+    def chunks(self, size: int = 1 << 16) -> Iterator[str]:
+        """
+        The text as a sequence of strings of about size characters, left to
+        right, without building it all; a piece that already has its whole
+        text built is passed on as it is. Iterative, a rope can be deeper than
+        the recursion limit.
+        """
+        batch, length = [], 0
+        pending = [self]
+        while pending:
+            piece = pending.pop()
+            if piece.__class__ is not str:
+                if piece._text is None:
+                    pending.extend(reversed(piece.pieces))
+                    continue
+                piece = piece._text
+            batch.append(piece)
+            length += len(piece)
+            if length >= size:
+                yield "".join(batch)
+                batch, length = [], 0
+        if batch:
+            yield "".join(batch)
+
+    def __str__(self) -> str:
+        return "".join(self.chunks())
+
+    def __int__(self) -> int:
+        # what int() of the text did: a ValueError naming it
+        return int(str(self))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({str(self)!r})"
+
+
+class Expr(Rope):
+    """
+    A long evaluation value (a set, a predicate) as a Rope that is hash-consed:
+    structurally identical values are one object, and a variable's value is
+    shared by reference wherever it is used, so a chain like 'let set b be
+    a U a . let set c be b U b . ...' grows by one node per declaration rather
+    than doubling its text, and a subexpression repeated across declarations
+    is built once. Its text is built once, by the first str().
+    """
+    __slots__ = ("_text", "__weakref__")
+
+    def __new__(cls, pieces: tuple, *args):
+        key = _key(cls, pieces)
+        value = _INTERNED.get(key)
+        if value is None:
+            value = super().__new__(cls)
+            value.pieces = pieces
+            value._text = None
+            value._init(*args)
+            _INTERNED[key] = value
+        return value
+
+    def __init__(self, pieces: tuple, *args):
+        pass  # set up by __new__, once per distinct value
+
+    @classmethod
+    def interned(cls, pieces: tuple) -> Expr | None:
+        """
+        :return: the live value of this class with these pieces, None if there
+                 is none; lets a caller skip computing what a new value needs.
+        """
+        return _INTERNED.get(_key(cls, pieces))
+
+    def _init(self):
+        """
+        Set the attributes of a subclass; runs only for a new value.
+        """
+
+    def __str__(self) -> str:
+        if self._text is None:
+            self._text = "".join(self.chunks())
+        return self._text
+
+
+def join(*pieces) -> str | Expr:
+    """
+    Concatenate values: a str when the result is short and no piece is a
+    Rope, an Expr otherwise. An int piece is written in decimal.
+    """
+    for piece in pieces:
+        if piece.__class__ is not str:
+            break
+    else:
+        if sum(map(len, pieces)) > ROPE_MIN_LENGTH:
+            return Expr(pieces)
+        return "".join(pieces)
+    if not any(isinstance(piece, Rope) for piece in pieces):
+        text = "".join(piece if piece.__class__ is str else str(piece) for piece in pieces)
+        return Expr((text,)) if len(text) > ROPE_MIN_LENGTH else text
+    # adjacent strings become one piece
+    merged, run = [], []
+    for piece in pieces:
+        if isinstance(piece, Rope):
+            if run:
+                merged.append("".join(run))
+                run = []
+            merged.append(piece)
+        else:
+            run.append(piece if piece.__class__ is str else str(piece))
+    if run:
+        merged.append("".join(run))
+    return Expr(tuple(merged))
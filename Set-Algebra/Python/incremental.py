@@ -0,0 +1,590 @@
+from __future__ import annotations
+import io
+import json
+import re
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from heapq import heappop, heappush
+from itertools import accumulate, chain
+from operator import attrgetter
+from lexer import FileLexer, Lexer, TokenStream, TERMINALS, TERMINAL_IDS, TOKEN_JSON
+from main import OUTPUT_NAMES
+from parser import Parser, SLRParserTable, SHIFT, REDUCE
+from syntax_tree import SyntaxTree, NodeView
+
+# FileLexer's patterns on text, so an edited program lexes as 'python main.py' lexes its file
+TOKEN_PATTERN = re.compile(FileLexer.BYTES_TOKEN_PATTERN.pattern.decode())
+INVALID_PATTERN = re.compile(FileLexer.BYTES_INVALID_PATTERN.pattern.decode())
+
+# Order keys of consecutive segments start this far apart; the segments an edit inserts are keyed in between
+KEY_GAP = 1 << 32
+
+# Terminals that delimit and start the statements
+DOT, LET, SHOW, SIMPLIFY, ID, NUM, END = (TERMINAL_IDS[terminal] for terminal in
+                                          (".", "let", "show", "simplify", "id", "num", "$"))
+
+KEY = attrgetter("key")
+
+
+class Segment:
+    """
+    One statement of an IncrementalProgram: its text, from its first token
+    (the start of the program for the first one) up to the next statement,
+    and its tokens in a TokenStream of their own, with offsets into that
+    text, so an edit elsewhere does not move them. A segment that parses as
+    a declaration or as the final 'show' has a subtree in the program's
+    arena, and the symbol table state it leaves for the names it mentions.
+    """
+    __slots__ = ("text", "tokens", "key", "goal", "first", "node", "spine", "dot", "names", "after", "error")
+
+    def __init__(self, text: str, tokens: TokenStream | None):
+        """
+        :param tokens: None after a lexical error in text.
+        """
+        self.text = text
+        self.tokens = tokens
+        self.key = 0  # increasing with the position in the program, see KEY_GAP
+        self.goal = None  # symbol ID of D or C when it parsed as one
+        self.first = self.node = -1  # its subtree, the arena rows first..node; node is the D or C
+        self.spine = self.dot = -1  # the D' over a declaration's D, the '.' after the 'show'
+        self.names = ()  # the identifiers it reads or writes in the symbol table
+        self.after = {}  # name -> (type, value) it leaves in the symbol table, None for no entry
+        self.error = None  # the evaluation error it stopped at
+
+
+def lex_segments(text: str) -> list[Segment] | None:
+    """
+    Tokenize text into segments, each ending after a '.' token and the blanks
+    following it; the last one ends with the text, on a '.' or not.
+    :return: the segments, at least one, or None on a lexical error.
+    """
+    symbols, starts, ends = [], [], []
+    cuts, ended = [], False  # token index starting each segment after the first
+    if text.isascii():
+        if INVALID_PATTERN.search(text):
+            return None
+        keywords = Lexer.KEYWORDS
+        for match in TOKEN_PATTERN.finditer(text):
+            word, number, char = match.groups()
+            start, end = match.span(match.lastindex)
+            if char:
+                symbol = TERMINAL_IDS[char]
+            elif word:
+                symbol = TERMINAL_IDS[word] if word in keywords else ID
+            else:
+                if len(number) > 10 or int(number) > Lexer.MAX_NUMBER:
+                    return None
+                symbol = NUM
+            if ended:
+                cuts.append(len(symbols))
+            symbols.append(symbol)
+            starts.append(start)
+            ends.append(end)
+            ended = symbol == DOT
+    else:
+        # Lexer's per-character path, which FileLexer hands non-ASCII input to;
+        # '\r' is whitespace there, as a blank of the same length it keeps the offsets
+        lexer = Lexer(text.replace("\r", " "))
+        try:
+            while True:
+                token, _ = lexer.next_token()
+                if token is None:
+                    break
+                if ended:
+                    cuts.append(len(symbols))
+                symbols.append(token.symbol)
+                starts.append(lexer.position - len(token.lexeme))
+                ends.append(lexer.position)
+                ended = token.symbol == DOT
+        except ValueError:
+            return None
+    segments = []
+    bounds = [0] + [starts[cut] for cut in cuts] + [len(text)]
+    for (low, high), (begin, stop) in zip(zip(bounds, bounds[1:]), zip([0] + cuts, cuts + [len(symbols)])):
+        tokens = TokenStream(text[low:high])
+        for index in range(begin, stop):
+            tokens.append(symbols[index], starts[index] - low, ends[index] - low)
+        segments.append(Segment(tokens.source, tokens))
+    return segments
+
+
+def closed(segment: Segment) -> bool:
+    """
+    Whether a segment ends with a '.' token, as every statement does.
+    """
+    tokens = segment.tokens
+    return bool(tokens) and tokens.symbols[-1] == DOT
+
+
+def joins(left: str, right: str) -> bool:
+    """
+    Whether the end of left and the start of right may lex as one token.
+    """
+    return bool(left) and bool(right) and left[-1].isalnum() and right[0].isalnum()
+
+
+class IncrementalProgram:
+    """
+    A program kept compiled while it is edited: edit() re-lexes only the
+    statements the edit touches, re-parses only those into the arena, and
+    runs the typing and evaluation rules again only where the symbol table
+    they see has changed; result() gives what batch.compile_source() gives
+    for the current text.
+
+    The text is a list of Segments, one per statement. Every declaration is
+    parsed on its own from state 0, up to its reduction to D: the states
+    inside a D do not depend on what precedes it. Its D' node is made once,
+    and D' -> D D' is kept by pointing each D's next sibling at the
+    following declaration's D', so replacing a declaration relinks one
+    sibling instead of rebuilding the right-recursive spine. Subtrees that
+    are replaced stay in the arena, unreachable from the root.
+
+    A declaration reads and writes the symbol table only through the
+    identifiers it mentions, so it is analyzed with a table holding just
+    those, as the statements before it left them, found in an index of the
+    segments mentioning each name. When the state a segment leaves for a
+    name changes, the next segment mentioning that name is analyzed again,
+    in program order, until the states come out as before.
+    """
+
+    def __init__(self, source: str, table: SLRParserTable):
+        self.parser = Parser([], table)
+        self.tree = tree = SyntaxTree(table.symbols)
+        self.productions = array('b')  # arena row -> production of a segment's non-terminal, -1 otherwise
+        symbol_ids = table.symbol_ids
+        self.D, self.C, self.D_prime, self.S = (symbol_ids[symbol] for symbol in ("D", "C", "D'", "S"))
+        self.codes = {name: tree.type_code(name) for name in
+                      ("void", "integer", "declaration", "declarations", "program", "type_error")}
+        self.segments = []
+        self.lengths = []  # length of each segment's text
+        self.occurrences = {}  # name -> the parsed segments mentioning it, in program order
+        self.unlexed = set()  # segments with a lexical error
+        self.others = set()  # segments that did not parse as a declaration
+        self.type_errors = set()  # declarations of type type_error
+        self.evaluation_errors = set()  # segments whose evaluation raised
+        self.boundary = 0  # key of the last declaration of type type_error when the spine was typed
+        self.counts = {}
+        segments = lex_segments(source)
+        self._replace(0, 0, segments if segments is not None else [Segment(source, None)])
+
+    @property
+    def text(self) -> str:
+        return "".join(segment.text for segment in self.segments)
+
+    def edit(self, offset: int, deleted: int, inserted: str) -> dict[str, int]:
+        """
+        Replace the deleted characters at offset with inserted, and bring the
+        tokens and the tree up to date.
+        :return: what the edit took: segments lexed, statements parsed and
+                 segments analyzed.
+        """
+        segments, lengths = self.segments, self.lengths
+        starts = list(accumulate(lengths, initial=0))
+        if offset < 0 or deleted < 0 or offset + deleted > starts[-1]:
+            raise ValueError(f"Edit of {deleted} characters at {offset} outside a text of {starts[-1]}")
+        count = len(segments)
+        first = bisect_right(starts, offset, 0, count) - 1
+        stop = bisect_left(starts, offset + deleted, first + 1, count)
+        text = "".join(segment.text for segment in segments[first:stop])
+        local = offset - starts[first]
+        text = text[:local] + inserted + text[local + deleted:]
+        while True:
+            # widen the window until its ends are token boundaries and it ends with a statement
+            new = lex_segments(text)
+            if first > 0 and (segments[first - 1].tokens is None or joins(segments[first - 1].text, text)):
+                first -= 1
+                text = segments[first].text + text
+            elif stop < count and (joins(text, segments[stop].text) or not segments[stop].tokens or
+                                   new is not None and not closed(new[-1])):
+                text += segments[stop].text
+                stop += 1
+            else:
+                break
+        self._replace(first, stop, new if new is not None else [Segment(text, None)])
+        return self.counts
+
+    def result(self, names: tuple = OUTPUT_NAMES) -> dict[str, str]:
+        """
+        :param names: the outputs to produce, of OUTPUT_NAMES.
+        :return: the text of each output by name, what the phases print as
+                 "stdout" and the phase the program fails in as "status", as
+                 batch.compile_source() returns them for the current text.
+        """
+        result = {}
+        for name, view in zip(OUTPUT_NAMES, ("lexer", "parse", "typing", "evaluation")):
+            if name not in names:
+                continue
+            buffer = io.StringIO()
+            if view == "lexer":
+                self._write_tokens(buffer)
+            else:
+                self.tree.write_json(buffer, view)
+            result[name] = buffer.getvalue()
+        result["stdout"], result["status"] = self._report()
+        return result
+
+    # * Segments
+    def _replace(self, first: int, stop: int, new: list[Segment]):
+        """
+        Put new in place of segments[first:stop]: parse and analyze them, then
+        analyze again the segments after them that see another symbol table.
+        """
+        segments, occurrences = self.segments, self.occurrences
+        self.counts = {"lexed": len(new), "parsed": 0, "analyzed": 0}
+        old_after = {}  # name -> the state the replaced segments left
+        for segment in segments[first:stop]:
+            self._forget(segment)
+            old_after.update(segment.after)
+        segments[first:stop] = new
+        self.lengths[first:stop] = [len(segment.text) for segment in new]
+        after = first + len(new)
+        renumbered = self._key(first, after)
+        for segment in new:
+            if segment.tokens is None:
+                self.unlexed.add(segment)
+                self.others.add(segment)
+                continue
+            self._parse(segment)
+            if segment.goal is None:
+                continue
+            for name in segment.names:
+                insort(occurrences.setdefault(name, []), segment, key=KEY)
+            self._analyze(segment)
+        pending = {}  # key -> segment to analyze again
+        if after < len(segments):
+            start, end = segments[first].key, segments[after].key
+            for name in set(old_after).union(*(segment.names for segment in new)):
+                before = old_after[name] if name in old_after else self._state(name, start)
+                if self._state(name, end) != before:
+                    self._schedule(pending, name, end)
+        self._propagate(pending)
+        self._link(first - 1, after)
+        self._type_spines(first, after, renumbered)
+        self._finish()
+
+    def _forget(self, segment: Segment):
+        for name in segment.names:
+            occurrence = self.occurrences[name]
+            del occurrence[bisect_left(occurrence, segment.key, key=KEY)]
+            if not occurrence:
+                del self.occurrences[name]
+        for errors in (self.unlexed, self.others, self.type_errors, self.evaluation_errors):
+            errors.discard(segment)
+
+    def _key(self, first: int, after: int) -> bool:
+        """
+        Key segments[first:after] between their neighbours, or every segment
+        again when there is no room left between them.
+        :return: whether every segment was keyed again.
+        """
+        segments = self.segments
+        low = segments[first - 1].key if first > 0 else 0
+        high = segments[after].key if after < len(segments) else low + KEY_GAP * (after - first + 1)
+        step = (high - low) // (after - first + 1)
+        if step == 0:
+            for index, segment in enumerate(segments):
+                segment.key = (index + 1) * KEY_GAP
+            return True
+        for index in range(first, after):
+            segments[index].key = low + step * (index - first + 1)
+        return False
+
+    # * Parsing
+    @staticmethod
+    def _pairs(segment: Segment):
+        """
+        (terminal ID, lexeme) of each token of a segment, as stream_simplify()
+        of main.py hands them to the parser.
+        """
+        tokens = segment.tokens
+        source = tokens.source
+        for symbol, start, end in zip(tokens.symbols, tokens.starts, tokens.ends):
+            lexeme = source[start:end]
+            yield (SHOW, "simplify") if "simplify" in lexeme else (symbol, lexeme)
+
+    def _parse(self, segment: Segment):
+        """
+        Add the subtree of a segment to the arena: 'let T id be E .' up to its
+        reduction to D, with a 'let' standing in for the token after it, or
+        'show A' up to its reduction to C with its '.' as the lookahead, and
+        then the '.' leaf. A segment that is neither keeps no rows.
+        """
+        pairs = list(self._pairs(segment))
+        if pairs and pairs[0][0] == LET:
+            goal = self.D
+            pairs.append((LET, "let"))
+        elif pairs and pairs[0][0] == SHOW and pairs[-1][0] == DOT:
+            goal = self.C
+        else:
+            self.others.add(segment)
+            return
+        self.counts["parsed"] += 1
+        tree, productions = self.tree, self.productions
+        parser, void, integer = self.parser, self.codes["void"], self.codes["integer"]
+        actions, goto, width, reductions = parser.actions, parser.goto, parser.width, parser.reductions
+        size, lexemes = len(tree), len(tree.lexemes)
+        last = len(pairs) - 1  # the lookahead the goal is reduced on, never shifted
+        states, nodes = [0], [-1]
+        index = 0
+        symbol, lexeme = pairs[0]
+        while True:
+            code = actions[states[-1] * width + symbol]
+            action, value = code & 3, code >> 2
+            if action == SHIFT and index < last:
+                if symbol == NUM:
+                    node = tree.add_leaf(symbol, lexeme, integer, lexeme)
+                else:
+                    node = tree.add_leaf(SIMPLIFY if symbol == SHOW and lexeme == "simplify" else symbol,
+                                         lexeme, void, "void")
+                productions.append(-1)
+                states.append(value)
+                nodes.append(node)
+                index += 1
+                symbol, lexeme = pairs[index]
+            elif action == REDUCE:
+                lhs, rhs_length = reductions[value][:2]
+                base = len(nodes) - rhs_length
+                node = tree.add_node(lhs, nodes[base:])
+                productions.append(value)
+                del nodes[base:], states[base:]
+                if lhs == goal and base == 1:
+                    break
+                states.append(goto[states[-1] * width + lhs])
+                nodes.append(node)
+            else:
+                break
+        if not (action == REDUCE and index == last):
+            # a syntax error: the rows added are dropped
+            for column in (tree.symbols, tree.first_child, tree.next_sibling, tree.tokens, tree.types, tree.values,
+                           productions):
+                del column[size:]
+            del tree.lexemes[lexemes:]
+            self.others.add(segment)
+            return
+        segment.goal, segment.first, segment.node = goal, size, node
+        segment.names = tuple(dict.fromkeys(lexeme for symbol, lexeme in pairs[:last] if symbol == ID))
+        if goal == self.D:
+            segment.spine = tree.add_node(self.D_prime, [node])
+            tree.values[segment.spine] = "void"
+        else:
+            segment.dot = tree.add_leaf(DOT, ".", void, "void")
+            self.others.add(segment)
+        productions.append(-1)
+
+    def _syntax_error(self) -> tuple[str, int, list]:
+        """
+        The lexeme and the state the LR parse of the whole program stops at,
+        and its stack of (state, parse tree) pairs as Parser.build_tree()
+        prints it.
+        The segments before the first one that is not a declaration would
+        each have reduced to a D, so the parse is resumed from the stack they
+        leave, one declaration before it.
+        """
+        parser, segments, tree = self.parser, self.segments, self.tree
+        actions, goto, width, reductions = parser.actions, parser.goto, parser.width, parser.reductions
+        first = bisect_left(segments, min(self.others, key=KEY).key, key=KEY) if self.others else len(segments)
+        first = max(first - 1, 0)
+        states, nodes = [0], [None]
+        for segment in segments[:first]:  # D's stack up, D' -> D D' is only reduced at the end
+            states.append(goto[states[-1] * width + self.D])
+            nodes.append(tree.as_dict("parse", segment.node))
+        pairs = chain.from_iterable(map(self._pairs, segments[first:]))
+        for symbol, lexeme in chain(pairs, [(END, "$")]):
+            while True:
+                code = actions[states[-1] * width + symbol]
+                action, value = code & 3, code >> 2
+                if action == SHIFT:
+                    states.append(value)
+                    nodes.append({"token": TERMINALS[symbol], "lexeme": lexeme})
+                    break
+                if action != REDUCE:
+                    return lexeme, states[-1], list(zip(states, nodes))
+                lhs, rhs_length = reductions[value][:2]
+                base = len(states) - rhs_length
+                children = nodes[base:]
+                del states[base:], nodes[base:]
+                states.append(goto[states[-1] * width + lhs])
+                nodes.append({"name": parser.symbol_names[lhs], "children": children})
+        return "$", states[-1], list(zip(states, nodes))
+
+    # * Typing and evaluation
+    def _state(self, name: str, key: int) -> tuple | None:
+        """
+        The state of name in the symbol table before the segment keyed key.
+        """
+        occurrence = self.occurrences.get(name)
+        if not occurrence:
+            return None
+        position = bisect_left(occurrence, key, key=KEY)
+        return occurrence[position - 1].after[name] if position else None
+
+    def _schedule(self, pending: dict, name: str, key: int):
+        """
+        Analyze again the first segment from key on that mentions name.
+        """
+        occurrence = self.occurrences.get(name)
+        if occurrence:
+            position = bisect_left(occurrence, key, key=KEY)
+            if position < len(occurrence):
+                pending[occurrence[position].key] = occurrence[position]
+
+    def _propagate(self, pending: dict):
+        heap = sorted(pending)
+        while heap:
+            key = heappop(heap)
+            segment = pending.pop(key)
+            before = segment.after
+            self._analyze(segment)
+            for name in segment.names:
+                if segment.after[name] != before[name]:
+                    occurrence = self.occurrences[name]
+                    position = bisect_right(occurrence, key, key=KEY)
+                    if position < len(occurrence) and occurrence[position].key not in pending:
+                        pending[occurrence[position].key] = occurrence[position]
+                        heappush(heap, occurrence[position].key)
+
+    def _analyze(self, segment: Segment):
+        """
+        Apply the typing and evaluation rules to the subtree of a segment in
+        reduction order, as the LR pass applies them, with the symbol table
+        the segments before it leave. As there, an evaluation error stops
+        the evaluation of the rest, not the typing.
+        """
+        self.counts["analyzed"] += 1
+        parser, tree = self.parser, self.tree
+        table = parser.symbol_table = {}
+        for name in segment.names:
+            state = self._state(name, segment.key)
+            if state is not None:
+                table[name] = {"type": state[0], "value": state[1]}
+        tokens, types, values, first_child, next_sibling = (tree.tokens, tree.types, tree.values, tree.first_child,
+                                                             tree.next_sibling)
+        reductions, productions, type_code = parser.reductions, self.productions, tree.type_code
+        bools, error = {}, None
+        for node in range(segment.first, segment.node + 1):
+            if tokens[node] >= 0:
+                continue
+            children, child = [], first_child[node]
+            while child != -1:
+                children.append(NodeView(tree, child, bools.get(child)))
+                child = next_sibling[child]
+            _, _, typing_rule, evaluation_rule, _ = reductions[productions[node]]
+            types[node] = type_code(typing_rule(*children))
+            if error is None:
+                try:
+                    value, bool_value = evaluation_rule(*children), None
+                    if isinstance(value, tuple):
+                        value, bool_value = value
+                    bools[node] = bool_value if isinstance(bool_value, bool) else "undefined"
+                    values[node] = value
+                except (SyntaxError, TypeError, ValueError) as e:
+                    error = e
+        segment.after = {name: (None if (entry := table.get(name)) is None else (entry["type"], entry["value"]))
+                         for name in segment.names}
+        segment.error = error
+        (self.evaluation_errors.add if error is not None else self.evaluation_errors.discard)(segment)
+        if segment.goal == self.D:
+            failed = types[segment.node] == self.codes["type_error"]
+            (self.type_errors.add if failed else self.type_errors.discard)(segment)
+
+    # * The tree over the segments
+    def _link(self, first: int, stop: int):
+        """
+        Point the D of each declaration of segments[first:stop] at the D' of
+        the declaration after it, the second child of its own D'.
+        """
+        segments, next_sibling = self.segments, self.tree.next_sibling
+        for index in range(max(first, 0), min(stop, len(segments))):
+            segment = segments[index]
+            if segment.goal == self.D:
+                following = segments[index + 1] if index + 1 < len(segments) else None
+                next_sibling[segment.node] = following.spine if following and following.goal == self.D else -1
+
+    def _type_spines(self, first: int, stop: int, renumbered: bool):
+        """
+        Type the D' nodes: a D' is of type type_error when a declaration from
+        its own on is, so only those between the last such declaration before
+        and after the edit change, besides the new ones of segments[first:stop].
+        """
+        segments, types = self.segments, self.tree.types
+        boundary = max(segment.key for segment in self.type_errors) if self.type_errors else 0
+        if renumbered:
+            ranges = [(0, len(segments))]
+        else:
+            low, high = sorted((self.boundary, boundary))
+            ranges = [(first, stop), (bisect_right(segments, low, key=KEY), bisect_right(segments, high, key=KEY))]
+        error, declarations = self.codes["type_error"], self.codes["declarations"]
+        for low, high in ranges:
+            for segment in segments[low:high]:
+                if segment.goal == self.D:
+                    types[segment.spine] = error if segment.key <= boundary else declarations
+        self.boundary = boundary
+
+    def _finish(self):
+        """
+        Put an S over the segments when they make a program: declarations,
+        then the 'show' last. Otherwise the tree has no root, as after a
+        syntax error.
+        """
+        tree, segments = self.tree, self.segments
+        last = segments[-1]
+        if self.unlexed or last.goal != self.C or len(self.others) != 1:
+            tree.root = -1
+            tree.typed = tree.evaluated = False
+            return
+        children = [last.node, last.dot] if len(segments) == 1 else [segments[0].spine, last.node, last.dot]
+        root = tree.add_node(self.S, children)
+        self.productions.append(-1)
+        if len(segments) == 1:
+            tree.types[root] = tree.types[last.node]  # S -> C .
+        else:
+            failed = self.type_errors or tree.types[last.node] == self.codes["type_error"]
+            tree.types[root] = self.codes["type_error" if failed else "program"]
+        tree.values[root] = tree.values[last.node]
+        tree.root, tree.typed = root, True
+        tree.evaluated = not self.evaluation_errors
+
+    # * Outputs
+    def _write_tokens(self, file):
+        """
+        The tokens of every segment in the lexer_out.json format, see
+        TokenStream.write_json().
+        """
+        if self.unlexed or not any(segment.tokens for segment in self.segments):
+            file.write("[]")
+            return
+        encode = json.encoder.encode_basestring
+        quoted_types = [encode(terminal) for terminal in TERMINALS]
+        separator = "[\n"
+        for segment in self.segments:
+            tokens = segment.tokens
+            source = tokens.source
+            for symbol, start, end in zip(tokens.symbols, tokens.starts, tokens.ends):
+                file.write(TOKEN_JSON.format(separator, quoted_types[symbol], encode(source[start:end])))
+                separator = ",\n"
+        file.write("\n]")
+
+    def _report(self) -> tuple[str, str]:
+        """
+        :return: what compiling the current text prints, and its status.
+        """
+        if self.unlexed:
+            # main.py parses no tokens at all then
+            return ("Lexical Error!\nSyntax Error!\nSyntax Error: Unexpected token '$' at state 0. Stack: [(0, None)]\n"
+                    "Semantic Error!\nSyntax Error: Unexpected token '$' at state 0.\n", "lexical")
+        lines = ["Lexical Analysis Complete!"]
+        if self.tree.root < 0:
+            lexeme, state, stack = self._syntax_error()
+            lines += ["Syntax Error!", f"Syntax Error: Unexpected token '{lexeme}' at state {state}. Stack: {stack}",
+                      "Semantic Error!", f"Syntax Error: Unexpected token '{lexeme}' at state {state}."]
+            status = "syntax"
+        else:
+            lines += ["Syntactic Analysis Complete!", "Semantic Analysis Complete!"]
+            if self.evaluation_errors:
+                # the LR pass stops evaluating at the first error of the program
+                lines.append(f"Evaluation Error! {min(self.evaluation_errors, key=KEY).error}")
+                status = "evaluation"
+            else:
+                lines += ["Evaluation Analysis Complete!", f"Final Value: {self.tree.values[self.tree.root]}"]
+                status = "ok"
+        return "".join(f"{line}\n" for line in lines), status
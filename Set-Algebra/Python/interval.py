@@ -0,0 +1,150 @@
+from __future__ import annotations
+from bisect import bisect_right
+
+NEGATIVE_INFINITY, INFINITY = float("-inf"), float("inf")
+
+class IntervalSet:
+    """
+    A set of integers as a finite union of intervals, the only sets the
+    language can define with <, >, = and &, |, !.
+    bounds is a sorted tuple of boundary points b0 < b1 < ..., the set being
+    [b0, b1) U [b2, b3) U ...; an open end is -inf / inf. Adjacent ranges are
+    always merged, so equal sets have equal bounds.
+    """
+    __slots__ = ("bounds",)
+
+    def __init__(self, bounds: tuple = ()):
+        self.bounds = bounds
+
+    @classmethod
+    def below(cls, n: int) -> IntervalSet:
+        """x < n"""
+        return cls((NEGATIVE_INFINITY, n))
+
+    @classmethod
+    def above(cls, n: int) -> IntervalSet:
+        """x > n"""
+        return cls((n + 1, INFINITY))
+
+    @classmethod
+    def point(cls, n: int) -> IntervalSet:
+        """x = n"""
+        return cls((n, n + 1))
+
+    @classmethod
+    def everything(cls) -> IntervalSet:
+        return cls((NEGATIVE_INFINITY, INFINITY))
+
+    @classmethod
+    def union_all(cls, sets) -> IntervalSet:
+        """
+        Union of any number of sets with one sort and sweep, O(k log k) in the
+        total number of ranges k instead of pairwise merges.
+        """
+        ranges = sorted((s.bounds[k], s.bounds[k + 1]) for s in sets for k in range(0, len(s.bounds), 2))
+        out = []
+        for low, high in ranges:
+            if out and low <= out[-1]:  # overlapping or adjacent
+                if high > out[-1]:
+                    out[-1] = high
+            else:
+                out += (low, high)
+        return cls(tuple(out))
+
+    @classmethod
+    def intersection_all(cls, sets) -> IntervalSet:
+        return ~cls.union_all([~s for s in sets])
+
+    def __contains__(self, n: int) -> bool:
+        # inside exactly when an odd number of boundaries are <= n
+        return bisect_right(self.bounds, n) & 1 == 1
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, IntervalSet) and self.bounds == other.bounds
+
+    def __hash__(self) -> int:
+        return hash(self.bounds)
+
+    def __bool__(self) -> bool:
+        return bool(self.bounds)
+
+    def __or__(self, other: IntervalSet) -> IntervalSet:
+        return self._merge(other, lambda a, b: a or b)
+
+    def __and__(self, other: IntervalSet) -> IntervalSet:
+        return self._merge(other, lambda a, b: a and b)
+
+    def __invert__(self) -> IntervalSet:
+        """
+        Complement over the integers: toggle the two open ends.
+        """
+        bounds = self.bounds
+        if bounds and bounds[0] == NEGATIVE_INFINITY:
+            bounds = bounds[1:]
+        else:
+            bounds = (NEGATIVE_INFINITY,) + bounds
+        if bounds and bounds[-1] == INFINITY:
+            bounds = bounds[:-1]
+        else:
+            bounds = bounds + (INFINITY,)
+        return IntervalSet(bounds)
+
+    def _merge(self, other: IntervalSet, keep) -> IntervalSet:
+        """
+        One sweep over both boundary lists, emitting a boundary wherever
+        keep(inside self, inside other) changes.
+        """
+        a, b = self.bounds, other.bounds
+        i = j = 0
+        in_a = in_b = inside = False
+        out = []
+        while i < len(a) or j < len(b):
+            x = a[i] if j >= len(b) or i < len(a) and a[i] <= b[j] else b[j]
+            if i < len(a) and a[i] == x:
+                in_a = not in_a
+                i += 1
+            if j < len(b) and b[j] == x:
+                in_b = not in_b
+                j += 1
+            if keep(in_a, in_b) != inside:
+                inside = not inside
+                out.append(x)
+        return IntervalSet(tuple(out))
+
+    def ranges(self) -> list[tuple]:
+        """
+        :return: [(low, high), ...] inclusive integer ranges, -inf / inf for open ends.
+        """
+        bounds = self.bounds
+        return [(bounds[k], bounds[k + 1] - 1) for k in range(0, len(bounds), 2)]
+
+    def minterms(self, variable: str) -> list[str]:
+        """
+        One minterm per range, sorted by lower bound: 'x < h', 'x > l' or
+        'x > l & x < h'; ['true'] / ['false'] for the universal / empty set.
+        """
+        bounds = self.bounds
+        if not bounds:
+            return ["false"]
+        if bounds == (NEGATIVE_INFINITY, INFINITY):
+            return ["true"]
+        minterms = []
+        for k in range(0, len(bounds), 2):
+            low, high = bounds[k], bounds[k + 1]
+            if low == NEGATIVE_INFINITY:
+                minterms.append(f"{variable} < {high}")
+            elif high == INFINITY:
+                minterms.append(f"{variable} > {low - 1}")
+            else:
+                minterms.append(f"{variable} > {low - 1} & {variable} < {high}")
+        return minterms
+
+    def show(self, variable: str = "a") -> str:
+        """
+        Canonical compact form of the set definition, in the layout of the
+        simplify bonus, e.g. '{ a : a < 3 | a > 5 & a < 8 }'.
+        """
+        return f"{{ {variable} : {' | '.join(self.minterms(variable))} }}"
+
+    def __repr__(self) -> str:
+        return f"IntervalSet({self.bounds!r})"
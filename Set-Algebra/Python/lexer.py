@@ -1,6 +1,40 @@
 from __future__ import annotations
+from array import array
+from contextlib import contextmanager
+import gc
+import json
+import re
+
+# Terminal symbols in parser-table column order; "$" marks end of input.
+# Every token gets its index here as an interned integer ID when it is made.
+TERMINALS = (".", "let", "id", "be", "int", "set", "U", "+", "-", "I", "*", "num", "(", ")",
+             "{", "}", ":", "|", "&", "!", "<", ">", "=", "@", "show", "$", "simplify")
+TERMINAL_IDS = {terminal: symbol for symbol, terminal in enumerate(TERMINALS)}
+
+class LexicalError(ValueError):
+    """
+    Raised by Lexer.iter_tokens() once the error has been reported, so a
+    consumer pulling tokens can tell it apart from its own failures.
+    """
+
+@contextmanager
+def paused_gc():
+    """
+    Pause the cyclic garbage collector while allocating many acyclic objects
+    (tokens, tree nodes); otherwise it keeps rescanning them as they pile up.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
 class Token:
     # Your implementation
+    __slots__ = ("token_type", "lexeme", "value", "symbol")
+
     def __init__(self, token_type: str, lexeme: str, value=None):
         """
         Initialize a token.
@@ -8,6 +42,7 @@ class Token:
         self.token_type = token_type
         self.lexeme = lexeme
         self.value = value
+        self.symbol = TERMINAL_IDS[token_type]  # integer ID used to index the parser tables
 
     def to_dict(self):
         """
@@ -15,6 +50,97 @@ class Token:
         """
         return {"token": self.token_type, "lexeme": self.lexeme}
 
+class TokenStream:
+    """
+    Columnar token stream: parallel arrays of terminal IDs and start/end
+    offsets into the source. Lexemes are sliced from the source only when
+    asked for, Token objects only when indexed.
+    """
+    __slots__ = ("source", "symbols", "starts", "ends", "overrides")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.symbols = array('H')  # terminal IDs, see TERMINALS
+        self.starts = array('I')
+        self.ends = array('I')
+        self.overrides = {}  # index -> lexeme replacing the source slice
+
+    def append(self, symbol: int, start: int, end: int):
+        self.symbols.append(symbol)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def token_type(self, index: int) -> str:
+        return TERMINALS[self.symbols[index]]
+
+    def lexeme(self, index: int) -> str:
+        lexeme = self.overrides.get(index) if self.overrides else None
+        return lexeme if lexeme is not None else self.source[self.starts[index]:self.ends[index]]
+
+    def replace(self, index: int, token_type: str, lexeme: str):
+        """
+        Change the type and lexeme of one token in place.
+        """
+        self.symbols[index] = TERMINAL_IDS[token_type]
+        self.overrides[index] = lexeme
+
+    def __getitem__(self, index: int) -> Token:
+        """
+        Materialize one token; numbers get their integer value.
+        """
+        if index < 0:
+            index += len(self.symbols)
+        token_type, lexeme = self.token_type(index), self.lexeme(index)
+        return Token(token_type=token_type, lexeme=lexeme, value=int(lexeme) if token_type == "num" else None)
+
+    def __iter__(self):
+        for index in range(len(self.symbols)):
+            yield self[index]
+
+    def write_json(self, file):
+        """
+        Write the tokens in the lexer_out.json format, byte-identical to
+        json.dump([token.to_dict() ...], file, ensure_ascii=False, indent=0),
+        without building the list of dictionaries.
+        """
+        if not self.symbols:
+            file.write("[]")
+            return
+        encode = json.encoder.encode_basestring  # the ensure_ascii=False string encoder
+        quoted_types = [encode(terminal) for terminal in TERMINALS]
+        separator = "[\n"
+        for index, symbol in enumerate(self.symbols):
+            file.write(TOKEN_JSON.format(separator, quoted_types[symbol], encode(self.lexeme(index))))
+            separator = ",\n"
+        file.write("\n]")
+
+# One lexer_out.json entry as json.dump(..., indent=0) lays it out: separator, token, lexeme
+TOKEN_JSON = '{}{{\n"token": {},\n"lexeme": {}\n}}'
+
+def write_tokens_json(tokens, file):
+    """
+    Pass tokens through while appending each one to file in the lexer_out.json
+    format, so the output is written as the tokens are produced. After a
+    LexicalError the file is rewritten as [] (what tokenize() returns).
+    :param tokens: iterable of Token, usually Lexer.iter_tokens().
+    """
+    encode = json.encoder.encode_basestring
+    separator = "[\n"
+    try:
+        for token in tokens:
+            file.write(TOKEN_JSON.format(separator, encode(token.token_type), encode(token.lexeme)))
+            separator = ",\n"
+            yield token
+    except LexicalError:
+        file.seek(0)
+        file.truncate()
+        file.write("[]")
+        raise
+    file.write("[]" if separator == "[\n" else "\n]")
+
 class Lexer:
     # Your implementation
     # This is only an example, you can modify it as you like
@@ -22,11 +148,19 @@ class Lexer:
     PUNCTUATIONS = {".", "(", ")", "{", "}", ":"}
     OPERATORS = {"+", "-", "*", "@", "<", ">","=", "&", "|", "!", "U", "I"}
     WHITESPACE = {" ","\n","\t"}  # Space is treated as a special character
+    # Master pattern: leading whitespace, then one group per token class
+    # (lowercase word, number, single-character operator/punctuation).
+    # A number starting with '0' is always the single digit "0", as in _process_number.
+    TOKEN_PATTERN = re.compile(r"[ \n\t]*(?:([a-z]+)|(0|[1-9][0-9]*)|([.(){}:+\-*@<>=&|!UI]))")
+    # Any character TOKEN_PATTERN cannot start a token with
+    INVALID_PATTERN = re.compile(r"[^ \n\ta-z0-9.(){}:+\-*@<>=&|!UI]")
+    MAX_NUMBER = 4294967295
 
     def __init__(self, source_code: str):
         self.source_code = source_code
         self.position = 0  # Current position in the source code
         self.symbol_table = {}  # Symbol table for variable names
+        self.error = None  # the LexicalError that stopped iter_tokens()
 
     def next_token(self) -> Token:
         """
@@ -122,18 +256,126 @@ class Lexer:
         return Token(token_type="num", lexeme=lexeme, value=value)
 
 
+    def _iter_scan(self):
+        """
+        Scan the source with TOKEN_PATTERN instead of dispatching on each
+        character, yielding tokens as they are matched. Only valid for ASCII
+        input, where [a-z] and [0-9] agree with str.islower() and str.isdigit().
+        """
+        source = self.source_code
+        # Every character before the first invalid one starts or continues a
+        # token, so finditer() never skips input up to that point.
+        invalid = self.INVALID_PATTERN.search(source)
+        end = invalid.start() if invalid else len(source)
+        keywords = self.KEYWORDS
+        symbol_table = self.symbol_table
+        for match in self.TOKEN_PATTERN.finditer(source, 0, end):
+            word, number, char = match.groups()
+            if char:
+                yield Token(token_type=char, lexeme=char)
+            elif word:
+                if word in keywords:
+                    yield Token(token_type=word, lexeme=word)
+                else:
+                    if word not in symbol_table:
+                        symbol_table[word] = {"type": None, "value": None}
+                    yield Token(token_type="id", lexeme=word)
+            else:
+                # more than ten digits can never be in range, skip the int() conversion
+                if len(number) > 10 or int(number) > self.MAX_NUMBER:
+                    self.position = match.start(2)
+                    raise ValueError(f"Lexical Error: Invalid number {number} at position {self.position}")
+                yield Token(token_type="num", lexeme=number, value=int(number))
+        self.position = end
+        if invalid:
+            raise ValueError(f"Lexical Error: Invalid character '{source[end]}' at position {end}")
+
+    def _scan(self) -> list[Token]:
+        """
+        Same scan as _iter_scan(), with findall() producing all matches in one
+        call; noticeably faster when the whole token list is wanted anyway.
+        :return: List of tokens.
+        """
+        source = self.source_code
+        invalid = self.INVALID_PATTERN.search(source)
+        end = invalid.start() if invalid else len(source)
+        keywords = self.KEYWORDS
+        symbol_table = self.symbol_table
+        tokens = []
+        append = tokens.append
+        for word, number, char in self.TOKEN_PATTERN.findall(source, 0, end):
+            if char:
+                append(Token(token_type=char, lexeme=char))
+            elif word:
+                if word in keywords:
+                    append(Token(token_type=word, lexeme=word))
+                else:
+                    append(Token(token_type="id", lexeme=word))
+                    if word not in symbol_table:
+                        symbol_table[word] = {"type": None, "value": None}
+            else:
+                if len(number) > 10 or int(number) > self.MAX_NUMBER:
+                    raise ValueError(f"Lexical Error: Invalid number {number}")
+                append(Token(token_type="num", lexeme=number, value=int(number)))
+        self.position = end
+        if invalid:
+            raise ValueError(f"Lexical Error: Invalid character '{source[end]}' at position {end}")
+        return tokens
+
+    def _scan_columns(self) -> TokenStream:
+        """
+        Same scan as _scan(), but fills a TokenStream instead of creating
+        Token objects.
+        :return: TokenStream over the source code.
+        """
+        source = self.source_code
+        invalid = self.INVALID_PATTERN.search(source)
+        end = invalid.start() if invalid else len(source)
+        keywords = self.KEYWORDS
+        symbol_table = self.symbol_table
+        id_symbol, num_symbol = TERMINAL_IDS["id"], TERMINAL_IDS["num"]
+        stream = TokenStream(source)
+        symbols, starts, ends = stream.symbols, stream.starts, stream.ends
+        for match in self.TOKEN_PATTERN.finditer(source, 0, end):
+            kind = match.lastindex
+            start, stop = match.span(kind)
+            lexeme = source[start:stop]
+            if kind == 1:
+                if lexeme in keywords:
+                    symbols.append(TERMINAL_IDS[lexeme])
+                else:
+                    symbols.append(id_symbol)
+                    if lexeme not in symbol_table:
+                        symbol_table[lexeme] = {"type": None, "value": None}
+            elif kind == 2:
+                if len(lexeme) > 10 or int(lexeme) > self.MAX_NUMBER:
+                    raise ValueError(f"Lexical Error: Invalid number {lexeme} at position {start}")
+                symbols.append(num_symbol)
+            else:
+                symbols.append(TERMINAL_IDS[lexeme])
+            starts.append(start)
+            ends.append(stop)
+        self.position = end
+        if invalid:
+            raise ValueError(f"Lexical Error: Invalid character '{source[end]}' at position {end}")
+        return stream
+
+    def _scan_by_char(self) -> list[Token]:
+        """
+        Character-by-character scan through next_token(), used for non-ASCII
+        input so Unicode letters and digits keep their str.isalpha()/isdigit() behaviour.
+        :return: List of tokens.
+        """
+        return list(self._iter_by_char())
+
     def tokenize(self) -> list[Token]:
         """
         Tokenize the entire source code. If an error occurs, stop parsing and return an empty list.
         :return: List of tokens or an empty list if an error occurs.
         """
         try:
-            tokens = []
-            while True:
-                token, _ = self.next_token()
-                if token is None:
-                    break
-                tokens.append(token)
+            with paused_gc():
+                tokens = self._scan() if self.source_code.isascii() else self._scan_by_char()
             print("Lexical Analysis Complete!") # Lexical Analysis Complete!
         except ValueError as e:
             # print(e)
@@ -141,6 +383,148 @@ class Lexer:
             tokens = []
         return tokens, self.symbol_table
 
+    def iter_tokens(self):
+        """
+        Generator version of tokenize(): yields tokens while scanning, so a
+        parser can pull them without the whole token list being built.
+        Reports "Lexical Analysis Complete!" / "Lexical Error!" like tokenize().
+        :raises LexicalError: after the error has been reported.
+        """
+        try:
+            yield from self._iter_source()
+        except ValueError as e:
+            print("Lexical Error!")
+            self.error = LexicalError(str(e))
+            raise self.error from e
+        print("Lexical Analysis Complete!")
+
+    def _iter_source(self):
+        """
+        Token generator behind iter_tokens(); raises ValueError on a lexical error.
+        """
+        if self.source_code.isascii():
+            yield from self._iter_scan()
+        else:
+            yield from self._iter_by_char()
+
+    def _iter_by_char(self):
+        """
+        next_token() from the current position to the end of the source.
+        """
+        while True:
+            token, _ = self.next_token()
+            if token is None:
+                break
+            yield token
+
+    def tokenize_columns(self) -> TokenStream:
+        """
+        Tokenize the entire source code into a columnar TokenStream, with the
+        same error handling as tokenize().
+        :return: (TokenStream, symbol table); the stream is empty if an error occurs.
+        """
+        try:
+            if self.source_code.isascii():
+                stream = self._scan_columns()
+            else:
+                # offsets of the per-character path: each lexeme ends where next_token() stops
+                stream = TokenStream(self.source_code)
+                while True:
+                    token, _ = self.next_token()
+                    if token is None:
+                        break
+                    stream.append(token.symbol, self.position - len(token.lexeme), self.position)
+            print("Lexical Analysis Complete!")
+        except ValueError as e:
+            print("Lexical Error!")
+            stream = TokenStream(self.source_code)
+        return stream, self.symbol_table
+
+
+class FileLexer(Lexer):
+    """
+    Lexer over a binary file, read as fixed-size byte chunks. Only the current
+    chunk and a token crossing its end are held at a time, never a decoded copy
+    of the whole file, so memory stays flat as the input grows.
+    """
+    CHUNK_SIZE = 1 << 20
+    # '\r' is whitespace here: text-mode reads turn '\r\n' and '\r' into '\n'
+    BYTES_TOKEN_PATTERN = re.compile(rb"[ \n\t\r]*(?:([a-z]+)|(0|[1-9][0-9]*)|([.(){}:+\-*@<>=&|!UI]))")
+    BYTES_INVALID_PATTERN = re.compile(rb"[^ \n\t\ra-z0-9.(){}:+\-*@<>=&|!UI]")
+    CHAR_LEXEMES = {c.encode(): c for c in ".(){}:+-*@<>=&|!UI"}
+
+    def __init__(self, file, chunk_size: int = CHUNK_SIZE):
+        """
+        :param file: file object opened in binary mode.
+        """
+        super().__init__("")
+        self.file = file
+        self.chunk_size = chunk_size
+
+    def tokenize(self) -> list[Token]:
+        try:
+            with paused_gc():
+                tokens = list(self.iter_tokens())
+        except LexicalError:
+            tokens = []
+        return tokens, self.symbol_table
+
+    def _iter_source(self):
+        """
+        Scan chunk by chunk. A token touching the end of a chunk may continue in
+        the next one, so it is carried over and matched again together with the
+        next chunk. Non-ASCII bytes hand the rest of the file to the
+        per-character path (see Lexer._scan_by_char()).
+        """
+        keywords, char_lexemes = self.KEYWORDS, self.CHAR_LEXEMES
+        symbol_table = self.symbol_table
+        carry = b""
+        base = 0  # file offset of carry[0]
+        while True:
+            chunk = self.file.read(self.chunk_size)
+            final = not chunk
+            buffer = carry + chunk if carry else chunk
+            invalid = self.BYTES_INVALID_PATTERN.search(buffer)
+            end = invalid.start() if invalid else len(buffer)
+            resume = 0  # where the next buffer has to start matching
+            for match in self.BYTES_TOKEN_PATTERN.finditer(buffer, 0, end):
+                if match.end() == end and (invalid and buffer[end] >= 0x80 or not final and not invalid):
+                    break  # may continue into the next chunk or a non-ASCII character
+                resume = match.end()
+                word, number, char = match.groups()
+                if char:
+                    lexeme = char_lexemes[char]
+                    yield Token(token_type=lexeme, lexeme=lexeme)
+                elif word:
+                    lexeme = word.decode("ascii")
+                    if lexeme in keywords:
+                        yield Token(token_type=lexeme, lexeme=lexeme)
+                    else:
+                        if lexeme not in symbol_table:
+                            symbol_table[lexeme] = {"type": None, "value": None}
+                        yield Token(token_type="id", lexeme=lexeme)
+                else:
+                    if len(number) > 10 or int(number) > self.MAX_NUMBER:
+                        self.position = base + match.start(2)
+                        raise ValueError(f"Lexical Error: Invalid number {number.decode()} at position {self.position}")
+                    lexeme = number.decode("ascii")
+                    yield Token(token_type="num", lexeme=lexeme, value=int(number))
+            if invalid:
+                self.position = base + end
+                if buffer[end] < 0x80:
+                    raise ValueError(f"Lexical Error: Invalid character '{chr(buffer[end])}' at position {self.position}")
+                # decode only the remainder, starting before the token next to the non-ASCII byte
+                rest = buffer[resume:] + self.file.read()
+                self.source_code = rest.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+                self.position = 0
+                yield from self._iter_by_char()
+                return
+            if final:
+                self.position = base + len(buffer)
+                return
+            carry = buffer[resume:]
+            base += resume
+
 
 if __name__ == '__main__':
 
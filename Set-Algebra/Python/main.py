@@ -1,8 +1,11 @@
 from __future__ import annotations
-from lexer import Lexer, Token
+from lexer import FileLexer, Token, TokenStream, TERMINAL_IDS, write_tokens_json
 from parser import Parser, SLRParserTable
+from syntax_tree import SyntaxTree
+import re
 import sys
 import json
+from contextlib import nullcontext
 
 # WARNING:
 # - You are not allowed to use any external libraries other than the standard library
@@ -11,16 +14,25 @@ import json
 #   The current directory will be the same directory as the entry file
 #   So please make sure your import statement is correct
 
+# What a program compiles to, in the order compile_program() writes them
+OUTPUT_NAMES = ("lexer_out.json", "parser_out.json", "typing_out.json", "evaluation_out.json")
+
+# The phases a program goes through, in order; compile_program() returns the one it failed in, or "ok"
+PHASES = ("lexical", "syntax", "semantic", "evaluation")
+
 def write_json_output(data, file_name):
     with open(file_name, 'w') as f:
                 f.write(data)
 
-def update_token_type(parse_tree: dict | list):
+def update_token_type(parse_tree: dict | list | SyntaxTree):
     # raise ValueError("Invalid parse tree format")
     """
     Traverse the parse tree and update the token_type of nodes where
     lexeme is 'simplify' but token_type is 'show'.
     """
+    if isinstance(parse_tree, SyntaxTree):
+        parse_tree.retoken("simplify", TERMINAL_IDS["show"], TERMINAL_IDS["simplify"])
+        return
     try:
         if isinstance(parse_tree, dict):
             if "token" in parse_tree and "lexeme" in parse_tree:
@@ -37,53 +49,151 @@ def update_token_type(parse_tree: dict | list):
     
 def check_simplify(tokens):
     flag=False 
+    if isinstance(tokens, TokenStream):
+        if "simplify" not in tokens.source:
+            return flag
+        for index in range(len(tokens)):
+            if "simplify" in tokens.lexeme(index):
+                tokens.replace(index, "show", "simplify")
+                flag=True
+        return flag
     for token in tokens:
         if "simplify" in token.lexeme:
             token.lexeme = "simplify"
             token.token_type = "show"
+            token.symbol = TERMINAL_IDS["show"]
             flag=True
     return flag    
 
-if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("Usage: python main.py <test_file>")
-        sys.exit(1)
-    file_name = sys.argv[1]
-    with open(file_name, 'r') as f:
-        # read file to string
-        source_code = f.read()
-        file_path = 'SLR Parsing Table.csv'
-        grammar_path = 'SLR Grammar.txt'
-
-    lexer = Lexer(source_code)
-    tokens,symbol_table = lexer.tokenize()
-    lexer_ouput = [token.to_dict() for token in tokens]
-    with open("lexer_out.json", "w", encoding="utf-8") as f:
-        json.dump(lexer_ouput, f, ensure_ascii=False, indent=0)
+def stream_simplify(tokens, found: list):
+    """
+    check_simplify() for a token generator: rewrites tokens as they pass
+    and appends every rewritten token to found.
+    """
+    for token in tokens:
+        if "simplify" in token.lexeme:
+            check_simplify([token])
+            found.append(token)
+        yield token
 
-    flag = check_simplify(tokens)
-    tokens.append(Token(token_type="$",lexeme="$",value="$"))
+def show_members(value, universe: str, first: int):
+    """
+    Print the members of a shown set within the universe 'LOW:HIGH', see
+    bitmap.materialize(): their number, the smallest and largest, and the
+    first few of them. A set that cannot be enumerated prints why instead.
+    """
+    from bitmap import materialize
+    low, high = map(int, universe.split(":"))
+    try:
+        members = materialize(value, low, high)
+    except Exception as e:  # any failure to evaluate the set, not only ValueError
+        print(f"Members: unknown, {str(e) or type(e).__name__}")
+        return
+    print(f"Members in [{low}, {high}): {len(members)}")
+    if len(members):
+        print(f"Min: {members.min()}, Max: {members.max()}")
+        print(f"First {first}: {', '.join(map(str, members.first(first)))}")
 
-    slr_table = SLRParserTable(file_path, grammar_path)
-    actions,goto,rules=slr_table.ACTION,slr_table.GOTO,slr_table.grammar
-    parser=Parser(tokens,actions, goto, rules)
+def compile_program(source, slr_table: SLRParserTable, open_output, jobs: int = 1,
+                    universe: str = None, first: int = 10, outputs: tuple = OUTPUT_NAMES, lazy: bool = False) -> str:
+    """
+    Run one program through the lexer and the parser and write the four
+    outputs, OUTPUT_NAMES, each to the file open_output(name) returns, as a
+    context manager; the messages of each phase go to stdout.
+    :param source: the program, a file object opened in binary mode.
+    :param outputs: the outputs to write, the others are not produced.
+    :param lazy: evaluate only what 'show' depends on, see Parser.build_tree().
+    :return: the phase of PHASES the program failed in, "ok" if none.
+    """
+    # The source is read in byte chunks instead of one decoded string.
+    # The parser pulls tokens straight from the lexer; each token is written
+    # to lexer_out.json on its way through, and the end of input reads as '$'.
+    # One pass over the SLR automaton builds all three trees.
+    simplified = []
+    with open_output("lexer_out.json") if "lexer_out.json" in outputs else nullcontext() as f:
+        lexer = FileLexer(source)
+        tokens = lexer.iter_tokens() if f is None else write_tokens_json(lexer.iter_tokens(), f)
+        tokens = stream_simplify(tokens, simplified)
+        parser=Parser(tokens, slr_table)
+        # one arena holds the parse tree with its types and values
+        tree = parser.build_tree(jobs, lazy)
+    if universe is not None and tree.evaluated:
+        show_members(tree.values[tree.root], universe, first)
+    flag = bool(simplified)
+    if flag:
+        update_token_type(tree)
 
+    for name, view in zip(OUTPUT_NAMES[1:], ("parse", "typing", "evaluation")):
+        if name not in outputs:
+            continue
+        with open_output(name) as f:
+            tree.write_json(f, view)
+    if lexer.error is not None:
+        return "lexical"
+    return "syntax" if tree.root < 0 else "semantic" if not tree.typed else "evaluation" if not tree.evaluated else "ok"
 
-    parse_tree=parser.parse()
-    if flag:
-        update_token_type(parse_tree)
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    # --jobs N: evaluate independent declarations on N processes, same output
+    # --universe LOW:HIGH: also enumerate the members of a shown set, the first K of them (--first K)
+    # --batch SPEC: compile every program of a directory, glob or multi-program file
+    #               in this process, into --out DIR or --jsonl FILE (see batch.py),
+    #               or on N processes with --workers N
+    # --cache DIR: look every program up in a compile cache kept in DIR (see cache.py);
+    #              batches always have the in-process layer of one
+    # --lazy: evaluate through the bytecode VM, only the declarations 'show' depends on, and
+    #         print the ones pruned; evaluation_out.json then has values at the leaves and the root only
+    options = {"--jobs": "1", "--universe": None, "--first": "10", "--batch": None, "--out": None, "--jsonl": None,
+               "--workers": "1", "--cache": None}
+    lazy = False
+    while arguments and (arguments[0] == "--lazy" or len(arguments) >= 2 and arguments[0] in options):
+        if arguments[0] == "--lazy":
+            lazy, arguments = True, arguments[1:]
+            continue
+        options[arguments[0]] = arguments[1]
+        arguments = arguments[2:]
+    universe, batch = options["--universe"], options["--batch"]
+    if batch is None:
+        valid = len(arguments) == 1 and options["--out"] is None and options["--jsonl"] is None \
+            and options["--workers"] == "1"
+    else:
+        valid = not arguments and (options["--out"] is None) != (options["--jsonl"] is None) \
+            and options["--workers"].isdigit() and (options["--workers"] in ("0", "1") or options["--jobs"] == "1")
+    if not valid or not options["--jobs"].isdigit() or not options["--first"].isdigit() \
+            or universe is not None and not re.fullmatch(r"-?[0-9]+:-?[0-9]+", universe) \
+            or lazy and options["--jobs"] not in ("0", "1"):
+        print("Usage: python main.py [--jobs N | --lazy] [--universe LOW:HIGH [--first K]] [--cache DIR] <test_file>")
+        print("       python main.py --batch <directory|glob|file> (--out DIR | --jsonl FILE) [--workers N] [options]")
+        sys.exit(1)
+    jobs, first = int(options["--jobs"]), int(options["--first"])
+    file_path = 'SLR Parsing Table.csv'
+    grammar_path = 'SLR Grammar.txt'
 
-    with open("parser_out.json", "w", encoding="utf-8") as f:
-        json.dump(parse_tree, f, ensure_ascii=False, indent=0)
-    typeing_tree =parser.typecheck()
-    if flag:
-        update_token_type(typeing_tree)
-    with open("typing_out.json", "w", encoding="utf-8") as f:
-        json.dump(typeing_tree, f, ensure_ascii=False, indent=0)
-    evaluation_tree = parser.evaluate()
-    if flag:
-        update_token_type(evaluation_tree)
-    with open("evaluation_out.json", "w", encoding="utf-8") as f:
-        json.dump(evaluation_tree, f, ensure_ascii=False, indent=0)
+    slr_table = SLRParserTable.load(file_path, grammar_path)
+    if batch is not None:
+        from batch import DirectoryOutput, JsonlOutput, run_batch
+        from cache import CompileCache
+        output = DirectoryOutput(options["--out"]) if options["--out"] is not None else JsonlOutput(options["--jsonl"])
+        cache = CompileCache(options["--cache"], (file_path, grammar_path))
+        run_batch(batch, slr_table, output, jobs, universe, first, int(options["--workers"]), (file_path, grammar_path),
+                  cache, lazy)
+        sys.exit(0)
+    file_name = arguments[0]
+    if options["--cache"] is not None:
+        from batch import compile_source
+        from cache import CompileCache
+        with open(file_name, 'rb') as source:
+            result = compile_source(source.read(), slr_table, jobs, universe, first,
+                                    cache=CompileCache(options["--cache"], (file_path, grammar_path)), lazy=lazy)
+        sys.stdout.write(result["stdout"])
+        for name in OUTPUT_NAMES:
+            with open(name, "w", encoding="utf-8") as f:
+                f.write(result[name])
+        if result["status"].startswith("crash"):
+            print(result["status"], file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+    with open(file_name, 'rb') as source:
+        compile_program(source, slr_table, lambda name: open(name, "w", encoding="utf-8"), jobs, universe, first,
+                        lazy=lazy)
     # print(parser.symbol_table)
-
@@ -0,0 +1,238 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from expression import Rope, Expr
+from interval import IntervalSet
+from lexer import TERMINAL_IDS
+from predicate import SetValue
+from syntax_tree import SyntaxTree, NodeView
+
+# The evaluation errors, as Parser.build_tree() catches them
+EVALUATION_ERRORS = (SyntaxError, TypeError, ValueError)
+
+ID = TERMINAL_IDS["id"]
+
+# Outcome of a declaration's job
+DONE, FAILED, LOCAL = "done", "failed", "local"
+
+
+class Declaration:
+    """
+    A 'let T id be E .' of the tree: its identifier, the arena range of its
+    E subtree (a subtree is contiguous, its nodes are added between its first
+    shift and its reduction) and the declarations whose values it reads.
+    """
+    __slots__ = ("name", "first", "last", "dependencies", "status", "error")
+
+    def __init__(self, name: str, first: int, last: int, dependencies: set[int]):
+        self.name = name
+        self.first = first
+        self.last = last
+        self.dependencies = dependencies
+        self.status = None
+        self.error = None
+
+
+def declarations(tree: SyntaxTree) -> list[Declaration]:
+    """
+    The declarations of a tree in program order, with the dependency graph
+    between them: an identifier in E reads the last declaration of that name
+    before it, as the symbol table has it when E is evaluated.
+    """
+    symbol_names, tokens, first_child, next_sibling = tree.symbol_names, tree.tokens, tree.first_child, tree.next_sibling
+    found, latest = [], {}
+    for node in range(len(tree)):
+        if tokens[node] >= 0 or symbol_names[tree.symbols[node]] != "D":
+            continue
+        children = tree.children(node)
+        expression = children[4]
+        first = expression
+        while first_child[first] != -1:
+            first = first_child[first]
+        dependencies = set()
+        for inner in range(first, expression + 1):
+            # E'' -> id
+            child = first_child[inner]
+            if tokens[inner] < 0 and child != -1 and next_sibling[child] == -1 and tree.symbols[child] == ID:
+                name = tree.lexeme(child)
+                if name in latest:
+                    dependencies.add(latest[name])
+        name = tree.lexeme(children[2])
+        latest[name] = len(found)
+        found.append(Declaration(name, first, expression, dependencies))
+    return found
+
+
+def encode_values(values: list) -> tuple[list, list[int]]:
+    """
+    Flatten values for another process: every distinct object once, after the
+    pieces it refers to, so pickling never recurses through a deep Rope and a
+    DAG of shared Exprs stays one. Iterative.
+    :return: (table, the position of each value in it); a table entry is
+             ("v", plain value), ("rope" / "expr", piece positions) or ("set",
+             piece positions, interval bounds or None, variable, parts), with
+             the P node of a literal's parts as its arena index.
+    """
+    table, positions = [], {}
+
+    def references(value) -> list:
+        if not isinstance(value, Rope):
+            return []
+        refs = list(value.pieces)
+        if value.__class__ is SetValue and value.parts[:1] != ("{",):
+            refs += value.parts[1:]
+        return refs
+
+    for root in values:
+        pending = [(root, False)]
+        while pending:
+            value, expanded = pending.pop()
+            if id(value) in positions:
+                continue
+            refs = references(value)
+            if refs and not expanded:
+                pending.append((value, True))
+                pending.extend((ref, False) for ref in refs if id(ref) not in positions)
+                continue
+            if not isinstance(value, Rope):
+                entry = ("v", value)
+            else:
+                pieces = tuple(positions[id(piece)] for piece in value.pieces)
+                if value.__class__ is SetValue:
+                    intervals = None if value.intervals is None else value.intervals.bounds
+                    parts = value.parts
+                    if parts[:1] == ("{",):
+                        parts = ("{", parts[1].node)
+                    elif parts:
+                        parts = (parts[0], positions[id(parts[1])], positions[id(parts[2])])
+                    entry = ("set", pieces, intervals, value.variable, parts)
+                else:
+                    entry = ("expr" if isinstance(value, Expr) else "rope", pieces)
+            positions[id(value)] = len(table)
+            table.append(entry)
+    return table, [positions[id(value)] for value in values]
+
+
+def decode_values(table: list, roots: list[int], tree: SyntaxTree) -> list:
+    """
+    Inverse of encode_values(), with a literal's P node taken from tree;
+    Exprs are interned on the way, like any new value.
+    """
+    objects = []
+    for entry in table:
+        kind = entry[0]
+        if kind == "v":
+            objects.append(entry[1])
+            continue
+        pieces = tuple(objects[position] for position in entry[1])
+        if kind == "set":
+            _, _, bounds, variable, parts = entry
+            if parts[:1] == ("{",):
+                parts = ("{", NodeView(tree, parts[1]))
+            elif parts:
+                parts = (parts[0], objects[parts[1]], objects[parts[2]])
+            objects.append(SetValue(pieces, None if bounds is None else IntervalSet(bounds), variable, parts))
+        else:
+            objects.append(Expr(pieces) if kind == "expr" else Rope(pieces))
+    return [objects[position] for position in roots]
+
+
+# State of a worker process, set up once by _start_worker()
+_parser = _tree = None
+
+
+def _start_worker(table, tree: SyntaxTree, deferred: dict[int, int]):
+    global _parser, _tree
+    from parser import Parser
+    _parser, _tree = Parser([], table), tree
+    _parser.deferred = deferred
+
+
+def _evaluate_declaration(first: int, last: int, bindings: tuple[list, list[int]], names: list[str]):
+    """
+    Job of one declaration in a worker: evaluate the nodes of its E subtree
+    with the values it reads bound in the symbol table.
+    :return: (DONE, encoded values of the nodes first..last), (FAILED, the
+             evaluation error) or (LOCAL, None) when the values cannot be
+             sent back.
+    """
+    values = decode_values(*bindings, _tree)
+    _parser.symbol_table = {name: {"type": None, "value": value} for name, value in zip(names, values)}
+    shifted = _tree.values[first:last + 1]  # the leaves' values, for the next job
+    try:
+        _parser.evaluate_nodes(_tree, range(first, last + 1))
+        return DONE, encode_values(_tree.values[first:last + 1])
+    except EVALUATION_ERRORS as e:
+        return FAILED, e
+    except RecursionError:
+        return LOCAL, None
+    finally:
+        _tree.values[first:last + 1] = shifted
+
+
+def evaluate_parallel(parser, tree: SyntaxTree, jobs: int):
+    """
+    Evaluate a tree built with Parser._build_tree(..., evaluate=False): each
+    declaration is a job on a pool of jobs processes, submitted as soon as the
+    declarations it reads are done, and the results are merged into the
+    arena. The rest of the tree (the D reductions, which fill the parser's
+    symbol table, and the 'show') is then evaluated here in reduction order,
+    so values, symbol table and the error reported are those of the
+    sequential evaluation.
+    :raise SyntaxError, TypeError, ValueError: the first evaluation error in
+                                                program order.
+    """
+    found = declarations(tree)
+    values = tree.values
+    dependents = [[] for _ in found]
+    unfinished = [len(declaration.dependencies) for declaration in found]
+    for number, declaration in enumerate(found):
+        for dependency in declaration.dependencies:
+            dependents[dependency].append(number)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_start_worker,
+                             initargs=(parser.table, tree, parser.deferred)) as pool:
+        running = {}
+
+        def submit(number: int):
+            declaration = found[number]
+            dependencies = sorted(declaration.dependencies)
+            names = [found[dependency].name for dependency in dependencies]
+            bindings = encode_values([values[found[dependency].last] for dependency in dependencies])
+            running[pool.submit(_evaluate_declaration, declaration.first, declaration.last, bindings, names)] = number
+
+        for number, count in enumerate(unfinished):
+            if count == 0:
+                submit(number)
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                number = running.pop(future)
+                declaration = found[number]
+                declaration.status, result = future.result()
+                if declaration.status == DONE:
+                    values[declaration.first:declaration.last + 1] = decode_values(*result, tree)
+                    for dependent in dependents[number]:
+                        unfinished[dependent] -= 1
+                        if unfinished[dependent] == 0 and found[dependent].status is None:
+                            submit(dependent)
+                    continue
+                if declaration.status == FAILED:
+                    declaration.error = result
+                pending = list(dependents[number])
+                while pending:
+                    dependent = pending.pop()
+                    if found[dependent].status is None:
+                        found[dependent].status = LOCAL  # evaluated here, in order
+                        pending.extend(dependents[dependent])
+
+    def remaining():
+        node = 0
+        for declaration in found:
+            yield from range(node, declaration.first)
+            if declaration.status == FAILED:
+                raise declaration.error
+            if declaration.status == LOCAL:
+                yield from range(declaration.first, declaration.last + 1)
+            node = declaration.last + 1
+        yield from range(node, len(tree))
+
+    parser.evaluate_nodes(tree, remaining())
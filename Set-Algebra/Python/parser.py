@@ -1,14 +1,38 @@
 from __future__ import annotations
-from lexer import Token, Lexer
+from array import array
+from collections.abc import Iterator
+import marshal
+import os
+from lexer import Token, TokenStream, Lexer, LexicalError, TERMINALS, TERMINAL_IDS
+from syntax_tree import SyntaxTree, NodeView
+from predicate import SetValue
+from simplify import Simplifier
+from expression import Rope, join
+import re
+
+# Action kinds packed in the low two bits of a dense ACTION entry,
+# the target state / production number lives in the remaining bits.
+ERROR, SHIFT, REDUCE, ACCEPT = 0, 1, 2, 3
+
+# Text rewriting of Parser.evaluate_predicate(), the fallback for predicates without a compiled test
+WHITESPACE = re.compile(r"\s+")
+SET_BUILDER = re.compile(r"\{(\w+):(.+)\}")
+EQUALS = re.compile(r"(?<![=!<>])=(?![=!<>])")
+GLUED_OPERATOR = re.compile(r"(\d)(or|and|not)(\d)")
 
 class Parser:
-    def __init__(self, tokens: list[Token], actions: dict, goto: dict, rules: dict):
+    def __init__(self, tokens: list[Token] | TokenStream | Iterator[Token], table: SLRParserTable):
         self.tokens = tokens
         self.index = 0
         self.stack = []
-        self.actions = actions
-        self.goto = goto
-        self.rules = rules
+        self.actions = table.ACTION
+        self.goto = table.GOTO
+        self.rules = table.grammar
+        self.width = table.n_symbols  # row stride of the ACTION/GOTO arrays
+        self.eof = TERMINAL_IDS["$"]
+        self.symbol_names = table.symbols
+        self.table = table
+        self.tree = None
         self.symbol_table = {}
         self.typing_rules = {
             "S':S": lambda S: S["type"],
@@ -27,7 +51,7 @@ class Parser:
             "E':E' I E''": lambda E_prime, _,E_double_prime: "set" if E_prime["type"] == "set" and E_double_prime["type"] == "set" else "type_error",
             "E':E' * E''": lambda E_prime, _,E_double_prime: "integer" if E_prime["type"] == "integer" and E_double_prime["type"] == "integer" else "type_error",
             "E'':num": lambda _: "integer",
-            "E'':id": lambda id: self.lookup_type(id),
+            "E'':id": lambda id: self.lookup_type(id["lexeme"]),
             "E'':( E )": lambda _,E,x: E["type"],
             "E'':{ Z P }": lambda _,Z, P,x: "set" if P["type"] == "predicate" else "type_error",
             "Z:id :": lambda id,_: ("void", self.add_type(id, "integer"))[0],
@@ -46,79 +70,89 @@ class Parser:
             "A:E": lambda E: "calculation" if E["type"] != "type_error" else "type_error",
             "A:P": lambda P: "calculation" if P["type"] != "type_error" else "type_error",
         }
-        self.evaluation_rules = {
-            "S':S": lambda S: S["value"],
-            "S:D' C .": lambda D_prime, C, _: C["value"],
-            "S:C .": lambda C, _: C["value"],
-            "D':D D'": lambda D, D_prime_2: D_prime_2["value"],
-            "D':D": lambda D: D["value"],
-            "D:let T id be E .": lambda let, T, id, be, E, _: "void",
-            "T:int": lambda _: "void",
-            "T:set": lambda _: "void",
-            "E:E'": lambda E_prime: E_prime["value"],
-            "E:E U E'": lambda E, _, E_prime: f"({E['value']} U {E_prime['value']})",
-            "E:E + E'": lambda E, _, E_prime: str(int(E["value"]) + int(E_prime["value"])),
-            "E:E - E'": lambda E, _, E_prime: str(int(E["value"]) - int(E_prime["value"])),   
-            "E':E''": lambda E_double_prime: E_double_prime["value"],
-            "E':E' I E''": lambda E_prime, _, E_double_prime: f"{E_prime['value']} I {E_double_prime['value']}",
-            "E':E' * E''": lambda E_prime, _, E_double_prime: str(int(E_prime["value"]) * int(E_double_prime["value"])),
-            "E'':num": lambda num: num["lexeme"],
-            "E'':id": lambda id: self.symbol_table.get(id["lexeme"], {}).get("value", None) or id["lexeme"],
-            "E'':( E )": lambda _, E, x: f'( {E["value"]} )',
-            "E'':{ Z P }": lambda _, Z, P, x: f"{{ {Z['value']}: {P['value']} }}",
-            "Z:id :": lambda id, _: id["lexeme"], 
-            "P:P | P'": lambda P, _, P_prime: f"({P['value']} | {P_prime['value']})",
-            "P:P'": lambda P_prime: P_prime["value"],
-            "P':P' & P''": lambda P_prime, _, P_double_prime: f"({P_prime['value']} & {P_double_prime['value']})",
-            "P':P''": lambda P_double_prime: P_double_prime["value"],
-            "P'':R": lambda R: R["value"],
-            "P'':( P )": lambda _, P, x: f'( {P["value"]} )',
-            "P'':! R": lambda _, R: f'! {R["value"]}',
-            "R:E < E": lambda E1, _, E2: f"{E1['value']} < {E2['value']}",
-            "R:E > E": lambda E1, _, E2: f"{E1['value']} > {E2['value']}",
-            "R:E = E": lambda E1, _, E2: f"{E1['value']} = {E2['value']}",
-            "R:E @ E": lambda E1, _, E2: f"{E1['value']} @ {E2['value']}",
-            "C:show A": lambda _, A: A["value"],
-            "A:E": lambda E: str(E["value"]),
-            "A:P": lambda P: "true" if eval(P["value"]) else "false",
-        }
         self.new_evaluation_rules = {
             "S':S": lambda S: S["value"],
             "S:D' C .": lambda D_prime, C, _: C["value"],
             "S:C .": lambda C, _: C["value"],
             "D':D D'": lambda D, D_prime_2: D_prime_2["value"],
             "D':D": lambda D: D["value"],
-            "D:let T id be E .": lambda let, T, id, be, E, _: "void",
+            "D:let T id be E .": lambda let, T, id, be, E, _: ("void", self.assign_value(id, E["value"]))[0],
             "T:int": lambda _: "void",
             "T:set": lambda _: "void",
             "E:E'": lambda E_prime: E_prime["value"],
-            "E:E U E'": lambda E, _, E_prime: f"{E['value']} U {E_prime['value']}",
-            "E:E + E'": lambda E, _, E_prime: str(int(E["value"]) + int(E_prime["value"])),
-            "E:E - E'": lambda E, _, E_prime: str(int(E["value"]) - int(E_prime["value"])),   
+            "E:E U E'": lambda E, _, E_prime: SetValue.combine(E['value'], E_prime['value'], "U"),
+            # integers are ints, folded at each reduction; int() only turns an
+            # ill-typed operand into the ValueError it raised on its text
+            "E:E + E'": lambda E, _, E_prime: int(E["value"]) + int(E_prime["value"]),
+            "E:E - E'": lambda E, _, E_prime: int(E["value"]) - int(E_prime["value"]),
             "E':E''": lambda E_double_prime: E_double_prime["value"],
-            "E':E' I E''": lambda E_prime, _, E_double_prime: f"{E_prime['value']} I {E_double_prime['value']}",
-            "E':E' * E''": lambda E_prime, _, E_double_prime: str(int(E_prime["value"]) * int(E_double_prime["value"])),
-            "E'':num": lambda num: num["lexeme"],
-            "E'':id": lambda id: self.symbol_table.get(id["lexeme"], {}).get("value", None) or id["lexeme"],
-            "E'':( E )": lambda _, E, x: f'{E["value"]}',
-            "E'':{ Z P }": lambda _, Z, P, x: f"{{ {Z['value']}: {P['value']} }}",
+            "E':E' I E''": lambda E_prime, _, E_double_prime: SetValue.combine(E_prime['value'], E_double_prime['value'], "I"),
+            "E':E' * E''": lambda E_prime, _, E_double_prime: int(E_prime["value"]) * int(E_double_prime["value"]),
+            "E'':num": lambda num: int(num["lexeme"]),
+            "E'':id": lambda id: self.lookup_value(id["lexeme"]),
+            "E'':( E )": lambda _, E, x: E["value"],  # as is, a SetValue keeps its interval set
+            "E'':{ Z P }": lambda _, Z, P, x: SetValue.literal(Z['value'], P),
             "Z:id :": lambda id, _: id["lexeme"], 
             "P'':R": lambda R: (R["value"], R["bool"]),
-            "P'':( P )": lambda _, P, x: f'{P["value"]}',
-            "P'':! R": lambda _, R: f'! {R["value"]}',
-            "P:P | P'": lambda P, _, P_prime: (f"({P['value']} | {P_prime['value']})", P["bool"] or P_prime["bool"]),
-            "P':P' & P''": lambda P_prime, _, P_double_prime: (f"({P_prime['value']} & {P_double_prime['value']})", P_prime["bool"] and P_double_prime["bool"]),
+            "P'':( P )": lambda _, P, x: P["value"],
+            "P'':! R": lambda _, R: join("! ", R["value"]),
+            "P:P | P'": lambda P, _, P_prime: (join("(", P['value'], " | ", P_prime['value'], ")"), P["bool"] or P_prime["bool"]),
+            "P':P' & P''": lambda P_prime, _, P_double_prime: (join("(", P_prime['value'], " & ", P_double_prime['value'], ")"), P_prime["bool"] and P_double_prime["bool"]),
             "P:P'": lambda P_prime: (P_prime["value"], P_prime["bool"]),
             "P':P''": lambda P_double_prime: (P_double_prime["value"], P_double_prime["bool"]),
-            "R:E < E": lambda E1, _, E2: (f"{E1['value']} < {E2['value']}", E1["value"]<E2["value"]),
-            "R:E > E": lambda E1, _, E2: (f"{E1['value']} > {E2['value']}", E1["value"]> E2["value"]),
-            "R:E = E": lambda E1, _, E2: (f"{E1['value']} = {E2['value']}", E1["value"]== E2["value"]),
-            "R:E @ E": lambda E1, _, E2: (f"{E1['value']} @ {E2['value']}", self.evaluate_predicate(E1["value"], E2["value"])),
-            "C:show A": lambda _, A: A["value"],
-            "A:E": lambda E: str(E["value"]),
+            "R:E < E": lambda E1, _, E2: (join(E1['value'], " < ", E2['value']), self.compare(E1["value"], "<", E2["value"])),
+            "R:E > E": lambda E1, _, E2: (join(E1['value'], " > ", E2['value']), self.compare(E1["value"], ">", E2["value"])),
+            "R:E = E": lambda E1, _, E2: (join(E1['value'], " = ", E2['value']), self.compare(E1["value"], "=", E2["value"])),
+            "R:E @ E": lambda E1, _, E2: (join(E1['value'], " @ ", E2['value']), self.is_member(E1["value"], E2["value"])),
+            "C:show A": lambda show, A: self.simplify(A["value"]) if show["lexeme"] == "simplify" else A["value"],
+            "A:E": lambda E: E["value"] if isinstance(E["value"], (str, Rope)) else str(E["value"]),  # a Rope is printed lazily
             "A:P": lambda P: ("true" if P['bool'] else "false", P['bool']),
         }
+        # production number -> (LHS symbol ID, RHS length, typing rule, evaluation rule, rule key);
+        # a rule is None when the production has none
+        self.reductions = [(lhs, length, self.typing_rules.get(key), self.new_evaluation_rules.get(key), key)
+                           for lhs, length, key in table.reductions]
+        # arena node -> production number, of the reductions _build_tree() left unevaluated
+        self.deferred = {}
     
+    def is_member(self, element, set_value):
+        """
+        element @ set_value: a binary search in the set's intervals when both
+        sides allow it, otherwise evaluate_predicate() on the texts.
+        """
+        intervals = getattr(set_value, "intervals", None)
+        if intervals is not None and element.__class__ is int:
+            return element in intervals
+        return self.evaluate_predicate(str(element), str(set_value))
+
+    def compare(self, left, operator: str, right) -> bool:
+        """
+        Truth of the relation 'left operator right' for "<", ">" or "=":
+        integers compare as numbers, anything else (an operand of an
+        ill-typed program, such as a set or an unbound name) by its text.
+        """
+        if left.__class__ is not int or right.__class__ is not int:
+            left, right = str(left), str(right)
+        return left < right if operator == "<" else left > right if operator == ">" else left == right
+
+    def lookup_value(self, name: str):
+        """
+        Value of an identifier in an expression: its declared value, or the
+        name itself while it has none (the bound variable of a set literal).
+        """
+        value = self.symbol_table.get(name, {}).get("value")
+        return name if value is None else value
+
+    def simplify(self, value):
+        """
+        Value of 'simplify A' (check_simplify() in main.py hands it to the
+        grammar as a 'show' spelled 'simplify'): a set in its canonical
+        compact form, anything else as 'show' prints it.
+        """
+        if isinstance(value, SetValue):
+            return Simplifier().simplify(value)
+        return value
+
     def evaluate_predicate(self,element, predicate_expression):
         """
         动态解析并计算谓词表达式，支持不定长度的逻辑条件。
@@ -126,18 +160,17 @@ class Parser:
         :param predicate_expression: 谓词表达式，例如 `{a: ((a > 0 | a < 10) & (a > 100)) | a > 9}`
         :return: 布尔值，判断结果
         """
-        import re
-        predicate_expression = re.sub(r"\s+", "", predicate_expression).strip()
-        match = re.match(r"\{(\w+):(.+)\}", predicate_expression)
+        predicate_expression = WHITESPACE.sub("", predicate_expression).strip()
+        match = SET_BUILDER.match(predicate_expression)
         if not match:
             raise ValueError(f"Invalid predicate expression: {predicate_expression}")
 
         variable, predicate = match.groups()
 
-        predicate = re.sub(r"(?<![=!<>])=(?![=!<>])", "==", predicate)
+        predicate = EQUALS.sub("==", predicate)
         predicate = predicate.replace("|", " or ").replace("&", " and ").replace("!", " not ")
 
-        predicate = re.sub(r"(\d)(or|and|not)(\d)", r"\1 \2 \3", predicate)
+        predicate = GLUED_OPERATOR.sub(r"\1 \2 \3", predicate)
 
         try:
             local_namespace = {}
@@ -168,10 +201,21 @@ class Parser:
         #     raise ValueError(f"Variable '{id_name}' is already declared.")
         # 添加到符号表
         
-        self.symbol_table[id_name] = {"type": type, "value": None}
+        # 保留已有的值（融合模式下求值结果与类型写入同一个符号表）
+        entry = self.symbol_table.get(id_name)
+        self.symbol_table[id_name] = {"type": type, "value": entry["value"] if entry else None}
         # print(f"Added variable '{id_name}' with type '{type}' to symbol table.")
         return "void"
 
+    def assign_value(self, id, value):
+        """
+        Record the value of a declared identifier in the symbol table,
+        keeping the type typing has stored there.
+        """
+        entry = self.symbol_table.setdefault(id["lexeme"], {"type": None, "value": None})
+        entry["value"] = value
+        return "void"
+
     def lookup_type(self, identifier):
         """
         查找标识符的类型，支持传入字典或字符串作为标识符。
@@ -213,237 +257,216 @@ class Parser:
         
         return symbol_type
 
-    def parse(self):
-        self.stack.append((0, None))  
-        current_token = self.tokens[self.index] if self.index < len(self.tokens) else None
-        parse_tree = None
-        while True:
-            state = self.stack[-1][0]  
-            action, value = self.actions.get((state, current_token.token_type if current_token else "$"), (None, None))
-            # print(f"Current state: {state}, Current token: {current_token.lexeme if current_token else 'EOF'}, Action: {action}, Value: {value}")
+    def build_tree(self, jobs: int = 1, lazy: bool = False) -> SyntaxTree:
+        """
+        Fused driver: runs the SLR automaton once and builds one arena
+        SyntaxTree, with the type and value attributes written into its nodes
+        at each reduction, instead of replaying the token list once per phase
+        and building a tree in each (see benchmark.three_pass()).
+        A failing phase stops itself and every later phase, earlier phases
+        still run to completion (see SyntaxTree.root / typed / evaluated).
+        The tokens may be a list, a TokenStream or a generator such as
+        Lexer.iter_tokens(); a generator is pulled one token at a time, so
+        lexing and parsing overlap and no token list is kept.
+        :param jobs: above 1, evaluation is left out of the LR pass and the
+                     declarations are evaluated on that many processes
+                     afterwards, see parallel.evaluate_parallel().
+        :param lazy: evaluation is left out of the LR pass and the value of the
+                     program is computed by its bytecode instead, which only
+                     runs the declarations 'show' depends on (see
+                     bytecode.compile_tree()); the non-terminals below the root
+                     keep no value. The declarations it pruned are printed
+                     after the final value.
+        """
+        tokens = self.tokens
+        if isinstance(tokens, TokenStream):
+            # read the token columns directly, without materializing Token objects
+            pairs = zip(tokens.symbols, map(tokens.lexeme, range(len(tokens))))
+        else:
+            pairs = ((token.symbol, token.lexeme) for token in tokens)
+        try:
+            tree = self._build_tree(pairs, jobs <= 1 and not lazy)
+        except LexicalError:
+            # the lexer already reported it; tokenize() would have returned no tokens
+            return self._build_tree(iter(()))
+        if lazy and tree.typed:
+            self._evaluate_lazily(tree)
+        elif jobs > 1 and tree.typed:
+            from parallel import evaluate_parallel
             try:
-                if action is None:
-                    raise ValueError(f"Syntax Error: Unexpected token '{current_token.lexeme if current_token else 'EOF'}' at state {state}. Stack: {self.stack}")
-                if action == "s":
-                    leaf_node = {"token": current_token.token_type, "lexeme": current_token.lexeme}
-                    self.stack.append((value, leaf_node))  
-                    self.index += 1  
-                    current_token = self.tokens[self.index] if self.index < len(self.tokens) else None
-                elif action == "r":  
-                    lhs, _, rhs_length = self.rules[value]['non-terminal'], self.rules[value]['productions'], self.rules[value]['length']
-                    # print(f"Current state: {state}, LHS: {lhs}")
-                    children = []  
-                    for _ in range(rhs_length):
-                        _, child_node = self.stack.pop()
-                        children.insert(0, child_node)  
-                    subtree = {"name": lhs, "children": children}
-                    state = self.stack[-1][0]  
-                    self.stack.append((self.goto[(state, lhs)], subtree))  
-                elif action == "acc":  
-                    print("Syntactic Analysis Complete!")
-                    _, parse_tree = self.stack[-1]  
-                    break  
-            except ValueError as e:
-                print("Syntax Error!")
-                print(e)
-                json_output = []
-                with open('parser_out.json', 'w') as f:
-                    f.write(str(json_output))
-                return None 
-        return parse_tree  
-    
-    def typecheck(self):
-        self.index = 0
-        self.stack = [(0, None)] 
-        current_token = self.tokens[self.index] if self.index < len(self.tokens) else None
-        typecheck_tree = None
+                evaluate_parallel(self, tree, jobs)
+            except (SyntaxError, TypeError, ValueError) as e:
+                self._report_evaluation(tree, e)
+            else:
+                self._report_evaluation(tree, None)
+        return tree
 
-        while True:
-            state = self.stack[-1][0] 
-            action, value = self.actions.get(
-                (state, current_token.token_type if current_token else "$"), (None, None)
-            )
-            try:
-                if action is None:
-                    raise SyntaxError(f"Syntax Error: Unexpected token '{current_token.lexeme}' at state {state}.")
-                if action == "s": 
-                    token_type = "void"  
-                    if current_token.token_type == "num":
-                        token_type = "integer"   
-                    if token_type == "type_error":
-                        raise TypeError(f"Type Error: Invalid type for token '{current_token.lexeme}'.")
-                    leaf_node = {
-                        "token": current_token.token_type,
-                        "lexeme": current_token.lexeme,
-                        "type": token_type,
-                    }
-                    self.stack.append((value, leaf_node))
-                    self.index += 1
-                    current_token = self.tokens[self.index] if self.index < len(self.tokens) else None
-
-                elif action == "r": 
-                    lhs, productions, rhs_length = (
-                        self.rules[value]["non-terminal"],
-                        self.rules[value]["productions"],
-                        self.rules[value]["length"],
-                    )
-
-                    key = f"{lhs}:{productions}"  # 类型规则的键
-                    type_children = []  # 用于存储子节点的类型信息
-                    for _ in range(rhs_length):
-                        _, child_node = self.stack.pop()
-                        type_children.insert(0, child_node)
-                        # type_children.insert(0, {"type": child_node.get("type", "void")})  # 获取子节点类型
-                    # print(key, type_children)   
-                    # print(f"Current state: {state}, LHS: {lhs}")
-                    # print("=====================================")
-                    # print(key)
-                    if key in self.typing_rules:
-                        type_result = self.typing_rules[key](*type_children)  # 应用类型规则
-                        # print child node type
-                        # print(type_children)
-                        # if type_result == "type_error":
-                        #     raise TypeError(f"Type Error: Typing rule for {key} failed.")
-                    else:
-                        raise TypeError(f"Typing rule for {key} not defined.")
-
-                    subtree = {
-                        "name": lhs,
-                        "type": type_result,  # 在语法树中附加父节点的类型信息
-                        "children": type_children,
-                    }
-                    state = self.stack[-1][0]
-                    self.stack.append((self.goto[(state, lhs)], subtree))
-
-                elif action == "acc":  # 接受
-                    print("Semantic Analysis Complete!")
-                    _, typecheck_tree = self.stack[-1]
-                    break
-            except (SyntaxError, TypeError) as e:
-                print("Semantic Error!")
-                print(e)
-                json_output = []
-                with open('typing_out.json', 'w') as f:
-                    f.write(str(json_output))
-                return []
-        return typecheck_tree
-
-    def remove_bool_attributes(self,node):
-        """
-        递归地遍历树并删除所有的 'bool' 属性。
-        :param node: 当前节点，可能是一个字典或列表。
-        :return: 去除了 'bool' 属性的节点。
-        """
-        if isinstance(node, dict):
-            # 如果是字典，删除 'bool' 键，并递归处理其值
-            node.pop('bool', None)  # 删除 'bool' 属性
-            for key in node:
-                node[key] = self.remove_bool_attributes(node[key])
-        elif isinstance(node, list):
-            # 如果是列表，递归处理每个元素
-            node = [self.remove_bool_attributes(child) for child in node]
-        return node
-    
-    def evaluate(self):
+    def evaluate_nodes(self, tree: SyntaxTree, nodes: Iterator[int]):
+        """
+        Apply the evaluation rules to nodes of a tree built without them, as
+        the LR pass would at their reductions: a non-terminal is added to the
+        arena after its children, so increasing node order is reduction order.
+        Leaves are skipped, they got their values when shifted.
+        :param nodes: increasing node indices, a child before its parent.
+        :raise SyntaxError, TypeError, ValueError: what the rules raise.
+        """
+        tokens, values, first_child, next_sibling = tree.tokens, tree.values, tree.first_child, tree.next_sibling
+        reductions, deferred = self.reductions, self.deferred
+        bools = {}  # 'bool' of the evaluated non-terminals, what their parents' rules read
+        for node in nodes:
+            if tokens[node] >= 0:
+                continue
+            children, child = [], first_child[node]
+            while child != -1:
+                children.append(child)
+                child = next_sibling[child]
+            _, _, _, evaluation_rule, key = reductions[deferred[node]]
+            if evaluation_rule is None:
+                raise TypeError(f"Typing rule for {key} not defined.")
+            value = evaluation_rule(*[NodeView(tree, child, bools.get(child)) for child in children])
+            bool_value = None
+            if isinstance(value, tuple):
+                value, bool_value = value
+            bools[node] = bool_value if isinstance(bool_value, bool) else "undefined"
+            values[node] = value
+
+    def _evaluate_lazily(self, tree: SyntaxTree):
+        """
+        Evaluation of build_tree(lazy=True): run the pruned bytecode of the
+        tree, then print which declarations it left out.
+        """
+        from bytecode import compile_tree
+        program = compile_tree(tree, self)
+        try:
+            tree.values[tree.root] = program.run()
+        except (SyntaxError, TypeError, ValueError) as e:
+            self._report_evaluation(tree, e)
+        else:
+            self._report_evaluation(tree, None)
+        stats = program.stats
+        evaluated = f", evaluated {stats['evaluated']}" if tree.evaluated else ""  # counted when it completes
+        pruned = stats["pruned"]
+        print(f"Declarations: {stats['declarations']}{evaluated}, pruned {len(pruned)}"
+              + (f": {', '.join(pruned)}" if pruned else ""))
+
+    def _report_evaluation(self, tree: SyntaxTree, error: Exception | None):
+        """
+        End of the evaluation phase: mark the tree evaluated and print the
+        final value, or print the error that stopped it.
+        """
+        if error is not None:
+            print(f"Evaluation Error!", error)
+            return
+        tree.evaluated = True
+        print("Evaluation Analysis Complete!")
+        print(f"Final Value: {tree.values[tree.root]}")
+
+    def _build_tree(self, pairs: Iterator[tuple[int, str]], evaluate: bool = True) -> SyntaxTree:
+        """
+        LR loop of build_tree() over (terminal ID, lexeme) pairs; running out of
+        pairs reads as '$'. The stack is kept as two parallel lists, states and
+        NodeViews, so a reduction takes its children as one slice of the latter.
+        :param evaluate: False to stop after typing, leaving the values of the
+                         non-terminals to evaluate_nodes(); their productions
+                         are kept in self.deferred.
+        """
+        tree = self.tree = SyntaxTree(self.symbol_names)
+        void, integer = tree.type_code("void"), tree.type_code("integer")
+        num = TERMINAL_IDS["num"]
+        types, values, type_code = tree.types, tree.values, tree.type_code
+        actions, goto, width, reductions = self.actions, self.goto, self.width, self.reductions
+        states, nodes = [0], [None]
         self.index = 0
-        self.stack = [(0, None)] 
-        current_token = self.tokens[self.index] if self.index < len(self.tokens) else None
-        evaluate_tree = None
+        end = (self.eof, "$")
+        symbol, lexeme = next(pairs, end)
+        typing, evaluating = True, evaluate
+        deferred = self.deferred = {}
+        typing_error = evaluation_error = None
         while True:
-            state = self.stack[-1][0] 
-            action, value = self.actions.get(
-                (state, current_token.token_type if current_token else "$"), (None, None)
-            )
-            if action is None:
-                raise SyntaxError(f"Unexpected token '{current_token.lexeme}' at state {state}.")
-            try:
-                if action == "s": 
-                    evaluation_value = "void"
-                    if current_token.token_type == "num":
-                        evaluation_value = current_token.lexeme
-                    leaf_node = {
-                        "token": current_token.token_type,
-                        "lexeme": current_token.lexeme,
-                        "value": evaluation_value,
-                        "bool": None,  # 默认设置为 None
-                    }
-                    self.stack.append((value, leaf_node))
-                    self.index += 1
-                    current_token = self.tokens[self.index] if self.index < len(self.tokens) else None
-
-                elif action == "r": 
-                    lhs, productions, rhs_length = (
-                        self.rules[value]["non-terminal"],
-                        self.rules[value]["productions"],
-                        self.rules[value]["length"],
-                    )
-                    key = f"{lhs}:{productions}"  # 类型规则的键
-                    
-                    if len(self.stack) < rhs_length:
-                        raise ValueError("Stack underflow: Not enough elements to pop for the current rule.")
-
-                    type_children = []
-                    for _ in range(rhs_length):
-                        _, child_node = self.stack.pop()
-                        type_children.insert(0, child_node)
-
-                    if key == "D:let T id be E .":
-                        id_node = type_children[2]
-                        expression_node = type_children[4]
-                        if "value" not in type_children[1] or "value" not in expression_node:
-                            raise ValueError("Invalid value or type when updating symbol table.")
-                        self.symbol_table[id_node["lexeme"]] = {
-                            "type": type_children[1]["value"],
-                            "value": expression_node["value"],
-                        }
-                    # print(f"Applying rule: {key}")
-                    # print(f"Children: {type_children}, lenth:{len(type_children)}")
-                    # print("===========================================") 
-                    # print(key)                  
-                    if key in self.new_evaluation_rules:
-                        evaluation_value = self.new_evaluation_rules[key](*type_children)
-                        # print("1111")
-                        bool_value = None
+            code = actions[states[-1] * width + symbol]
+            action, value = code & 3, code >> 2
+            if action == ERROR:
+                for _ in pairs:  # finish lexing first, a lexical error takes precedence
+                    pass
+                # the messages of the three-pass driver: the parse stack, then
+                # the typing pass stopping at the same token
+                stack = [(state, None if view is None else tree.as_dict("parse", view.node))
+                         for state, view in zip(states, nodes)]
+                print("Syntax Error!")
+                print(f"Syntax Error: Unexpected token '{lexeme}' at state {states[-1]}. Stack: {stack}")
+                print("Semantic Error!")
+                print(f"Syntax Error: Unexpected token '{lexeme}' at state {states[-1]}.")
+                return tree
+            if action == SHIFT:
+                if symbol == num:
+                    node = tree.add_leaf(symbol, lexeme, integer, lexeme)
+                else:
+                    node = tree.add_leaf(symbol, lexeme, void, "void")
+                states.append(value)
+                nodes.append(NodeView(tree, node))
+                self.index += 1
+                symbol, lexeme = next(pairs, end)
+            elif action == REDUCE:
+                lhs, rhs_length, typing_rule, evaluation_rule, key = reductions[value]
+                base = len(nodes) - rhs_length
+                children = nodes[base:]
+                del nodes[base:], states[base:]
+                node = tree.add_node(lhs, [child.node for child in children])
+                if not evaluate:
+                    deferred[node] = value
+
+                if typing:
+                    if typing_rule is not None:
+                        types[node] = type_code(typing_rule(*children))
+                    else:
+                        typing = evaluating = False
+                        typing_error = TypeError(f"Typing rule for {key} not defined.")
+
+                bool_value = None
+                if evaluating:
+                    try:
+                        if evaluation_rule is None:
+                            raise TypeError(f"Typing rule for {key} not defined.")
+                        evaluation_value = evaluation_rule(*children)
                         if isinstance(evaluation_value, tuple):
                             evaluation_value, bool_value = evaluation_value
                         bool_value = bool_value if isinstance(bool_value, bool) else "undefined"
-                    else:
-                        raise TypeError(f"Typing rule for {key} not defined.")
-
-                    subtree = {
-                        "name": lhs,
-                        "value": evaluation_value,
-                        "bool": bool_value,
-                        "children": type_children,
-                    }
-                    state = self.stack[-1][0]
-                    self.stack.append((self.goto[(state, lhs)], subtree))
-
-                elif action == "acc":
-                    print("Evaluation Analysis Complete!")
-                    _, evaluate_tree = self.stack[-1]
-                    evaluate_tree=self.remove_bool_attributes(evaluate_tree)
-                    print(f"Final Value: {evaluate_tree['value']}")
-                    # print(f"Final Boolean: {evaluate_tree.get('bool', 'undefined')}")
-                    break
+                        values[node] = evaluation_value
+                    except (SyntaxError, TypeError, ValueError) as e:
+                        evaluating = False
+                        evaluation_error = e
+                states.append(goto[states[-1] * width + lhs])
+                nodes.append(NodeView(tree, node, bool_value))
+            elif action == ACCEPT:
+                tree.root = nodes[-1].node
+                print("Syntactic Analysis Complete!")
+                if not typing:
+                    print("Semantic Error!")
+                    print(typing_error)
+                    return tree
+                tree.typed = True
+                print("Semantic Analysis Complete!")
+                if evaluate:
+                    self._report_evaluation(tree, None if evaluating else evaluation_error)
+                return tree
 
-            except (SyntaxError, TypeError, ValueError) as e:
-                print(f"Evaluation Error!", e)
-                evaluate_tree = []
-                return evaluate_tree
-        return evaluate_tree
 
 class SLRParserTable:
+    # Bump whenever the layout of the compiled artifact changes
+    COMPILED_VERSION = 2
+
     def __init__(self, file_path: str, grammar_path: str = None):
         self.file_path = file_path
         self.grammar_path = grammar_path
         self.data = self.read_csv()
         self.header, self.data = self.parse_header_and_data()
         self.terminals, self.non_terminals, self.ACTION_TABLE, self.GOTO_TABLE = self.split_action_goto()
+        self.intern_symbols()
         self.ACTION = self.parse_action()
         self.GOTO = self.parse_goto()
         if self.grammar_path:
             self.grammar = self.read_grammar()
+            self.index_reductions()
 
     def read_csv(self):
         with open(self.file_path, 'r') as file:
@@ -463,27 +486,46 @@ class SLRParserTable:
         GOTO_TABLE = [row[idx:] for row in self.data]
         return terminals, non_terminals, ACTION_TABLE, GOTO_TABLE
 
+    def intern_symbols(self):
+        """
+        Assign integer IDs to every grammar symbol. Terminals keep the IDs the
+        lexer stamps on its tokens, terminals the lexer does not know about and
+        then the non-terminals follow.
+        """
+        self.symbols = list(TERMINALS) + [t for t in self.terminals if t not in TERMINAL_IDS] + self.non_terminals
+        self.symbol_ids = {symbol: index for index, symbol in enumerate(self.symbols)}
+        self.n_symbols = len(self.symbols)
+        self.n_states = len(self.ACTION_TABLE)
+
     def parse_action(self):
-        ACTION = {}
+        """
+        Dense ACTION array indexed by state * n_symbols + terminal ID.
+        Entries: 0 error, (n << 2) | SHIFT, (n << 2) | REDUCE, ACCEPT.
+        """
+        ACTION = array('i', [ERROR]) * (self.n_states * self.n_symbols)
         for state, row in enumerate(self.ACTION_TABLE):
+            base = state * self.n_symbols
             for col_index, action in enumerate(row):
                 if action:
                     act_type = action[0]
+                    symbol = self.symbol_ids[self.terminals[col_index]]
                     if act_type in {'s', 'r'}:
                         act_value = int(action[1:])
-                        ACTION[(state, self.terminals[col_index])] = (
-                            act_type, act_value)
+                        ACTION[base + symbol] = (act_value << 2) | (SHIFT if act_type == 's' else REDUCE)
                     elif action == 'acc':
-                        ACTION[(state, self.terminals[col_index])] = (
-                            action, None)
+                        ACTION[base + symbol] = ACCEPT
         return ACTION
 
     def parse_goto(self):
-        GOTO = {}
+        """
+        Dense GOTO array indexed by state * n_symbols + non-terminal ID, -1 when empty.
+        """
+        GOTO = array('i', [-1]) * (self.n_states * self.n_symbols)
         for state, row in enumerate(self.GOTO_TABLE):
+            base = state * self.n_symbols
             for col_index, next_state in enumerate(row):
                 if next_state.strip():
-                    GOTO[(state, self.non_terminals[col_index])] = int(next_state)
+                    GOTO[base + self.symbol_ids[self.non_terminals[col_index]]] = int(next_state)
         return GOTO
 
     def read_grammar(self):
@@ -503,9 +545,137 @@ class SLRParserTable:
                         rhs = lhs_rhs[1].strip()
                         rhs_elements = rhs.split()
                         grammar[rule_number] = {
-                            'non-terminal': lhs, 'productions': rhs, 'length': len(rhs_elements)}
+                            'non-terminal': lhs, 'productions': rhs, 'length': len(rhs_elements),
+                            'symbol': self.symbol_ids[lhs]}
         return grammar
 
+    def index_reductions(self):
+        """
+        Per-production reduction records, indexed by production number:
+        (LHS symbol ID, RHS length, "lhs:rhs" rule key). Parser binds its
+        typing and evaluation rules to them once, so a reduction never builds
+        or hashes the rule key.
+        """
+        self.reductions = [(rule['symbol'], rule['length'], f"{rule['non-terminal']}:{rule['productions']}")
+                           for _, rule in sorted(self.grammar.items())]
+
+    # * Compiled table artifact
+    @classmethod
+    def load(cls, file_path: str, grammar_path: str, compiled_path: str = None) -> SLRParserTable:
+        """
+        Load the tables from the compiled artifact, falling back to the CSV and
+        grammar files (and rewriting the artifact) when it is missing, corrupt
+        or older than either source file.
+        :param file_path: CSV table, or None to generate the tables from the grammar,
+                          with states numbered in the builder's discovery order.
+        :param compiled_path: artifact location, defaults to the CSV (or grammar) path with a '.bin' suffix.
+        :return: SLRParserTable with ACTION, GOTO and grammar filled in.
+        """
+        compiled_path = compiled_path or os.path.splitext(file_path or grammar_path)[0] + ".bin"
+        sources = tuple(path for path in (file_path, grammar_path) if path)
+        try:
+            with open(compiled_path, 'rb') as file:
+                version, fingerprints, payload = marshal.load(file)
+            if version == cls.COMPILED_VERSION:
+                status = cls._check_fingerprints(sources, fingerprints)
+                if status is not None:
+                    table = cls._from_compiled(file_path, grammar_path, payload)
+                    if status == "touched":  # same content, new mtime: refresh the fast path
+                        table.save_compiled(compiled_path)
+                    return table
+        except (OSError, EOFError, ValueError, TypeError, KeyError, IndexError):
+            pass  # no usable artifact (or one missing a field), rebuild it below
+        if file_path:
+            table = cls(file_path, grammar_path)
+        else:
+            from slr_builder import SLRTableBuilder
+            table = SLRTableBuilder.from_file(grammar_path).to_table()
+        table.save_compiled(compiled_path)
+        return table
+
+    @staticmethod
+    def _fingerprint(path: str):
+        """
+        :return: (mtime_ns, size, sha256) of a source file.
+        """
+        import hashlib  # only needed when the artifact is (re)validated by content
+        with open(path, 'rb') as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size, digest
+
+    @classmethod
+    def _check_fingerprints(cls, sources, fingerprints):
+        """
+        Compare the source files against the fingerprints stored in the artifact.
+        mtime and size are checked first, the content hash only when they differ.
+        :return: "fresh", "touched" (content unchanged, mtime changed) or None if stale.
+        """
+        if len(sources) != len(fingerprints):
+            return None
+        status = "fresh"
+        for path, (mtime_ns, size, digest) in zip(sources, fingerprints):
+            stat = os.stat(path)
+            if stat.st_mtime_ns == mtime_ns and stat.st_size == size:
+                continue
+            if cls._fingerprint(path)[2] != digest:
+                return None
+            status = "touched"
+        return status
+
+    def save_compiled(self, compiled_path: str):
+        """
+        Write the dense ACTION/GOTO arrays and the grammar records together
+        with the fingerprints of the CSV and grammar files. The write is atomic
+        so concurrent runs never observe a half-written file; failures are ignored.
+        """
+        payload = {
+            "terminals": tuple(self.terminals),
+            "non_terminals": tuple(self.non_terminals),
+            "symbols": tuple(self.symbols),
+            "n_states": self.n_states,
+            "action": self.ACTION.tobytes(),
+            "goto": self.GOTO.tobytes(),
+            "grammar": tuple((number, rule['non-terminal'], rule['productions'], rule['length'])
+                             for number, rule in self.grammar.items()),
+        }
+        fingerprints = tuple(self._fingerprint(path) for path in (self.file_path, self.grammar_path) if path)
+        temp_path = f"{compiled_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as file:
+                marshal.dump((self.COMPILED_VERSION, fingerprints, payload), file)
+            os.replace(temp_path, compiled_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @classmethod
+    def _from_compiled(cls, file_path: str, grammar_path: str, payload: dict) -> SLRParserTable:
+        """
+        Restore the tables from a compiled payload without touching the CSV or
+        grammar files.
+        :raises ValueError: if the artifact was built for a different terminal numbering.
+        """
+        symbols = list(payload["symbols"])
+        if tuple(symbols[:len(TERMINALS)]) != TERMINALS:
+            raise ValueError("Compiled table uses a different terminal numbering")
+        table = cls.__new__(cls)
+        table.file_path, table.grammar_path = file_path, grammar_path
+        table.terminals = list(payload["terminals"])
+        table.non_terminals = list(payload["non_terminals"])
+        table.symbols = symbols
+        table.symbol_ids = {symbol: index for index, symbol in enumerate(symbols)}
+        table.n_symbols = len(symbols)
+        table.n_states = payload["n_states"]
+        table.ACTION, table.GOTO = array('i'), array('i')
+        table.ACTION.frombytes(payload["action"])
+        table.GOTO.frombytes(payload["goto"])
+        table.grammar = {number: {'non-terminal': lhs, 'productions': rhs, 'length': length,
+                                  'symbol': table.symbol_ids[lhs]}
+                         for number, lhs, rhs, length in payload["grammar"]}
+        table.index_reductions()
+        return table
+
     def print_table(self, table):
         for key, value in table.items():
             print(f"{key}: {value}")
@@ -519,26 +689,9 @@ if __name__ == '__main__':
     # test_case = "let int x be 1. show x."
     lexer = Lexer(test_case)
     tokens, symbol_table = lexer.tokenize()
-    lexer_ouput = [token.to_dict() for token in tokens]
-    import json
-    with open("lexer_out.json", "w", encoding="utf-8") as f:
-        json.dump(lexer_ouput, f, ensure_ascii=False, indent=4)
-
-    tokens.append(Token(token_type="$", lexeme="$", value="$"))
     slr_table = SLRParserTable(file_path, grammar_path)
-    actions, goto, rules = slr_table.ACTION, slr_table.GOTO, slr_table.grammar
-    simplified_rules = {}
-    for rule_number, details in rules.items():
-        simplified_rules[rule_number] = (
-            details['non-terminal'], details['length'])
-    parser=Parser(tokens,actions, goto, rules)
-    parse_tree=parser.parse()
-    with open("parser_out.json", "w", encoding="utf-8") as f:
-        json.dump(parse_tree, f, ensure_ascii=False, indent=4)
-    typeing_tree=parser.typecheck()
-    with open("typing_out.json", "w", encoding="utf-8") as f:
-        json.dump(typeing_tree, f, ensure_ascii=False, indent=4)
-    evaluation_tree=parser.evaluate()
-    with open("evaluation_out.json", "w", encoding="utf-8") as f:
-        json.dump(evaluation_tree, f, ensure_ascii=False, indent=4)
-    # print(parser.symbol_table)
+    parser=Parser(tokens, slr_table)
+    tree=parser.build_tree()
+    import json
+    for view in ("parse", "typing", "evaluation"):
+        print(json.dumps(tree.as_dict(view), ensure_ascii=False, indent=4))
@@ -0,0 +1,169 @@
+from __future__ import annotations
+import keyword
+import re
+from expression import Expr, Rope
+from interval import IntervalSet
+
+# An element / operand Python would read as an int literal, the only kind the interval sets accept
+INTEGER = re.compile(r"-?(?:0|[1-9][0-9]*)")
+
+class SetValue(Expr):
+    """
+    Value of a set expression: its text as an Expr, plus the set itself as an
+    IntervalSet compiled from the predicate subtree (None when the predicate
+    is outside what compile_predicate() handles) and the variable of its
+    definition. Equal texts are one SetValue, built once.
+    """
+    __slots__ = ("intervals", "variable", "parts")
+
+    def __new__(cls, pieces: tuple, intervals: IntervalSet | None = None, variable: str = None, parts: tuple = ()):
+        """
+        :param pieces: the text, see Expr.
+        :param parts: how the set was built, for simplify: ("{", P node) for a
+                      literal, ("U" or "I", left value, right value) for an operator.
+        """
+        return super().__new__(cls, pieces, intervals, variable, parts)
+
+    def _init(self, intervals: IntervalSet | None, variable: str, parts: tuple):
+        self.intervals = intervals
+        self.variable = variable
+        self.parts = parts
+
+    @staticmethod
+    def literal(variable: str, predicate) -> SetValue:
+        """
+        Value of the set literal '{ variable : P }'. The predicate is compiled
+        only for a new value: a literal repeated in the program (the same text,
+        or the same shared Expr) is the SetValue built the first time.
+        :param predicate: the P node, see compile_predicate().
+        """
+        pieces = ("{ ", variable, ": ", predicate["value"], " }")
+        value = SetValue.interned(pieces)
+        if value is None:
+            value = SetValue(pieces, compile_predicate(variable, predicate), variable, ("{", predicate))
+        return value
+
+    @staticmethod
+    def combine(left, right, operator: str) -> SetValue:
+        """
+        Result of the set operator "U" or "I", 'left U right'; its interval set
+        is known when both operands' sets are.
+        """
+        pieces = (left, f" {operator} ", right)
+        # an operand of an ill-typed program may be something else, use its text
+        pieces = tuple(piece if isinstance(piece, (str, Rope)) else str(piece) for piece in pieces)
+        value = SetValue.interned(pieces)
+        if value is not None:
+            return value
+        left_set, right_set = getattr(left, "intervals", None), getattr(right, "intervals", None)
+        intervals = None
+        if left_set is not None and right_set is not None:
+            intervals = left_set | right_set if operator == "U" else left_set & right_set
+        variable = getattr(left, "variable", None) or getattr(right, "variable", None)
+        return SetValue(pieces, intervals, variable, (operator, left, right))
+
+    def canonical(self) -> str | None:
+        """
+        :return: the canonical compact form of the set, None if it is not known.
+        """
+        return None if self.intervals is None else self.intervals.show(self.variable)
+
+
+def compile_predicate(variable: str, predicate) -> IntervalSet | None:
+    """
+    Compile a P subtree of '{ variable : P }' into the IntervalSet it defines,
+    so set operators are interval merges and a membership test is a binary
+    search, with no string processing.
+    Handled: relations (<, >, =) between the bound variable and integers,
+    'variable @ S' and 'n @ S' for sets S with known intervals, combined with
+    |, &, ! and parentheses. Anything else (other identifiers, arithmetic on
+    the variable) returns None and keeps the text-based path.
+    :param predicate: the P node, a NodeView or a dictionary of the evaluation tree.
+    """
+    if keyword.iskeyword(variable):
+        return None  # the text path cannot bind it either
+    try:
+        return _compile(variable, predicate)
+    except _NotCompilable:
+        return None
+
+
+class _NotCompilable(Exception):
+    pass
+
+
+def _compile(variable: str, predicate) -> IntervalSet:
+    """
+    The IntervalSet of a P subtree, children before parents with an explicit
+    stack, so a literal of thousands of relations does not recurse: an
+    operator's frame is pushed back below its operands and, once they are
+    done, combines their sets popped from values.
+    """
+    frames, values = [(predicate, False)], []
+    while frames:
+        node, done = frames.pop()
+        name, children = node.get("name"), node["children"]
+        if done:
+            if len(children) == 2:  # P'' -> ! R
+                values.append(~values.pop())
+            else:
+                right, left = values.pop(), values.pop()
+                values.append(left | right if children[1]["lexeme"] == "|" else left & right)
+        elif name in ("P", "P'"):
+            if len(children) == 1:
+                frames.append((children[0], False))
+            else:
+                frames += [(node, True), (children[2], False), (children[0], False)]
+        elif name == "P''":
+            first = children[0].get("lexeme")
+            if first == "(":
+                frames.append((children[1], False))
+            elif first == "!":
+                frames += [(node, True), (children[1], False)]
+            else:
+                frames.append((children[0], False))
+        elif name == "R":
+            values.append(_relation(variable, children))
+        else:
+            raise _NotCompilable
+    return values[0]
+
+
+def _relation(variable: str, children) -> IntervalSet:
+    """
+    The IntervalSet of a relation 'E1 op E2' of the predicate.
+    """
+    operator = children[1]["lexeme"]
+    left = _operand(variable, children[0])
+    if operator == "@":
+        members = getattr(children[2]["value"], "intervals", None)
+        if members is None:
+            raise _NotCompilable
+        if left is None:
+            return members
+        return IntervalSet.everything() if left in members else IntervalSet()
+    right = _operand(variable, children[2])
+    if left is None and right is None:
+        return IntervalSet.everything() if operator == "=" else IntervalSet()
+    if left is None:
+        return IntervalSet.below(right) if operator == "<" else \
+            IntervalSet.above(right) if operator == ">" else IntervalSet.point(right)
+    if right is None:
+        return IntervalSet.above(left) if operator == "<" else \
+            IntervalSet.below(left) if operator == ">" else IntervalSet.point(left)
+    holds = left < right if operator == "<" else left > right if operator == ">" else left == right
+    return IntervalSet.everything() if holds else IntervalSet()
+
+
+def _operand(variable: str, node):
+    """
+    :return: None for the bound variable, the int for an integer.
+    """
+    text = node["value"]
+    if text.__class__ is int:
+        return text
+    if text == variable:
+        return None
+    if isinstance(text, str) and INTEGER.fullmatch(text):
+        return int(text)
+    raise _NotCompilable
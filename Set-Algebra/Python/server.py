@@ -0,0 +1,188 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import Counter
+from batch import JSONL_FIELDS, cache_summary, compile_source, json_record
+from cache import CompileCache
+from main import OUTPUT_NAMES
+from parser import SLRParserTable
+
+# Usage: python server.py [--socket PATH] [--workers N] [--cache DIR]
+# Serves compile requests on a Unix domain socket until SIGTERM / SIGINT,
+# through a CompileCache kept in memory, and in DIR when given.
+#
+# Protocol: one JSON object per line each way. A request is
+#   {"id": any, "source": "<program text>", "phases": ["lexer", "parser", "typing", "evaluation"], "raw": false}
+# ("id", "phases" and "raw" optional; all phases by default), the response
+#   {"id": ..., "status": ..., "stdout": ..., "lexer": ..., ...}
+# with the outputs of the phases asked for, as JSON values, or with "raw" as the
+# text of the files main.py writes. A client may send requests without waiting
+# for the responses; they come back in request order.
+
+# Where the server listens unless told otherwise
+DEFAULT_SOCKET = os.path.join(os.environ.get("TMPDIR", "/tmp"), f"set-algebra-{os.getuid()}.sock")
+
+TABLE_PATH = 'SLR Parsing Table.csv'
+GRAMMAR_PATH = 'SLR Grammar.txt'
+
+# Longest request line accepted, in bytes
+MAX_REQUEST = 1 << 28
+
+# Requests of one connection read ahead of the response being written
+PIPELINE_DEPTH = 64
+
+# Output file of each phase name of a request
+PHASE_OUTPUTS = dict(zip(JSONL_FIELDS, OUTPUT_NAMES))
+
+# Table and cache of the process compiling, set up once by _start_worker()
+_table = None
+_cache = None
+
+
+def _start_worker(table_path: str, grammar_path: str, cache_directory: str = None):
+    global _table, _cache
+    _table = SLRParserTable.load(table_path, grammar_path)
+    _cache = CompileCache(cache_directory, (table_path, grammar_path))
+
+
+def _compile_request(source: str, phases: list[str]) -> dict[str, str]:
+    """
+    Job of a request: compile the source (as UTF-8, the bytes of the client's
+    file kept by surrogateescape) with the outputs of the phases asked for.
+    """
+    names = tuple(PHASE_OUTPUTS[phase] for phase in phases)
+    return compile_source(source.encode("utf-8", "surrogateescape"), _table, names=names, cache=_cache)
+
+
+class CompileServer:
+    """
+    The daemon: a warm table, an asyncio Unix socket server and the executor
+    the compilations run on. Compiling captures stdout, which is global to
+    the process, so in-process compilations run one at a time on a single
+    thread, off the event loop; with workers they run on that many
+    processes, each with its own table and in-process cache layer.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET, workers: int = 1, cache_directory: str = None):
+        self.path = path
+        if workers > 1:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                                                initargs=(TABLE_PATH, GRAMMAR_PATH, cache_directory))
+        else:
+            _start_worker(TABLE_PATH, GRAMMAR_PATH, cache_directory)
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.connections = {}  # handle() task -> (reader, writer) of each open connection
+        self.outcomes = Counter()  # requests by where their result came from, see batch.compile_source()
+
+    async def serve(self):
+        """
+        Serve until SIGTERM or SIGINT, then shut down gracefully: stop
+        accepting, stop reading requests, answer every request already read,
+        close the connections and remove the socket.
+        """
+        self._remove_stale_socket()
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signal_number, stop.set)
+        server = await asyncio.start_unix_server(self.handle, self.path, limit=MAX_REQUEST)
+        print(f"Serving on {self.path}", file=sys.stderr)
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            for reader, writer in self.connections.values():
+                # no more data, the requests already received still are answered
+                writer.transport.pause_reading()
+                reader.feed_eof()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await server.wait_closed()
+            self.executor.shutdown()
+            os.unlink(self.path)
+            print(f"Cache: {cache_summary(self.outcomes)}", file=sys.stderr)
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.path):
+            return
+        with socket.socket(socket.AF_UNIX) as probe:
+            try:
+                probe.connect(self.path)
+            except ConnectionRefusedError:
+                os.unlink(self.path)  # left by a server that did not shut down
+                return
+        raise RuntimeError(f"A server is already listening on {self.path}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        One connection: requests are read and submitted as they arrive, up to
+        PIPELINE_DEPTH ahead, while the responses are written in order.
+        """
+        task = asyncio.current_task()
+        self.connections[task] = (reader, writer)
+        pending = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+        responder = asyncio.create_task(self._respond(pending, writer))
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    await pending.put(self._submit(line))
+        except (ConnectionError, ValueError):
+            pass  # the client went away, or sent a line over MAX_REQUEST
+        finally:
+            del self.connections[task]
+            await pending.put(None)
+            await responder
+            writer.close()
+
+    def _submit(self, line: bytes) -> tuple[dict, bool, asyncio.Future]:
+        """
+        :return: the head of the response, whether the outputs are raw, and
+                 the future of the result.
+        """
+        loop = asyncio.get_running_loop()
+        head, raw = {"id": None}, False
+        try:
+            request = json.loads(line)
+            head["id"] = request.get("id")
+            raw = bool(request.get("raw"))
+            source, phases = request["source"], request.get("phases", list(JSONL_FIELDS))
+            if not isinstance(source, str) or not isinstance(phases, list):
+                raise TypeError("'source' must be a string and 'phases' a list")
+            unknown = [phase for phase in phases if phase not in PHASE_OUTPUTS]
+            if unknown:
+                raise ValueError(f"unknown phases {unknown}")
+            return head, raw, loop.run_in_executor(self.executor, _compile_request, source, phases)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            future = loop.create_future()
+            future.set_result({"status": f"error: bad request, {type(e).__name__}: {e}", "stdout": ""})
+            return head, raw, future
+
+    async def _respond(self, pending: asyncio.Queue, writer: asyncio.StreamWriter):
+        while (item := await pending.get()) is not None:
+            head, raw, future = item
+            try:
+                result = await future
+                self.outcomes[result.get("cache")] += 1
+            except Exception as e:  # a worker process died
+                result = {"status": f"crash: {type(e).__name__}: {e}", "stdout": ""}
+            try:
+                writer.write((json_record(head, result, raw) + "\n").encode("utf-8", "surrogateescape"))
+                await writer.drain()
+            except ConnectionError:
+                pass  # keep draining, the futures still complete
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    options = {"--socket": DEFAULT_SOCKET, "--workers": "1", "--cache": None}
+    while len(arguments) >= 2 and arguments[0] in options:
+        options[arguments[0]] = arguments[1]
+        arguments = arguments[2:]
+    if arguments or not options["--workers"].isdigit():
+        print("Usage: python server.py [--socket PATH] [--workers N] [--cache DIR]")
+        sys.exit(1)
+    asyncio.run(CompileServer(options["--socket"], int(options["--workers"]), options["--cache"]).serve())
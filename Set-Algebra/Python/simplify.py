@@ -0,0 +1,427 @@
+from __future__ import annotations
+from itertools import combinations
+from interval import IntervalSet, NEGATIVE_INFINITY, INFINITY
+from predicate import INTEGER, SetValue
+
+VARIABLE = None  # operand standing for the bound variable of a set definition
+
+# Children of a clause up to which every subset of them is looked up as a clause
+# that absorbs it; above, only the single children are
+ABSORPTION_SUBSETS = 4
+
+class Term:
+    """
+    A normalized predicate over the bound variable, hash-consed by Simplifier:
+    equal terms are one object, so identity is equality.
+    kind is "range" (payload: IntervalSet bounds, everything the interval sets
+    capture), "atom" (payload: (operator, left, right), a relation they don't,
+    VARIABLE as an operand for the bound variable), "not" (payload: an atom),
+    "and" / "or" (payload: the children, at most one range, in canonical order).
+    """
+    __slots__ = ("kind", "payload", "_order")
+
+    def __init__(self, kind: str, payload):
+        self.kind = kind
+        self.payload = payload
+        self._order = None
+
+    def order(self) -> tuple:
+        """
+        Sort key of the canonical child order: the range first, then the
+        children with a range by its bounds, then the others; ties by text.
+        """
+        if self._order is None:
+            if self.kind == "range":
+                self._order = (0, self.payload, "")
+            elif self.kind in ("and", "or") and self.payload[0].kind == "range":
+                self._order = (1, self.payload[0].payload, render(self, "\0"))
+            else:
+                self._order = (2, (), render(self, "\0"))
+        return self._order
+
+    def __repr__(self) -> str:
+        return f"Term({self.kind!r}, {render(self, 'a')!r})"
+
+
+class _NotNormalizable(Exception):
+    pass
+
+
+class Simplifier:
+    """
+    Normal forms of set values for 'simplify'. A set becomes a Term built by
+    constructors that rewrite as they go: nested | / & are flattened, ranges
+    merged with one sweep, relations that always or never hold dropped, x & !x,
+    x | !x and absorbed children collapsed, children shared by the clauses
+    factored out, negations pushed down to atoms.
+    Every constructor result is memoized on its (hash-consed) arguments and
+    every predicate node is normalized once, bottom-up without recursion, so
+    large predicates simplify in near-linear time.
+    """
+
+    def __init__(self):
+        self.terms = {}     # intern key -> Term
+        self.rewrites = {}  # (constructor, argument IDs) -> Term
+        self.nodes = {}     # predicate node -> Term
+        self.sets = {}      # id(set value) -> (set value, Term)
+        self.true = self.range(IntervalSet.everything().bounds)
+        self.false = self.range(())
+
+    def simplify(self, value: SetValue) -> str:
+        """
+        :return: '{ x : P }' with P in canonical form, or the value unchanged
+                 when it was not built from set literals.
+        """
+        if value.intervals is not None:
+            return value.intervals.show(value.variable)
+        try:
+            term = self.set_term(value)
+        except _NotNormalizable:
+            return value
+        return f"{{ {value.variable} : {render(term, value.variable)} }}"
+
+    # ---------------------------------------------------------------- terms
+
+    def _intern(self, key: tuple, kind: str, payload) -> Term:
+        term = self.terms.get(key)
+        if term is None:
+            term = self.terms[key] = Term(kind, payload)
+        return term
+
+    def range(self, bounds: tuple) -> Term:
+        return self._intern(("range", bounds), "range", bounds)
+
+    def atom(self, operator: str, left, right) -> Term:
+        """
+        Term of the relation 'left operator right' between operands: VARIABLE,
+        an int or an identifier; a range whenever the interval sets can say it.
+        """
+        if operator != "@":
+            if right is VARIABLE or isinstance(right, str) and isinstance(left, int):
+                # the variable, then an identifier, on the left: '3 < a' is 'a > 3'
+                left, right = right, left
+                operator = {"<": ">", ">": "<"}.get(operator, operator)
+            if left == right:  # the same operand on both sides
+                return self.true if operator == "=" else self.false
+            if isinstance(left, int) and isinstance(right, int):
+                holds = left < right if operator == "<" else left > right if operator == ">" else left == right
+                return self.true if holds else self.false
+            if left is VARIABLE and isinstance(right, int):
+                return self.range((IntervalSet.below(right) if operator == "<" else IntervalSet.above(right)
+                                   if operator == ">" else IntervalSet.point(right)).bounds)
+        return self._intern(("atom", operator, left, right), "atom", (operator, left, right))
+
+    def negate(self, term: Term) -> Term:
+        key = ("not", id(term))
+        result = self.rewrites.get(key)
+        if result is None:
+            kind = term.kind
+            if kind == "range":
+                result = self.range((~IntervalSet(term.payload)).bounds)
+            elif kind == "atom":
+                result = self._intern(("not", id(term)), "not", term)
+            elif kind == "not":
+                result = term.payload
+            elif kind == "and":
+                result = self.disjunction([self.negate(child) for child in term.payload])
+            else:
+                result = self.conjunction([self.negate(child) for child in term.payload])
+            self.rewrites[key] = result
+        return result
+
+    def substitute(self, term: Term, operand, name: str) -> Term:
+        """
+        term with operand for the bound variable, and the free identifier name
+        read as the bound variable: 'x @ S' inside the definition of name,
+        where S may refer to name.
+        """
+        key = ("substitute", id(term), operand, name)
+        result = self.rewrites.get(key)
+        if result is None:
+            kind = term.kind
+            if kind == "range":
+                if operand is VARIABLE:
+                    result = term
+                elif isinstance(operand, int):
+                    result = self.true if operand in IntervalSet(term.payload) else self.false
+                else:  # as relations on the identifier
+                    minterms = []
+                    for low, high in IntervalSet(term.payload).ranges():
+                        relations = []
+                        if low != NEGATIVE_INFINITY:
+                            relations.append(self.atom(">", operand, low - 1))
+                        if high != INFINITY:
+                            relations.append(self.atom("<", operand, high + 1))
+                        minterms.append(self.conjunction(relations))
+                    result = self.disjunction(minterms)
+            elif kind == "atom":
+                operator, left, right = term.payload
+                result = self.atom(operator, _replace(left, operand, name),
+                                   right if operator == "@" else _replace(right, operand, name))
+            elif kind == "not":
+                result = self.negate(self.substitute(term.payload, operand, name))
+            else:
+                result = self._combine(kind, [self.substitute(child, operand, name) for child in term.payload])
+            self.rewrites[key] = result
+        return result
+
+    def conjunction(self, terms: list[Term]) -> Term:
+        return self._combine("and", terms)
+
+    def disjunction(self, terms: list[Term]) -> Term:
+        return self._combine("or", terms)
+
+    def _combine(self, kind: str, terms: list[Term]) -> Term:
+        """
+        Build 'and' / 'or' of terms, in normal form. Written for 'and'; 'or' is
+        the dual (union for intersection, true for false, ...).
+        """
+        key = (kind, tuple(map(id, terms)))
+        result = self.rewrites.get(key)
+        if result is not None:
+            return result
+        conjunction = kind == "and"
+        dual = "or" if conjunction else "and"
+        merge = IntervalSet.intersection_all if conjunction else IntervalSet.union_all
+        identity, zero = (self.true, self.false) if conjunction else (self.false, self.true)
+
+        ranges, others, seen = [], [], set()
+        pending = list(reversed(terms))
+        while pending:
+            term = pending.pop()
+            if term.kind == kind:  # flatten
+                pending.extend(reversed(term.payload))
+            elif term.kind == "range":
+                ranges.append(IntervalSet(term.payload))
+            elif id(term) not in seen:
+                seen.add(id(term))
+                others.append(term)
+        intervals = merge(ranges) if ranges else IntervalSet(identity.payload)
+        result = zero if intervals.bounds == zero.payload else None
+
+        if result is None:
+            # factor what children of the dual kind share: (x | a < 0) & (x | a < 1)
+            # is x | (a < 0 & a < 1), their ranges merged in one sweep; then drop the
+            # ones another implies: (x | a < 0) & (x | y | a < 5) is x | a < 0
+            groups = {}  # IDs of a child's children besides its range -> (those children, their ranges)
+            for term in others:
+                if term.kind == dual:
+                    children = term.payload
+                    ranged = children[0].kind == "range"
+                    rest = children[1:] if ranged else children
+                    group = groups.setdefault(tuple(map(id, rest)), (rest, []))
+                    group[1].append(IntervalSet(children[0].payload if ranged else zero.payload))
+            merged = {shared: merge(parts) for shared, (_, parts) in groups.items()}
+            absorbed = set()
+            for shared, inner in merged.items():
+                # the children are in canonical order, so a subset of them is a key in that order too
+                sizes = range(1, len(shared)) if len(shared) <= ABSORPTION_SUBSETS else (1,)
+                if any((outer | inner if conjunction else outer & inner) == inner
+                       for size in sizes for subset in combinations(shared, size)
+                       for outer in (merged.get(subset),) if outer is not None):
+                    absorbed.add(shared)
+            if absorbed or len(groups) < sum(len(parts) for _, parts in groups.values()):
+                factored, done = [], absorbed
+                for term in others:
+                    if term.kind != dual:
+                        factored.append(term)
+                        continue
+                    children = term.payload
+                    shared = tuple(map(id, children[1:] if children[0].kind == "range" else children))
+                    if shared not in done:
+                        done.add(shared)
+                        rest, parts = groups[shared]
+                        factored.append(term if len(parts) == 1 else
+                                        self._combine(dual, [self.range(merged[shared].bounds), *rest]))
+                result = self._combine(kind, [self.range(intervals.bounds)] + factored)
+                self.rewrites[key] = result
+                return result
+
+        if result is None:
+            kept, reduced = [], False
+            for term in others:
+                if term.kind != dual:
+                    if id(self.negate(term)) in seen:  # x & !x
+                        result = zero
+                        break
+                    kept.append(term)
+                    continue
+                # a child of the dual kind: drop it when absorbed (x & (x | y)), and
+                # drop its range when this range decides it (a > 5 & (a < 3 | y))
+                children = term.payload
+                if any(id(child) in seen for child in children):
+                    continue
+                if children[0].kind == "range":
+                    inner = IntervalSet(children[0].payload)
+                    if (intervals | inner if conjunction else intervals & inner) == inner:
+                        continue
+                    if (intervals & inner if conjunction else intervals | inner).bounds == zero.payload:
+                        term = self._combine(dual, list(children[1:]))
+                        reduced = True
+                kept.append(term)
+            else:
+                if reduced:  # a reduced child may now flatten or merge into this one
+                    result = self._combine(kind, [self.range(intervals.bounds)] + kept)
+                    self.rewrites[key] = result
+                    return result
+                kept.sort(key=Term.order)
+                if intervals.bounds != identity.payload:
+                    kept.insert(0, self.range(intervals.bounds))
+                if not kept:
+                    result = identity
+                elif len(kept) == 1:
+                    result = kept[0]
+                else:
+                    result = self._intern((kind, tuple(map(id, kept))), kind, tuple(kept))
+        self.rewrites[key] = result
+        return result
+
+    # ----------------------------------------------------------- set values
+
+    def set_term(self, value) -> Term:
+        """
+        Term of a set value, from how it was built (SetValue.parts).
+        """
+        if not isinstance(value, SetValue) or not value.parts:
+            raise _NotNormalizable
+        if value.intervals is not None:
+            return self.range(value.intervals.bounds)
+        cached = self.sets.get(id(value))
+        if cached is not None:
+            return cached[1]
+        kind = value.parts[0]
+        if kind == "{":
+            term = self.predicate_term(value.variable, value.parts[1])
+        else:
+            operands, pending, visited = [], [value], set()
+            while pending:  # a chain of the same operator in one go, each shared operand once
+                operand = pending.pop()
+                if id(operand) in visited:
+                    continue
+                visited.add(id(operand))
+                if isinstance(operand, SetValue) and operand.parts[:1] == (kind,) and operand.intervals is None:
+                    pending += (operand.parts[2], operand.parts[1])
+                else:
+                    operands.append(self.set_term(operand))
+            term = self.disjunction(operands) if kind == "U" else self.conjunction(operands)
+        self.sets[id(value)] = (value, term)
+        return term
+
+    def predicate_term(self, variable: str, predicate) -> Term:
+        """
+        Normalize a P subtree of '{ variable : P }', children before parents
+        with an explicit stack.
+        :param predicate: the P node, a NodeView or a dictionary of the evaluation tree.
+        """
+        nodes = self.nodes
+        pending = [(predicate, None)]
+        while pending:
+            node, plan = pending.pop()
+            key = _node_key(node)
+            if key in nodes:
+                continue
+            if plan is None:
+                plan = _plan(node)
+                pending.append((node, plan))
+                pending.extend((child, None) for child in plan[1] if _node_key(child) not in nodes)
+                continue
+            kind, children = plan
+            if kind == "relation":
+                term = self.relation(variable, node)
+            else:
+                terms = [nodes[_node_key(child)] for child in children]
+                term = self.disjunction(terms) if kind == "or" else self.conjunction(terms) if kind == "and" else \
+                    self.negate(terms[0]) if kind == "not" else terms[0]
+            nodes[key] = term
+        return nodes[_node_key(predicate)]
+
+    def relation(self, variable: str, node) -> Term:
+        left_node, operator_node, right_node = node["children"]
+        operator = operator_node["lexeme"]
+        left = _operand(variable, left_node)
+        if operator != "@":
+            return self.atom(operator, left, _operand(variable, right_node))
+        members = right_node["value"]
+        try:
+            members_term = self.set_term(members)
+        except _NotNormalizable:
+            return self.atom("@", left, str(members))
+        return self.substitute(members_term, left, variable)  # S's predicate on left
+
+
+def _node_key(node):
+    # arena and index of a NodeView (an interned set may come from an earlier tree),
+    # identity of a dictionary node
+    index = getattr(node, "node", None)
+    return id(node) if index is None else (id(node.tree), index)
+
+
+def _plan(node) -> tuple[str, list]:
+    """
+    :return: how to combine a predicate node, and the child nodes to combine.
+    A left-recursive chain 'P | P' | P' ...' is taken in one step.
+    """
+    name, children = node.get("name"), node["children"]
+    if name in ("P", "P'"):
+        operands = []
+        while len(children) == 3:
+            operands.append(children[2])
+            children = children[0]["children"]
+        operands.append(children[0])
+        operands.reverse()
+        return ("or" if name == "P" else "and"), operands
+    if name == "P''":
+        first = children[0].get("lexeme")
+        if first == "(":
+            return "group", [children[1]]
+        if first == "!":
+            return "not", [children[1]]
+        return "group", [children[0]]
+    if name == "R":
+        return "relation", []
+    raise _NotNormalizable
+
+
+def _replace(operand, new, name: str):
+    return new if operand is VARIABLE else VARIABLE if operand == name else operand
+
+
+def _operand(variable: str, node):
+    """
+    :return: VARIABLE, an int for an integer, the text otherwise.
+    """
+    text = node["value"]
+    if text.__class__ is int:
+        return text
+    if text == variable:
+        return VARIABLE
+    if not isinstance(text, str):
+        raise _NotNormalizable
+    return int(text) if INTEGER.fullmatch(text) else str(text)
+
+
+def render(term: Term, variable: str) -> str:
+    """
+    Text of a term in the language's predicate syntax, with variable for the
+    bound variable; & binds tighter than |, so only an 'or' (or a range of
+    several minterms) inside an 'and' needs parentheses.
+    """
+    kind = term.kind
+    if kind == "range":
+        return " | ".join(IntervalSet(term.payload).minterms(variable))
+    if kind == "atom":
+        operator, left, right = term.payload
+        left = variable if left is VARIABLE else left
+        right = variable if right is VARIABLE else right
+        return f"{left} {operator} {right}"
+    if kind == "not":
+        return f"! {render(term.payload, variable)}"
+    if kind == "or":
+        return " | ".join(render(child, variable) for child in term.payload)
+    parts = []
+    for child in term.payload:
+        text = render(child, variable)
+        if child.kind == "or" or child.kind == "range" and len(child.payload) > 2:
+            text = f"( {text} )"
+        parts.append(text)
+    return " & ".join(parts)
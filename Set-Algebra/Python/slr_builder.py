@@ -0,0 +1,363 @@
+from __future__ import annotations
+from array import array
+import os
+import sys
+from lexer import TERMINALS, TERMINAL_IDS
+from parser import SLRParserTable, ERROR, SHIFT, REDUCE, ACCEPT
+
+# Usage: python slr_builder.py [grammar_file] [csv_file]
+# Rebuilds the SLR parsing table from the numbered productions, reports
+# conflicts and rewrites both the CSV and the compiled artifact. The states
+# keep the numbers of the CSV being rewritten (see renumber()), so the
+# 'Syntax Error: ... at state N' messages do not change; only the states a
+# grammar change adds or removes are numbered anew.
+
+END = "$"
+
+
+def read_productions(grammar_path: str) -> list[tuple[str, tuple[str, ...]]]:
+    """
+    Read the numbered productions ("3.\tD' -> D D'") of a grammar file.
+    :return: productions ordered by rule number, as (lhs, rhs symbols).
+    """
+    numbered = {}
+    with open(grammar_path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            number, _, rule = line.partition('.')
+            lhs, arrow, rhs = rule.partition('->')
+            if not arrow:
+                raise ValueError(f"Invalid production '{line}'")
+            numbered[int(number)] = (lhs.strip(), tuple(rhs.split()))
+    if sorted(numbered) != list(range(len(numbered))):
+        raise ValueError("Productions must be numbered 0..n-1")
+    return [numbered[number] for number in range(len(numbered))]
+
+
+class SLRTableBuilder:
+    """
+    Builds SLR(1) ACTION/GOTO tables from a grammar whose production 0 is the
+    augmented start rule. LR(0) items are encoded as integers (production base
+    offset + dot position); closures are memoized by their kernel, and states
+    are found through a kernel index so the construction stays close to linear
+    in the number of items.
+    """
+
+    def __init__(self, productions: list[tuple[str, tuple[str, ...]]], grammar_path: str = None):
+        self.productions = productions
+        self.grammar_path = grammar_path
+        self.non_terminals = list(dict.fromkeys(lhs for lhs, _ in productions))
+        lhs_set = set(self.non_terminals)
+        grammar_terminals = {s for _, rhs in productions for s in rhs if s not in lhs_set} | {END}
+        # the lexer's numbering first so Token.symbol indexes the table directly
+        self.terminals = [t for t in TERMINALS if t in grammar_terminals] + \
+                         sorted(grammar_terminals - set(TERMINAL_IDS))
+        self.symbols = list(TERMINALS) + [t for t in self.terminals if t not in TERMINAL_IDS] + self.non_terminals
+        self.symbol_ids = {symbol: index for index, symbol in enumerate(self.symbols)}
+        self.rhs = [tuple(self.symbol_ids[s] for s in rhs) for _, rhs in productions]
+        self.lhs = [self.symbol_ids[lhs] for lhs, _ in productions]
+        self.is_terminal = [index < len(self.symbols) - len(self.non_terminals) for index in range(len(self.symbols))]
+
+        # item encoding: item_base[p] + dot, dot in 0..len(rhs)
+        self.item_base, self.item_production, self.item_dot = [], [], []
+        for production, rhs in enumerate(self.rhs):
+            self.item_base.append(len(self.item_production))
+            for dot in range(len(rhs) + 1):
+                self.item_production.append(production)
+                self.item_dot.append(dot)
+
+        self.nullable, self.first = self.compute_first()
+        self.follow = self.compute_follow()
+        self.predictions = self.compute_predictions()
+        self.states, self.transitions = self.build_item_sets()
+        self.conflicts = []
+        self.ACTION, self.GOTO = self.build_tables()
+
+    @classmethod
+    def from_file(cls, grammar_path: str) -> SLRTableBuilder:
+        return cls(read_productions(grammar_path), grammar_path)
+
+    def next_symbol(self, item: int):
+        """
+        :return: the symbol after the dot, or None for a complete item.
+        """
+        rhs = self.rhs[self.item_production[item]]
+        dot = self.item_dot[item]
+        return rhs[dot] if dot < len(rhs) else None
+
+    # * FIRST / FOLLOW
+    def compute_first(self):
+        """
+        Fixpoint over the productions.
+        :return: (nullable non-terminal IDs, FIRST set per symbol ID)
+        """
+        first = [{symbol} if terminal else set() for symbol, terminal in enumerate(self.is_terminal)]
+        nullable = set()
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs in zip(self.lhs, self.rhs):
+                before = len(first[lhs])
+                for symbol in rhs:
+                    first[lhs] |= first[symbol]
+                    if symbol not in nullable:
+                        break
+                else:
+                    if lhs not in nullable:
+                        nullable.add(lhs)
+                        changed = True
+                changed |= len(first[lhs]) != before
+        return nullable, first
+
+    def first_of_sequence(self, symbols) -> tuple[set, bool]:
+        """
+        :return: (FIRST of the symbol sequence, whether the whole sequence is nullable)
+        """
+        result = set()
+        for symbol in symbols:
+            result |= self.first[symbol]
+            if symbol not in self.nullable:
+                return result, False
+        return result, True
+
+    def compute_follow(self):
+        """
+        Fixpoint over the productions, FOLLOW of the start symbol holds '$'.
+        :return: FOLLOW set per non-terminal ID
+        """
+        follow = {symbol: set() for symbol in set(self.lhs)}
+        follow[self.lhs[0]].add(self.symbol_ids[END])
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs in zip(self.lhs, self.rhs):
+                for position, symbol in enumerate(rhs):
+                    if self.is_terminal[symbol]:
+                        continue
+                    first, nullable = self.first_of_sequence(rhs[position + 1:])
+                    before = len(follow[symbol])
+                    follow[symbol] |= first
+                    if nullable:
+                        follow[symbol] |= follow[lhs]
+                    changed |= len(follow[symbol]) != before
+        return follow
+
+    # * LR(0) item sets
+    def compute_predictions(self):
+        """
+        Closure contribution of every non-terminal: the dot-0 items of all
+        non-terminals reachable through leftmost derivations. Precomputing it
+        turns each closure into a union of cached frozensets.
+        """
+        productions_of = {}
+        for production, lhs in enumerate(self.lhs):
+            productions_of.setdefault(lhs, []).append(production)
+        predictions = {}
+        for non_terminal in productions_of:
+            reached, pending = {non_terminal}, [non_terminal]
+            while pending:
+                for production in productions_of[pending.pop()]:
+                    rhs = self.rhs[production]
+                    if rhs and not self.is_terminal[rhs[0]] and rhs[0] not in reached:
+                        reached.add(rhs[0])
+                        pending.append(rhs[0])
+            predictions[non_terminal] = frozenset(
+                self.item_base[production] for reached_symbol in reached
+                for production in productions_of[reached_symbol])
+        return predictions
+
+    def closure(self, kernel: frozenset, cache: dict) -> frozenset:
+        items = cache.get(kernel)
+        if items is None:
+            items = set(kernel)
+            for item in kernel:
+                symbol = self.next_symbol(item)
+                if symbol is not None and not self.is_terminal[symbol]:
+                    items |= self.predictions[symbol]
+            items = cache[kernel] = frozenset(items)
+        return items
+
+    def build_item_sets(self):
+        """
+        Canonical LR(0) collection, numbered in discovery order from the
+        kernel {S' -> . S}.
+        :return: (closed item sets, transition dict per state {symbol: state})
+        """
+        cache = {}
+        start = frozenset([self.item_base[0]])
+        kernel_index = {start: 0}
+        states, transitions = [self.closure(start, cache)], []
+        for items in states:  # states grows while we iterate
+            moves = {}
+            for item in items:
+                symbol = self.next_symbol(item)
+                if symbol is not None:
+                    moves.setdefault(symbol, set()).add(item + 1)
+            edges = {}
+            for symbol, kernel in moves.items():
+                kernel = frozenset(kernel)
+                target = kernel_index.get(kernel)
+                if target is None:
+                    target = kernel_index[kernel] = len(states)
+                    states.append(self.closure(kernel, cache))
+                edges[symbol] = target
+            transitions.append(edges)
+        return states, transitions
+
+    def renumber(self, reference: SLRParserTable):
+        """
+        Number the states as reference, the table this one replaces, numbers
+        them, so syntax errors keep reporting the same 'at state N'. The two
+        automata are walked together from state 0 along the transitions on
+        the same symbols; for an unchanged grammar they are the same automaton
+        and every state gets its old number. States without a counterpart
+        (after a grammar change) take the numbers left over, in discovery order.
+        """
+        width = reference.n_symbols
+
+        def reference_target(state: int, symbol: int) -> int | None:
+            column = reference.symbol_ids.get(self.symbols[symbol])
+            if column is None:
+                return None
+            if self.is_terminal[symbol]:
+                code = reference.ACTION[state * width + column]
+                return code >> 2 if code & 3 == SHIFT else None
+            target = reference.GOTO[state * width + column]
+            return target if target >= 0 else None
+
+        count = len(self.states)
+        matched = {0: 0 if reference.n_states else None}
+        order = [0]
+        for state in order:  # breadth first, order grows while we iterate
+            counterpart = matched[state]
+            for symbol, target in sorted(self.transitions[state].items()):
+                if target not in matched:
+                    matched[target] = None if counterpart is None else reference_target(counterpart, symbol)
+                    order.append(target)
+        number, taken = {}, set()
+        for state in order:
+            if matched[state] is not None and matched[state] < count and matched[state] not in taken:
+                number[state] = matched[state]
+                taken.add(matched[state])
+        free = iter(sorted(set(range(count)) - taken))
+        for state in order:
+            if state not in number:
+                number[state] = next(free)
+        states, transitions = [None] * count, [None] * count
+        for state in range(count):
+            states[number[state]] = self.states[state]
+            transitions[number[state]] = {symbol: number[target] for symbol, target in self.transitions[state].items()}
+        self.states, self.transitions = states, transitions
+        self.conflicts = []
+        self.ACTION, self.GOTO = self.build_tables()
+
+    # * SLR tables
+    def build_tables(self):
+        """
+        Fill the dense ACTION/GOTO arrays, shifts win over reductions when a
+        conflict is found; every conflict is recorded in self.conflicts.
+        """
+        width = len(self.symbols)
+        ACTION = array('i', [ERROR]) * (len(self.states) * width)
+        GOTO = array('i', [-1]) * (len(self.states) * width)
+        end = self.symbol_ids[END]
+        for state, items in enumerate(self.states):
+            base = state * width
+            for symbol, target in self.transitions[state].items():
+                if self.is_terminal[symbol]:
+                    ACTION[base + symbol] = (target << 2) | SHIFT
+                else:
+                    GOTO[base + symbol] = target
+            for item in sorted(items):
+                if self.next_symbol(item) is not None:
+                    continue
+                production = self.item_production[item]
+                if production == 0:
+                    ACTION[base + end] = ACCEPT
+                    continue
+                for symbol in sorted(self.follow[self.lhs[production]]):
+                    code = (production << 2) | REDUCE
+                    existing = ACTION[base + symbol]
+                    if existing == ERROR:
+                        ACTION[base + symbol] = code
+                    elif existing != code:
+                        self.conflicts.append(
+                            f"state {state} on '{self.symbols[symbol]}': "
+                            f"{self.describe(existing)} / {self.describe(code)}")
+        return ACTION, GOTO
+
+    def describe(self, code: int) -> str:
+        kind, value = code & 3, code >> 2
+        if kind == SHIFT:
+            return f"shift {value}"
+        if kind == REDUCE:
+            lhs, rhs = self.productions[value]
+            return f"reduce {value} ({lhs} -> {' '.join(rhs)})"
+        return "accept"
+
+    # * Output
+    def to_table(self) -> SLRParserTable:
+        """
+        Hand the generated arrays to SLRParserTable, the same shape the
+        compiled artifact stores.
+        :raises ValueError: if the grammar is not SLR(1).
+        """
+        if self.conflicts:
+            raise ValueError("Grammar is not SLR(1):\n" + "\n".join(self.conflicts))
+        table = SLRParserTable.__new__(SLRParserTable)
+        table.file_path, table.grammar_path = None, self.grammar_path
+        table.terminals = list(self.terminals)
+        table.non_terminals = list(self.non_terminals)
+        table.symbols = list(self.symbols)
+        table.symbol_ids = dict(self.symbol_ids)
+        table.n_symbols = len(self.symbols)
+        table.n_states = len(self.states)
+        table.ACTION, table.GOTO = self.ACTION, self.GOTO
+        table.grammar = {number: {'non-terminal': lhs, 'productions': ' '.join(rhs), 'length': len(rhs),
+                                  'symbol': self.symbol_ids[lhs]}
+                         for number, (lhs, rhs) in enumerate(self.productions)}
+        table.index_reductions()
+        return table
+
+    def write_csv(self, csv_path: str):
+        """
+        Write the table in the layout of 'SLR Parsing Table.csv'.
+        """
+        width = len(self.symbols)
+        columns = [self.symbol_ids[t] for t in self.terminals] + [self.symbol_ids[n] for n in self.non_terminals]
+        lines = [",".join(["state", "action"] + [""] * (len(self.terminals) - 1) +
+                          ["goto"] + [""] * (len(self.non_terminals) - 1)),
+                 ",".join([""] + self.terminals + self.non_terminals)]
+        for state in range(len(self.states)):
+            cells = [str(state)]
+            for symbol in columns:
+                if self.is_terminal[symbol]:
+                    code = self.ACTION[state * width + symbol]
+                    kind = code & 3
+                    cells.append("" if kind == ERROR else "acc" if kind == ACCEPT else
+                                 ("s" if kind == SHIFT else "r") + str(code >> 2))
+                else:
+                    target = self.GOTO[state * width + symbol]
+                    cells.append(str(target) if target >= 0 else "")
+            lines.append(",".join(cells))
+        with open(csv_path, 'w', newline='') as file:
+            file.write("\r\n".join(lines) + "\r\n")
+
+
+if __name__ == '__main__':
+    grammar_path = sys.argv[1] if len(sys.argv) > 1 else 'SLR Grammar.txt'
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else 'SLR Parsing Table.csv'
+    builder = SLRTableBuilder.from_file(grammar_path)
+    if os.path.exists(csv_path):
+        builder.renumber(SLRParserTable(csv_path))
+    print(f"{len(builder.productions)} productions, {len(builder.states)} states")
+    if builder.conflicts:
+        print("Conflicts:")
+        for conflict in builder.conflicts:
+            print(f"  {conflict}")
+        sys.exit(1)
+    builder.write_csv(csv_path)
+    SLRParserTable.load(csv_path, grammar_path)
+    print(f"Wrote {csv_path}")
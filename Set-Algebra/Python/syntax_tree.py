@@ -0,0 +1,262 @@
+from __future__ import annotations
+from array import array
+import json
+from expression import Rope
+from lexer import TERMINALS
+
+# Attributes a tree view adds to every node, after "name" / "token" and "lexeme"
+VIEW_ATTRIBUTES = {"parse": None, "typing": "type", "evaluation": "value"}
+
+class SyntaxTree:
+    """
+    Arena for the concrete syntax tree built by Parser.build_tree(). Node i is
+    row i of parallel arrays instead of a dictionary: grammar symbol ID, first
+    child, next sibling, token index (-1 for non-terminals), type code and
+    value slot. Typing and evaluation annotate the same rows in place; the
+    parse / typing / evaluation trees of the JSON outputs are views of it,
+    produced only by write_json() or as_dict().
+    """
+    __slots__ = ("symbol_names", "symbols", "first_child", "next_sibling", "tokens", "types", "values",
+                 "lexemes", "type_names", "type_codes", "root", "typed", "evaluated")
+
+    def __init__(self, symbol_names: list[str]):
+        """
+        :param symbol_names: grammar symbol names by ID, SLRParserTable.symbols.
+        """
+        self.symbol_names = symbol_names
+        self.symbols = array('H')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.tokens = array('i')
+        self.types = array('B')
+        self.values = []
+        self.lexemes = []  # by token index
+        self.type_names = []
+        self.type_codes = {}
+        self.root = -1  # stays -1 after a syntax error
+        self.typed = self.evaluated = False  # whether the phase ran to completion
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def type_code(self, type_name: str) -> int:
+        code = self.type_codes.get(type_name)
+        if code is None:
+            code = self.type_codes[type_name] = len(self.type_names)
+            self.type_names.append(type_name)
+        return code
+
+    def add_leaf(self, symbol: int, lexeme: str, type_code: int, value) -> int:
+        node = len(self.symbols)
+        self.symbols.append(symbol)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        self.tokens.append(len(self.lexemes))
+        self.lexemes.append(lexeme)
+        self.types.append(type_code)
+        self.values.append(value)
+        return node
+
+    def add_node(self, symbol: int, children: list[int]) -> int:
+        """
+        Add a non-terminal over already added children; its type and value
+        are filled in by the typing and evaluation rules.
+        """
+        node = len(self.symbols)
+        self.symbols.append(symbol)
+        self.first_child.append(children[0] if children else -1)
+        self.next_sibling.append(-1)
+        self.tokens.append(-1)
+        self.types.append(0)
+        self.values.append(None)
+        next_sibling = self.next_sibling
+        for left, right in zip(children, children[1:]):
+            next_sibling[left] = right
+        return node
+
+    def children(self, node: int) -> list[int]:
+        children, child = [], self.first_child[node]
+        while child != -1:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def lexeme(self, node: int) -> str:
+        return self.lexemes[self.tokens[node]]
+
+    def retoken(self, lexeme: str, old_symbol: int, new_symbol: int):
+        """
+        Change the terminal of every leaf spelled lexeme from old_symbol to new_symbol.
+        """
+        symbols, tokens, lexemes = self.symbols, self.tokens, self.lexemes
+        for node in range(len(symbols)):
+            if symbols[node] == old_symbol and tokens[node] >= 0 and lexemes[tokens[node]] == lexeme:
+                symbols[node] = new_symbol
+
+    def _complete(self, view: str) -> bool:
+        return self.root >= 0 and (view == "parse" or view == "typing" and self.typed or
+                                   view == "evaluation" and self.evaluated)
+
+    def _empty(self, view: str):
+        # what the output of a failed phase holds
+        return None if view == "parse" else []
+
+    def as_dict(self, view: str, node: int = None):
+        """
+        Build one view as nested dictionaries, the shape of its JSON output.
+        Iterative, so deep trees don't hit the recursion limit.
+        :param view: "parse", "typing" or "evaluation".
+        :param node: the subtree to build, even before the phase completed;
+                     by default the whole tree, once it has.
+        """
+        if node is None:
+            if not self._complete(view):
+                return self._empty(view)
+            node = self.root
+        attribute = VIEW_ATTRIBUTES[view]
+        first_child, next_sibling, tokens = self.first_child, self.next_sibling, self.tokens
+
+        def make(node):
+            if tokens[node] >= 0:
+                entry = {"token": TERMINALS[self.symbols[node]], "lexeme": self.lexemes[tokens[node]]}
+            else:
+                entry = {"name": self.symbol_names[self.symbols[node]]}
+            if attribute == "type":
+                entry["type"] = self.type_names[self.types[node]]
+            elif attribute == "value":
+                value = self.values[node]
+                entry["value"] = str(value) if isinstance(value, Rope) or value.__class__ is int else value
+            if tokens[node] < 0:
+                entry["children"] = []
+            return entry
+
+        root = make(node)
+        pending = [(node, root)] if tokens[node] < 0 else []
+        while pending:
+            node, entry = pending.pop()
+            child = first_child[node]
+            while child != -1:
+                child_entry = make(child)
+                entry["children"].append(child_entry)
+                if tokens[child] < 0:
+                    pending.append((child, child_entry))
+                child = next_sibling[child]
+        return root
+
+    def write_json(self, file, view: str):
+        """
+        Write one view in the layout of json.dump(view, file, ensure_ascii=False,
+        indent=0), byte for byte, straight from the arrays: no dictionaries and
+        no recursion, and Rope values streamed piece by piece.
+        :param view: "parse", "typing" or "evaluation".
+        """
+        if not self._complete(view):
+            json.dump(self._empty(view), file)
+            return
+        attribute = VIEW_ATTRIBUTES[view]
+        encode = json.encoder.encode_basestring  # the ensure_ascii=False string encoder
+        quoted_tokens = [encode(terminal) for terminal in TERMINALS]
+        quoted_names = [encode(name) for name in self.symbol_names]
+        quoted_types = [encode(name) for name in self.type_names]
+        symbols, first_child, next_sibling, tokens = self.symbols, self.first_child, self.next_sibling, self.tokens
+        types, values, lexemes = self.types, self.values, self.lexemes
+        # a value and its children's often are one Rope (P -> P' -> P''): its last escaped text, if short
+        last_rope, last_escaped = Rope(()), None
+        rope_size = 0  # characters of Rope text in out, flushed past 1 MB
+
+        out = []
+        pending = [self.root]
+        while pending:
+            node = pending.pop()
+            if node.__class__ is str:  # a separator or closing brackets
+                out.append(node)
+                continue
+            token = tokens[node]
+            if token >= 0:
+                out.append(f'{{\n"token": {quoted_tokens[symbols[node]]},\n"lexeme": {encode(lexemes[token])}')
+            else:
+                out.append(f'{{\n"name": {quoted_names[symbols[node]]}')
+            if attribute == "type":
+                out.append(f',\n"type": {quoted_types[types[node]]}')
+            elif attribute == "value":
+                value = values[node]
+                if value is last_rope:
+                    out.append(last_escaped)
+                    rope_size += len(last_escaped)
+                elif isinstance(value, Rope):
+                    # stream the text in escaped chunks instead of building it
+                    out.append(',\n"value": "')
+                    start = len(out)
+                    for chunk in value.chunks():
+                        out.append(encode(chunk)[1:-1])
+                        rope_size += len(chunk)
+                        if rope_size > 1 << 20:
+                            file.write("".join(out))
+                            out.clear()
+                            rope_size, start = 0, -1
+                    out.append('"')
+                    if start >= 0:  # still in the buffer, so short
+                        last_rope, last_escaped = value, ',\n"value": "' + "".join(out[start:])
+                elif value.__class__ is int:  # written as its text, like every value
+                    out.append(f',\n"value": "{value}"')
+                else:
+                    out.append(f',\n"value": {encode(value) if isinstance(value, str) else json.dumps(value)}')
+            if token >= 0:
+                out.append("\n}")
+                continue
+            children = self.children(node)
+            if not children:
+                out.append(',\n"children": []\n}')
+                continue
+            out.append(',\n"children": [\n')
+            pending.append("\n]\n}")
+            for child in reversed(children[1:]):
+                pending.append(child)
+                pending.append(",\n")
+            pending.append(children[0])
+            if len(out) > 8192 or rope_size > 1 << 20:
+                file.write("".join(out))
+                out.clear()
+                rope_size = 0
+        file.write("".join(out))
+
+
+class NodeView:
+    """
+    What a typing / evaluation rule sees of an arena node: node["type"],
+    node["value"], node["lexeme"], node["bool"], node["name"] and
+    node["children"], like the child dictionaries of the JSON views. The 'bool' attribute is only needed by the
+    parent's rule, so it lives here rather than in the arena.
+    """
+    __slots__ = ("tree", "node", "bool")
+
+    def __init__(self, tree: SyntaxTree, node: int, bool=None):
+        self.tree = tree
+        self.node = node
+        self.bool = bool
+
+    def __getitem__(self, key: str):
+        tree, node = self.tree, self.node
+        if key == "type":
+            return tree.type_names[tree.types[node]]
+        if key == "value":
+            return tree.values[node]
+        if key == "lexeme" and tree.tokens[node] >= 0:
+            return tree.lexemes[tree.tokens[node]]
+        if key == "bool":
+            return self.bool
+        if tree.tokens[node] < 0:
+            if key == "name":
+                return tree.symbol_names[tree.symbols[node]]
+            if key == "children":
+                return [NodeView(tree, child) for child in tree.children(node)]
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self) -> str:
+        return f"NodeView({self.tree.symbol_names[self.tree.symbols[self.node]]!r}, {self.node})"
@@ -0,0 +1,119 @@
+from __future__ import annotations
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import pytest
+from batch import JsonlOutput, compile_source, json_record, run_batch
+from cache import CompileCache
+from conftest import GRAMMAR_PATH, TABLE_PATH
+from incremental import IncrementalProgram
+
+# One program per outcome: ok, and a failure in the lexer, the parser and evaluation
+PROGRAMS = {
+    "ok": "let int x be 3 .\nlet set s be { a : a > x & a < 9 } .\nshow 4 @ s U { b : b = 1 } .\n",
+    "simplify": "let set s be { a : a > 3 & a < 7 } .\nsimplify s U { a : a > 5 & a < 10 } .\n",
+    "lexical": "let int x be 3 $ .\nshow x .\n",
+    "syntax": "let int x be 3 .\nshow x + .\n",
+    "evaluation": "let int x be 3 .\nshow x + true .\n",
+}
+
+
+def test_cache_hit_equals_compile(table, tmp_path):
+    paths = (TABLE_PATH, GRAMMAR_PATH)
+    cache = CompileCache(str(tmp_path), paths)
+    for source in PROGRAMS.values():
+        source = source.encode()
+        expected = compile_source(source, table)
+        miss = compile_source(source, table, cache=cache)
+        hit = compile_source(source, table, cache=cache)
+        disk = compile_source(source, table, cache=CompileCache(str(tmp_path), paths))
+        assert (miss.pop("cache"), hit.pop("cache"), disk.pop("cache")) == ("miss", "memory", "disk")
+        assert miss == hit == disk == expected
+
+
+def test_cache_key_options(table):
+    cache = CompileCache(None, (TABLE_PATH, GRAMMAR_PATH))
+    source = PROGRAMS["ok"].encode()
+    keys = {cache.key(source), cache.key(source + b" "), cache.key(source, "0:10"), cache.key(source, "0:10", 3),
+            cache.key(source, lazy=True)}
+    assert len(keys) == 5
+    assert compile_source(source, table, universe="0:10", cache=cache)["stdout"] != \
+        compile_source(source, table, cache=cache)["stdout"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_equals_compile(table, tmp_path, workers):
+    for name, source in PROGRAMS.items():
+        (tmp_path / "programs").mkdir(exist_ok=True)
+        (tmp_path / "programs" / f"{name}.sa").write_text(source)
+    output = tmp_path / "batch.jsonl"
+    statuses = run_batch(str(tmp_path / "programs"), table, JsonlOutput(str(output)), workers=workers,
+                         table_paths=(TABLE_PATH, GRAMMAR_PATH))
+    names = sorted(PROGRAMS)
+    expected = [json_record({"name": f"{name}.sa"}, compile_source(PROGRAMS[name].encode(), table)) for name in names]
+    assert output.read_text().splitlines() == expected
+    assert sum(statuses.values()) == len(PROGRAMS)
+    assert [json.loads(line)["status"] for line in expected] == \
+        ["evaluation", "lexical", "ok", "ok", "syntax"]
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="the server listens on a Unix socket")
+def test_server_equals_compile(table, tmp_path):
+    from client import CompileClient, PHASE_OUTPUTS, compile_locally
+    socket_path = str(tmp_path / "server.sock")
+    server = subprocess.Popen([sys.executable, "server.py", "--socket", socket_path], stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while not os.path.exists(socket_path):
+            assert server.poll() is None and time.monotonic() < deadline, "server.py did not start"
+            time.sleep(0.01)
+        client = CompileClient(socket_path)
+        try:
+            sources = [source.encode() for source in PROGRAMS.values()]
+            for source in sources:  # pipelined, answered in order
+                client.send(source)
+            for source in sources:
+                response = client.receive()
+                response.pop("id")
+                response.pop("cache", None)
+                assert response == compile_locally(source)
+            assert set(client.compile(sources[0], ("lexer",))) >= {"status", "stdout", "lexer"}
+            assert not set(client.compile(sources[0], ("lexer",))) & (set(PHASE_OUTPUTS) - {"lexer"})
+        finally:
+            client.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def random_edit(rng: random.Random, text: str) -> tuple[int, int, str]:
+    offset = rng.randrange(len(text) + 1)
+    deleted = rng.choice((0, 0, 1, 1, 2, 5, 12))
+    deleted = min(deleted, len(text) - offset)
+    inserted = rng.choice(("", "", " ", ".", "x", "1", " . ", "let int q be 2 .", " show x .", "{", "}", "@ s", "$"))
+    return offset, deleted, inserted
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_incremental_equals_full_compile(table, seed):
+    rng = random.Random(seed)
+    source = ("let int x be 3 .\nlet set s be { a : a > x & a < 9 } .\nlet int y be x * 2 .\n"
+              "let set t be s I { c : c < 6 } .\nshow 4 @ t U { b : b = y } .\n")
+    program = IncrementalProgram(source, table)
+    assert program.result() == compile_source(source.encode(), table)
+    statuses = set()
+    for _ in range(40):
+        offset, deleted, inserted = random_edit(rng, program.text)
+        edits = [(offset, deleted, inserted)]
+        if rng.random() < 0.5:  # and undo it
+            edits.append((offset, len(inserted), program.text[offset:offset + deleted]))
+        for edit in edits:
+            program.edit(*edit)
+            result = program.result()
+            assert result == compile_source(program.text.encode(), table), program.text
+            statuses.add(result["status"])
+    assert len(statuses) > 1  # the edits broke the program and mended it
@@ -0,0 +1,92 @@
+from __future__ import annotations
+import io
+from contextlib import redirect_stdout
+import pytest
+from bitmap import materialize
+from bytecode import compile_tree
+from lexer import Lexer
+from parser import Parser
+
+
+def build(source: str, table, jobs: int = 1, lazy: bool = False) -> tuple[Parser, object, str]:
+    """
+    :return: the parser, the tree build_tree() made of source and what it printed.
+    """
+    printed = io.StringIO()
+    with redirect_stdout(printed):
+        tokens, _ = Lexer(source).tokenize()
+        parser = Parser(tokens, table)
+        tree = parser.build_tree(jobs, lazy)
+    return parser, tree, printed.getvalue()
+
+
+def declarations(n: int) -> str:
+    """
+    A chain of n declarations alternating integer arithmetic and set literals,
+    the last ones used by 'show'.
+    """
+    lines = []
+    for i in range(n):
+        if i % 2 == 0:
+            lines.append(f"let int v{chr(97 + i % 26)}{chr(97 + i // 26)} be ( {i} + {i % 7} ) * 3 - 1 .")
+        else:
+            lines.append(f"let set v{chr(97 + i % 26)}{chr(97 + i // 26)} be {{ a : a > {i} & a < {i + 10} | a = 3 }} .")
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("element, expected", [(5, "false"), (6, "true"), (4, "false")])
+def test_intersection_excludes_bounds(table, element, expected):
+    _, tree, _ = build(f"show {element} @ {{ x : x > 3 }} I {{ x : x > 5 }} .", table)
+    assert str(tree.values[tree.root]) == expected
+
+
+def test_deep_literal_membership(table):
+    depth = 3000
+    terms = " | ".join(f"a = {i}" for i in range(depth))
+    _, tree, _ = build(f"show {depth - 1} @ {{ a : {terms} }} .", table)
+    assert str(tree.values[tree.root]) == "true"
+
+
+def test_bytecode_matches_tree(table):
+    source = declarations(40) + "\nshow vaa @ vba ."
+    parser, tree, _ = build(source, table)
+    assert str(compile_tree(tree, parser, prune=False).run()) == str(tree.values[tree.root])
+    relations = " | ".join(f"( {i} + 3 ) * 2 - {i % 5} {'<>='[i % 3]} {2 * i}" for i in range(200))
+    parser, tree, _ = build(f"show {relations} .", table)
+    assert str(compile_tree(tree, parser, prune=False).run()) == str(tree.values[tree.root])
+
+
+def test_pruned_bytecode_matches_eager(table):
+    source = declarations(40) + "\nshow 7 @ vba U vda ."
+    parser, tree, _ = build(source, table)
+    eager, lazy = compile_tree(tree, parser, prune=False), compile_tree(tree, parser)
+    assert str(eager.run()) == str(lazy.run()) == str(tree.values[tree.root])
+    assert lazy.stats["declarations"] == 40
+    assert lazy.stats["evaluated"] == 2
+    assert len(lazy.stats["pruned"]) == 38
+
+
+def test_lazy_build_tree(table):
+    source = "let int x be 3 .\nlet int y be 4 .\nlet int z be x + 1 .\nshow z ."
+    _, eager, _ = build(source, table)
+    _, lazy, printed = build(source, table, lazy=True)
+    assert str(lazy.values[lazy.root]) == str(eager.values[eager.root]) == "4"
+    assert printed.endswith("Final Value: 4\nDeclarations: 3, evaluated 2, pruned 1: y\n")
+
+
+def test_parallel_matches_sequential(table):
+    source = declarations(30) + "\nshow 12 @ vba ."
+    _, sequential, _ = build(source, table)
+    _, parallel, _ = build(source, table, jobs=2)
+    assert str(parallel.values[parallel.root]) == str(sequential.values[sequential.root])
+
+
+def test_materialize_matches_intervals(table):
+    universe, step = 1 << 12, 1 << 6
+    s = " | ".join(f"x > {i * step} & x < {i * step + step // 3}" for i in range(64))
+    t = " | ".join(f"x > {i * step + step // 5} & x < {(i + 1) * step}" for i in range(64))
+    _, tree, _ = build(f"let set s be {{ x : {s} }} .\nlet set t be {{ x : {t} }} .\nshow s I t U {{ x : x = 7 }} .",
+                       table)
+    value = tree.values[tree.root]
+    members = materialize(value, 0, universe)
+    assert [x in members for x in range(universe)] == [x in value.intervals for x in range(universe)]
@@ -0,0 +1,44 @@
+from __future__ import annotations
+import io
+from contextlib import redirect_stdout
+import pytest
+from lexer import FileLexer, Lexer
+
+SOURCE = ("let int count be ( 12 + 7 ) * 30 - 1 .\n"
+          "let set evens be { a : a > 10 & a < 2000 | ! ( a = 3 ) } .\n"
+          "\tshow 12 @ evens U { b : b > count } I evens .")
+
+
+def scan(lexer) -> tuple[list[tuple[str, str]], str]:
+    printed = io.StringIO()
+    with redirect_stdout(printed):
+        tokens, _ = lexer.tokenize()
+    return [(token.token_type, token.lexeme) for token in tokens], printed.getvalue()
+
+
+def test_regex_matches_per_character():
+    tokens, _ = scan(Lexer(SOURCE))
+    with redirect_stdout(io.StringIO()):
+        by_char = Lexer(SOURCE)._scan_by_char()
+    assert tokens == [(token.token_type, token.lexeme) for token in by_char]
+
+
+def test_columns_match_tokens():
+    tokens, _ = scan(Lexer(SOURCE))
+    with redirect_stdout(io.StringIO()):
+        stream, _ = Lexer(SOURCE).tokenize_columns()
+    assert [(stream.token_type(i), stream.lexeme(i)) for i in range(len(stream))] == tokens
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 16, 64, 1 << 20])
+def test_chunk_boundaries(chunk_size):
+    # every token and every run of blanks is cut by some chunk size; '\r' only reaches the byte lexer
+    expected = scan(Lexer(SOURCE))
+    assert scan(FileLexer(io.BytesIO(SOURCE.encode()), chunk_size)) == expected
+    assert scan(FileLexer(io.BytesIO(SOURCE.replace("\n", "\r\n").encode()), chunk_size)) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 1 << 20])
+@pytest.mark.parametrize("source", ["let int x be 3 $ .", "show 1 @ { a : a > 1 } é .", "show 12"])
+def test_chunk_boundaries_on_errors(chunk_size, source):
+    assert scan(FileLexer(io.BytesIO(source.encode()), chunk_size)) == scan(Lexer(source))
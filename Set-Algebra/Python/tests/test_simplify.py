@@ -0,0 +1,48 @@
+from __future__ import annotations
+import pytest
+from batch import compile_source
+
+
+def final_value(source: str, table) -> str:
+    stdout = compile_source(source.encode(), table, names=())["stdout"]
+    return stdout.splitlines()[-1].removeprefix("Final Value: ")
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("simplify { a : a > 3 & a > 5 | a = 9 } .", "{ a : a > 5 }"),
+    ("simplify { a : a < 1 & ! a < 1 } .", "{ a : false }"),
+    ("simplify { a : a < 1 | ! a < 1 } .", "{ a : true }"),
+    ("simplify { a : a > 3 & a < 7 } U { a : a > 5 & a < 10 } .", "{ a : a > 3 & a < 10 }"),
+    ("simplify { a : ! a > 3 | a > 6 } .", "{ a : a < 4 | a > 6 }"),
+])
+def test_canonical_form(table, source, expected):
+    assert final_value(source, table) == expected
+
+
+def test_same_set_same_text(table):
+    left = final_value("simplify { a : ( a > 2 & a < 9 ) | a = 5 | a > 20 } .", table)
+    right = final_value("simplify { a : a > 20 | ( a < 9 & ! a < 3 ) } .", table)
+    assert left == right
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("simplify { a : ( a > q | a < 0 ) & ( a > q | a < 1 ) } .", "{ a : a < 0 | a > q }"),
+    ("simplify { a : ( a > q & a < 0 ) | ( a > q & a < 1 ) } .", "{ a : a < 1 & a > q }"),
+    ("simplify { a : ( a > q | a < 0 ) & ( a > q | b = 1 | a < 5 ) } .", "{ a : a < 0 | a > q }"),
+    ("simplify { a : ( a > q | b = 1 ) & ( a > q | b = 1 | c = 2 ) & ( b = 1 | c = 2 ) } .",
+     "{ a : ( a > q | b = 1 ) & ( b = 1 | c = 2 ) }"),
+    ("simplify { a : ( a > q | a < 9 ) & ( a > q | b = 1 | a < 5 ) } .", "{ a : ( a < 5 | a > q | b = 1 ) & ( a < 9 | a > q ) }"),
+])
+def test_shared_children_factored(table, source, expected):
+    assert final_value(source, table) == expected
+
+
+def test_many_clauses_factored(table):
+    clauses = " & ".join(f"( a > q | a < {i} )" for i in range(3000))
+    assert final_value(f"simplify {{ a : {clauses} }} .", table) == "{ a : a < 0 | a > q }"
+
+
+def test_clauses_ordered_by_bounds(table):
+    clauses = " & ".join(f"( a > v{chr(97 + i)} | a < {10 ** i} )" for i in range(4))
+    assert final_value(f"simplify {{ a : {clauses} }} .", table) == \
+        "{ a : ( a < 1 | a > va ) & ( a < 10 | a > vb ) & ( a < 100 | a > vc ) & ( a < 1000 | a > vd ) }"